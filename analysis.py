@@ -0,0 +1,127 @@
+import queue
+import threading
+from collections import OrderedDict
+
+from rules import Game, GameStatus
+
+# Анализ позиции в фоновом потоке: допустимые ходы и состояние игры вычисляются
+# сразу после хода и кладутся в общий кэш, интерфейс только читает готовый результат
+
+
+class PositionAnalysis:
+    """Результат анализа позиции: допустимые ходы по клеткам и состояние игры"""
+
+    __slots__ = ('key', 'moves', 'moves_by_square', 'status')
+
+    def __init__(self, key: int, moves: list, status: GameStatus) -> None:
+        """
+        Инициализация результата
+
+        Args:
+            key: ключ Зобриста позиции
+            moves: допустимые ходы ((x1, y1), (x2, y2))
+            status: состояние игры
+        """
+        self.key = key
+        self.moves = moves
+        self.moves_by_square = {}
+        for start, end in moves:
+            self.moves_by_square.setdefault(start, []).append(end)
+        self.status = status
+
+
+def analyze(game: Game) -> PositionAnalysis:
+    """
+    Вычислить допустимые ходы и состояние игры
+
+    Args:
+        game: партия (меняются только ее кэши, поэтому лучше передавать копию)
+
+    Returns:
+        PositionAnalysis: результат анализа
+    """
+    game.update_status()
+    return PositionAnalysis(game.hash, game.generate_legal_moves(), game.status)
+
+
+class AnalysisCache:
+    """Потокобезопасный кэш результатов анализа по ключу позиции с вытеснением давно не использованных"""
+
+    def __init__(self, capacity: int = 4096) -> None:
+        """
+        Инициализация кэша
+
+        Args:
+            capacity: максимальное количество позиций
+        """
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: int) -> PositionAnalysis:
+        """Получить результат анализа или None"""
+        with self.lock:
+            result = self.entries.get(key)
+            if result is not None:
+                self.entries.move_to_end(key)
+            return result
+
+    def put(self, result: PositionAnalysis) -> None:
+        """Сохранить результат анализа"""
+        with self.lock:
+            self.entries[result.key] = result
+            self.entries.move_to_end(result.key)
+            if len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    def __contains__(self, key: int) -> bool:
+        with self.lock:
+            return key in self.entries
+
+
+class AnalysisService:
+    """Фоновый поток, который анализирует позиции по мере того, как они появляются на доске"""
+
+    def __init__(self, on_ready=None, capacity: int = 4096) -> None:
+        """
+        Запустить поток анализа
+
+        Args:
+            on_ready: функция on_ready(key), вызывается из потока анализа, когда результат готов
+            capacity: размер кэша результатов
+        """
+        self.cache = AnalysisCache(capacity)
+        self.on_ready = on_ready
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def get(self, key: int) -> PositionAnalysis:
+        """Получить готовый результат анализа или None"""
+        return self.cache.get(key)
+
+    def submit(self, game: Game) -> None:
+        """
+        Поставить позицию в очередь на анализ
+
+        Args:
+            game: партия (в поток передается ее копия)
+        """
+        if game.hash not in self.cache:
+            self.requests.put(game.copy())
+
+    def run(self) -> None:
+        """Тело потока анализа"""
+        while True:
+            game = self.requests.get()
+            if game is None:
+                break
+            if game.hash in self.cache:
+                continue
+            self.cache.put(analyze(game))
+            if self.on_ready is not None:
+                self.on_ready(game.hash)
+
+    def close(self) -> None:
+        """Остановить поток анализа"""
+        self.requests.put(None)
@@ -0,0 +1,280 @@
+import argparse
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+from notation import game_result
+from rules import Game
+from wire import (decode_move, decode_moves, encode_moves, encode_position, move_size, position_size,
+                  random_games, unpack_position)
+
+# Архив сыгранных партий: файл данных только дописывается, рядом лежит индекс
+# из записей фиксированной длины, поэтому партия K и ход P партии K находятся без чтения файла.
+#
+# Файл данных (path):  для каждой партии - байт результата, счетчики начальной позиции
+#                      (полуходы без взятий и ходов пешкой, номер хода - по 2 байта),
+#                      начальная позиция (wire.py) и ходы по 2 байта
+# Формат позиции в wire.py не хранит счетчики, поэтому они записываются отдельно:
+# без них партия, начатая из FEN, считала бы правило 50 ходов и номер хода заново
+# Файл индекса (path.idx): для каждой партии - смещение в файле данных (8 байт)
+#                      и количество полуходов (4 байта)
+
+index_struct = struct.Struct('<QI')
+header_struct = struct.Struct('<BHH')
+header_size = header_struct.size + position_size
+
+result_codes = {'*': 0, '1-0': 1, '0-1': 2, '1/2-1/2': 3}
+code_results = {code: result for result, code in result_codes.items()}
+
+
+def index_path(path: str) -> str:
+    """Путь к файлу индекса архива"""
+    return path + '.idx'
+
+
+class ArchiveWriter:
+    """Дописывание партий в архив"""
+
+    def __init__(self, path: str) -> None:
+        """
+        Открыть архив для дописывания (файлы создаются, если их нет)
+
+        Args:
+            path: путь к файлу данных
+        """
+        self.data = open(path, 'ab')
+        self.index = open(index_path(path), 'ab')
+
+    def append_moves(self, start: Game, moves: list, result: str = '*') -> None:
+        """
+        Дописать партию
+
+        Args:
+            start: начальная позиция
+            moves: упакованные ходы
+            result: результат ('1-0', '0-1', '1/2-1/2', '*')
+        """
+        offset = self.data.tell()
+        self.data.write(header_struct.pack(result_codes[result], start.halfmove_clock, start.fullmove_number))
+        self.data.write(encode_position(start))
+        self.data.write(encode_moves(moves))
+        # Индекс пишется после данных: оборванная запись данных не попадет в индекс
+        self.data.flush()
+        self.index.write(index_struct.pack(offset, len(moves)))
+
+    def append(self, game: Game) -> None:
+        """Дописать партию по ее истории ходов"""
+        self.append_moves(Game.from_fen(game.initial_fen), game.move_history(), game_result(game))
+
+    def close(self) -> None:
+        """Закрыть файлы архива"""
+        self.data.close()
+        self.index.close()
+
+    def __enter__(self) -> 'ArchiveWriter':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def map_file(path: str):
+    """Отобразить файл в память только для чтения (None для пустого файла)"""
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class ArchiveReader:
+    """Чтение архива через отображение файлов в память: в ОЗУ попадают только нужные страницы"""
+
+    def __init__(self, path: str) -> None:
+        """
+        Открыть архив
+
+        Args:
+            path: путь к файлу данных
+        """
+        self.data = map_file(path)
+        self.index = map_file(index_path(path))
+        self.count = len(self.index) // index_struct.size if self.index is not None else 0
+
+    def close(self) -> None:
+        """Закрыть отображения файлов"""
+        for mapping in (self.data, self.index):
+            if mapping is not None:
+                mapping.close()
+
+    def __enter__(self) -> 'ArchiveReader':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def locate(self, number: int) -> tuple:
+        """
+        Найти партию по индексу
+
+        Returns:
+            tuple: (смещение партии в файле данных, количество полуходов)
+        """
+        if not 0 <= number < self.count:
+            raise IndexError(number)
+        return index_struct.unpack_from(self.index, number * index_struct.size)
+
+    def ply_count(self, number: int) -> int:
+        """Количество полуходов в партии"""
+        return self.locate(number)[1]
+
+    def result(self, number: int) -> str:
+        """Результат партии"""
+        offset, plies = self.locate(number)
+        return code_results[header_struct.unpack_from(self.data, offset)[0]]
+
+    def start_position(self, number: int) -> Game:
+        """Начальная позиция партии (со счетчиками полуходов и номером хода)"""
+        offset, plies = self.locate(number)
+        result, halfmove_clock, fullmove_number = header_struct.unpack_from(self.data, offset)
+        game = Game.__new__(Game)
+        game.set_position(*unpack_position(self.data, offset + header_struct.size), halfmove_clock, fullmove_number)
+        return game
+
+    def moves(self, number: int) -> list:
+        """
+        Ходы партии (читаются только страницы этой партии)
+
+        Returns:
+            list: упакованные ходы
+        """
+        offset, plies = self.locate(number)
+        start = offset + header_size
+        return decode_moves(self.data[start:start + plies * move_size])
+
+    def move(self, number: int, ply: int) -> int:
+        """Ход с номером ply (с нуля) в партии number"""
+        offset, plies = self.locate(number)
+        if not 0 <= ply < plies:
+            raise IndexError(ply)
+        return decode_move(self.data, offset + header_size + ply * move_size)
+
+    def iter_positions(self, number: int):
+        """
+        Воспроизводить партию по ходам, не храня позиции
+
+        Возвращается одна и та же партия, которая меняется после каждого хода:
+        сначала начальная позиция, затем позиция после каждого полухода
+
+        Yields:
+            Game: позиция
+        """
+        game = self.start_position(number)
+        yield game
+        for move in self.moves(number):
+            game.make_packed_move(move)
+            yield game
+
+    def position(self, number: int, ply: int) -> Game:
+        """
+        Позиция после ply полуходов партии number
+
+        Returns:
+            Game: позиция (воспроизводится с начала партии)
+        """
+        if not 0 <= ply <= self.ply_count(number):
+            raise IndexError(ply)
+        offset, plies = self.locate(number)
+        start = offset + header_size
+        game = self.start_position(number)
+        # Промежуточные позиции не нужны: ходы делаются без пересчета статуса и видимости
+        for move in decode_moves(self.data[start:start + ply * move_size]):
+            game.push(move)
+        game.update_visibility()
+        game.update_status()
+        return game
+
+    def __iter__(self):
+        """Перебор партий: (начальная позиция, ходы, результат)"""
+        for number in range(self.count):
+            yield self.start_position(number), self.moves(number), self.result(number)
+
+
+def self_test(games: int = 40, plies: int = 60, seed: int = 0) -> list:
+    """
+    Записать случайные партии (в том числе из FEN со счетчиками ходов) во временный архив
+    и проверить, что начальные позиции, ходы, результаты и позиции после каждого хода читаются обратно
+
+    Returns:
+        list: описания ошибок (пустой, если ошибок нет)
+    """
+    played = list(random_games(games, plies, seed))
+    errors = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'check.arc')
+        with ArchiveWriter(path) as writer:
+            for game in played:
+                writer.append(game)
+        with ArchiveReader(path) as reader:
+            if len(reader) != len(played):
+                errors.append(f"партий в архиве {len(reader)} вместо {len(played)}")
+            for number, game in enumerate(played[:len(reader)]):
+                moves = game.move_history()
+                # FEN полностью, со счетчиками полуходов и номером хода
+                if reader.start_position(number).to_fen() != Game.from_fen(game.initial_fen).to_fen():
+                    errors.append(f"партия {number}: начальная позиция {reader.start_position(number).to_fen()}")
+                if reader.moves(number) != moves or reader.result(number) != game_result(game):
+                    errors.append(f"партия {number}: ходы или результат не совпадают")
+                replay = Game.from_fen(game.initial_fen)
+                for ply, position in enumerate(reader.iter_positions(number)):
+                    if ply:
+                        replay.make_packed_move(moves[ply - 1])
+                    if position.to_fen() != replay.to_fen():
+                        errors.append(f"партия {number}, полуход {ply}: {position.to_fen()}")
+                if reader.position(number, len(moves)).to_fen() != game.to_fen():
+                    errors.append(f"партия {number}: конечная позиция {reader.position(number, len(moves)).to_fen()}")
+    print(f"Партий: {len(played)}, ошибок: {len(errors)}")
+    return errors
+
+
+def main() -> None:
+    """Просмотр архива из командной строки"""
+    parser = argparse.ArgumentParser(description='Просмотр архива партий')
+    parser.add_argument('path', nargs='?', help='файл архива')
+    parser.add_argument('--game', type=int, help='номер партии (с нуля)')
+    parser.add_argument('--ply', type=int, help='вывести позицию после этого полухода')
+    parser.add_argument('--check', action='store_true',
+                        help='проверить запись и чтение архива на случайных партиях (файл не нужен)')
+    args = parser.parse_args()
+
+    if args.check:
+        errors = self_test()
+        for error in errors[:20]:
+            print(error)
+        sys.exit(1 if errors else 0)
+    if args.path is None:
+        parser.error('нужен файл архива или --check')
+
+    with ArchiveReader(args.path) as reader:
+        if args.game is None:
+            results = {}
+            plies = 0
+            for number in range(len(reader)):
+                results[reader.result(number)] = results.get(reader.result(number), 0) + 1
+                plies += reader.ply_count(number)
+            print(f"Партий: {len(reader)}, полуходов: {plies}")
+            for result, count in sorted(results.items()):
+                print(f"  {result}: {count}")
+        elif args.ply is None:
+            print(f"Результат: {reader.result(args.game)}, полуходов: {reader.ply_count(args.game)}")
+            print(reader.start_position(args.game).to_fen())
+        else:
+            print(reader.position(args.game, args.ply).to_fen())
+
+
+if __name__ == '__main__':
+    main()
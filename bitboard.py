@@ -0,0 +1,476 @@
+from moves import MoveBuffer, encode_move, flag_castling, flag_en_passant, flag_promotion, promotion_symbols
+
+# Представление позиции на битбордах: по одному 64-битному числу на каждый тип и цвет фигур.
+# Клетка (x, y) доски ChessGame соответствует биту y * 8 + x, то есть бит 0 - это a8,
+# бит 63 - h1. Белые (цвет 0) двигаются в сторону уменьшения номера клетки
+
+board_size = 8
+
+# Порядок типов фигур внутри каждого цвета
+piece_types = ('P', 'N', 'B', 'R', 'Q', 'K')
+pawn, knight, bishop, rook, queen, king = range(6)
+
+# Права на рокировку (битовые флаги)
+white_king_side = 1
+white_queen_side = 2
+black_king_side = 4
+black_queen_side = 8
+all_castling = 15
+
+# Угловые клетки и права, которые теряются при ходе с них или взятии на них
+castling_corners = {63: white_king_side, 56: white_queen_side, 7: black_king_side, 0: black_queen_side}
+
+
+def square_index(x: int, y: int) -> int:
+    """Номер клетки (0-63) по координатам доски"""
+    return y * board_size + x
+
+
+def square_coords(square: int) -> tuple:
+    """Координаты (x, y) по номеру клетки"""
+    return square & 7, square >> 3
+
+
+def iter_bits(mask: int):
+    """Перебрать номера установленных битов маски от младшего к старшему"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def _build_leaper_table(offsets: list) -> list:
+    """Построить таблицу атак для фигуры, которая ходит на фиксированные смещения"""
+    table = []
+    for square in range(64):
+        x, y = square_coords(square)
+        mask = 0
+        for dx, dy in offsets:
+            new_x, new_y = x + dx, y + dy
+            if 0 <= new_x < 8 and 0 <= new_y < 8:
+                mask |= 1 << square_index(new_x, new_y)
+        table.append(mask)
+    return table
+
+
+knight_attacks = _build_leaper_table([
+    (2, 1), (2, -1), (-2, 1), (-2, -1),
+    (1, 2), (1, -2), (-1, 2), (-1, -2)
+])
+king_attacks = _build_leaper_table([
+    (1, 0), (-1, 0), (0, 1), (0, -1),
+    (1, 1), (1, -1), (-1, 1), (-1, -1)
+])
+# Клетки, которые бьет пешка: белые бьют вверх (y - 1), черные вниз (y + 1)
+pawn_attacks = (
+    _build_leaper_table([(-1, -1), (1, -1)]),
+    _build_leaper_table([(-1, 1), (1, 1)])
+)
+
+# Лучи для дальнобойных фигур
+ray_directions = [(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1)]
+rook_rays = (0, 1, 2, 3)
+bishop_rays = (4, 5, 6, 7)
+# Луч "положительный", если номера клеток вдоль него растут
+ray_positive = [dy > 0 or (dy == 0 and dx > 0) for dx, dy in ray_directions]
+
+
+def _build_rays() -> list:
+    """Построить маски лучей от каждой клетки во всех восьми направлениях"""
+    rays = []
+    for dx, dy in ray_directions:
+        table = []
+        for square in range(64):
+            x, y = square_coords(square)
+            mask = 0
+            for i in range(1, 8):
+                new_x, new_y = x + i * dx, y + i * dy
+                if not (0 <= new_x < 8 and 0 <= new_y < 8):
+                    break
+                mask |= 1 << square_index(new_x, new_y)
+            table.append(mask)
+        rays.append(table)
+    return rays
+
+
+rays = _build_rays()
+
+
+def sliding_attacks(square: int, occupied: int, directions: tuple) -> int:
+    """
+    Атаки дальнобойной фигуры с учетом блокирующих фигур
+
+    Args:
+        square: клетка фигуры
+        occupied: маска всех занятых клеток
+        directions: номера лучей (rook_rays, bishop_rays или оба)
+
+    Returns:
+        int: маска атакованных клеток (включая первую занятую клетку на каждом луче)
+    """
+    attacks = 0
+    for direction in directions:
+        ray = rays[direction][square]
+        blockers = ray & occupied
+        if blockers:
+            if ray_positive[direction]:
+                first = (blockers & -blockers).bit_length() - 1
+            else:
+                first = blockers.bit_length() - 1
+            ray ^= rays[direction][first]
+        attacks |= ray
+    return attacks
+
+
+def rook_attacks(square: int, occupied: int) -> int:
+    """Атаки ладьи с клетки square"""
+    return sliding_attacks(square, occupied, rook_rays)
+
+
+def bishop_attacks(square: int, occupied: int) -> int:
+    """Атаки слона с клетки square"""
+    return sliding_attacks(square, occupied, bishop_rays)
+
+
+def queen_attacks(square: int, occupied: int) -> int:
+    """Атаки ферзя с клетки square"""
+    return sliding_attacks(square, occupied, rook_rays + bishop_rays)
+
+
+class BitboardPosition:
+    """Позиция на битбордах: двенадцать масок фигур, очередь хода, права на рокировку и взятие на проходе"""
+
+    def __init__(self) -> None:
+        """Инициализация пустой позиции"""
+        self.pieces = [0] * 12  # color * 6 + тип фигуры -> маска
+        self.side = 0  # 0 - ход белых, 1 - ход черных
+        self.castling = 0  # Битовые флаги white_king_side ... black_queen_side
+        self.en_passant = None  # Номер клетки для взятия на проходе или None
+
+    @classmethod
+    def from_board(cls, board: list, side: int, en_passant: tuple = None) -> 'BitboardPosition':
+        """
+        Построить позицию из доски ChessGame (списка списков фигур)
+
+        Права на рокировку определяются по флагам has_moved короля и ладей,
+        так же как их проверяет King.get_valid_moves
+
+        Args:
+            board: шахматная доска
+            side: цвет стороны, которая ходит
+            en_passant: координаты для взятия на проходе
+
+        Returns:
+            BitboardPosition: новая позиция
+        """
+        position = cls()
+        position.side = side
+
+        for y in range(board_size):
+            for x in range(board_size):
+                piece = board[y][x]
+                if piece is not None:
+                    index = piece.color * 6 + piece_types.index(piece.symbol)
+                    position.pieces[index] |= 1 << square_index(x, y)
+
+        def unmoved(x: int, y: int, symbol: str, color: int) -> bool:
+            piece = board[y][x]
+            return (piece is not None and piece.symbol == symbol and
+                    piece.color == color and not piece.has_moved)
+
+        for color, y, king_side, queen_side in ((0, 7, white_king_side, white_queen_side),
+                                                (1, 0, black_king_side, black_queen_side)):
+            if unmoved(4, y, 'K', color):
+                if unmoved(7, y, 'R', color):
+                    position.castling |= king_side
+                if unmoved(0, y, 'R', color):
+                    position.castling |= queen_side
+
+        if en_passant is not None:
+            position.en_passant = square_index(*en_passant)
+        return position
+
+    @classmethod
+    def from_game(cls, game) -> 'BitboardPosition':
+        """Построить позицию из текущего состояния ChessGame"""
+        return cls.from_board(game.board, game.current_player, game.en_passant)
+
+    def copy(self) -> 'BitboardPosition':
+        """Получить независимую копию позиции"""
+        position = BitboardPosition()
+        position.pieces = self.pieces[:]
+        position.side = self.side
+        position.castling = self.castling
+        position.en_passant = self.en_passant
+        return position
+
+    def occupancy(self, color: int) -> int:
+        """Маска всех фигур указанного цвета"""
+        pieces = self.pieces
+        start = color * 6
+        return (pieces[start] | pieces[start + 1] | pieces[start + 2] |
+                pieces[start + 3] | pieces[start + 4] | pieces[start + 5])
+
+    def piece_at(self, square: int) -> tuple:
+        """
+        Получить фигуру на клетке
+
+        Returns:
+            tuple: (цвет, тип фигуры) или None, если клетка пуста
+        """
+        bit = 1 << square
+        for index, mask in enumerate(self.pieces):
+            if mask & bit:
+                return index // 6, index % 6
+        return None
+
+    def king_square(self, color: int) -> int:
+        """Номер клетки короля или None, если короля нет"""
+        mask = self.pieces[color * 6 + king]
+        return mask.bit_length() - 1 if mask else None
+
+    def is_square_attacked(self, square: int, by_color: int, occupied: int = None) -> bool:
+        """
+        Проверить, атакована ли клетка фигурами указанного цвета
+
+        Args:
+            square: номер клетки
+            by_color: цвет атакующей стороны
+            occupied: маска занятых клеток (по умолчанию - текущая)
+
+        Returns:
+            bool: True если клетка атакована
+        """
+        pieces = self.pieces
+        base = by_color * 6
+        if occupied is None:
+            occupied = self.occupancy(0) | self.occupancy(1)
+
+        # Пешку атакующего цвета ищем "обратным" ударом со стороны защищающегося
+        if pawn_attacks[1 - by_color][square] & pieces[base + pawn]:
+            return True
+        if knight_attacks[square] & pieces[base + knight]:
+            return True
+        if king_attacks[square] & pieces[base + king]:
+            return True
+
+        queens = pieces[base + queen]
+        if rook_attacks(square, occupied) & (pieces[base + rook] | queens):
+            return True
+        if bishop_attacks(square, occupied) & (pieces[base + bishop] | queens):
+            return True
+        return False
+
+    def is_in_check(self, color: int) -> bool:
+        """Проверить, находится ли король указанного цвета под шахом"""
+        square = self.king_square(color)
+        if square is None:
+            return False
+        return self.is_square_attacked(square, 1 - color)
+
+    def targets_from(self, square: int, color: int, piece_type: int) -> int:
+        """
+        Клетки, куда фигура может пойти без учета шаха (как в get_valid_moves классов фигур)
+
+        Args:
+            square: клетка фигуры
+            color: цвет фигуры
+            piece_type: тип фигуры
+
+        Returns:
+            int: маска целевых клеток
+        """
+        own = self.occupancy(color)
+        enemy = self.occupancy(1 - color)
+        occupied = own | enemy
+
+        if piece_type == pawn:
+            step = -8 if color == 0 else 8
+            start_row = 6 if color == 0 else 1
+            targets = 0
+            forward = square + step
+            if 0 <= forward < 64 and not occupied >> forward & 1:
+                targets |= 1 << forward
+                double = forward + step
+                if square >> 3 == start_row and not occupied >> double & 1:
+                    targets |= 1 << double
+            captures = pawn_attacks[color][square]
+            targets |= captures & enemy
+            if self.en_passant is not None:
+                targets |= captures & (1 << self.en_passant)
+            return targets
+
+        if piece_type == knight:
+            return knight_attacks[square] & ~own
+        if piece_type == bishop:
+            return bishop_attacks(square, occupied) & ~own
+        if piece_type == rook:
+            return rook_attacks(square, occupied) & ~own
+        if piece_type == queen:
+            return queen_attacks(square, occupied) & ~own
+
+        # Король: обычные ходы плюс рокировка, если путь свободен
+        targets = king_attacks[square] & ~own
+        king_side, queen_side = (white_king_side, white_queen_side) if color == 0 else \
+            (black_king_side, black_queen_side)
+        if self.castling & king_side and not occupied & (0b11 << (square + 1)):
+            targets |= 1 << (square + 2)
+        if self.castling & queen_side and not occupied & (0b111 << (square - 3)):
+            targets |= 1 << (square - 2)
+        return targets
+
+    def visibility(self, color: int = None) -> int:
+        """
+        Маска клеток, видимых игроку в тумане войны: его фигуры и все клетки, куда они могут пойти
+
+        Args:
+            color: цвет игрока (по умолчанию - сторона, которая ходит)
+
+        Returns:
+            int: 64-битная маска видимых клеток
+        """
+        if color is None:
+            color = self.side
+        mask = self.occupancy(color)
+        for piece_type in range(6):
+            for square in iter_bits(self.pieces[color * 6 + piece_type]):
+                mask |= self.targets_from(square, color, piece_type)
+        return mask
+
+    def pseudo_legal_moves(self, buffer: MoveBuffer = None) -> MoveBuffer:
+        """
+        Ходы стороны, которая ходит, без проверки шаха
+
+        Args:
+            buffer: буфер для ходов (по умолчанию создается новый)
+
+        Returns:
+            MoveBuffer: упакованные ходы (см. moves.py)
+        """
+        if buffer is None:
+            buffer = MoveBuffer()
+        buffer.clear()
+
+        color = self.side
+        last_row = 0 if color == 0 else 7
+        for piece_type in range(6):
+            for square in iter_bits(self.pieces[color * 6 + piece_type]):
+                for target in iter_bits(self.targets_from(square, color, piece_type)):
+                    if piece_type == pawn:
+                        if target >> 3 == last_row:
+                            for symbol in promotion_symbols:
+                                buffer.append(encode_move(square, target, flag_promotion, symbol))
+                        elif target == self.en_passant:
+                            buffer.append(encode_move(square, target, flag_en_passant))
+                        else:
+                            buffer.append(encode_move(square, target))
+                    elif piece_type == king and abs(target - square) == 2:
+                        buffer.append(encode_move(square, target, flag_castling))
+                    else:
+                        buffer.append(square | (target << 6))
+        return buffer
+
+    def make_move(self, move: int) -> 'BitboardPosition':
+        """
+        Выполнить ход и вернуть новую позицию (текущая не изменяется)
+
+        Args:
+            move: упакованный ход
+
+        Returns:
+            BitboardPosition: позиция после хода
+        """
+        start = move & 63
+        end = (move >> 6) & 63
+        flag = move >> 14
+        position = self.copy()
+        pieces = position.pieces
+        color = self.side
+        base = color * 6
+        opponent_base = (1 - color) * 6
+        start_bit, end_bit = 1 << start, 1 << end
+
+        moving = None
+        for piece_type in range(6):
+            if pieces[base + piece_type] & start_bit:
+                moving = piece_type
+                break
+
+        # Взятие
+        for piece_type in range(6):
+            pieces[opponent_base + piece_type] &= ~end_bit
+
+        pieces[base + moving] ^= start_bit | end_bit
+
+        # Взятие на проходе: взятая пешка стоит рядом, а не на целевой клетке
+        if flag == flag_en_passant:
+            captured = end + 8 if color == 0 else end - 8
+            pieces[opponent_base + pawn] &= ~(1 << captured)
+        elif flag == flag_promotion:
+            pieces[base + pawn] &= ~end_bit
+            pieces[base + piece_types.index(promotion_symbols[(move >> 12) & 3])] |= end_bit
+
+        # Рокировка: ладья перепрыгивает через короля
+        if flag == flag_castling:
+            if end > start:
+                pieces[base + rook] ^= (1 << (start + 3)) | (1 << (start + 1))
+            else:
+                pieces[base + rook] ^= (1 << (start - 4)) | (1 << (start - 1))
+
+        if moving == king:
+            position.castling &= ~((white_king_side | white_queen_side) if color == 0 else
+                                   (black_king_side | black_queen_side))
+        position.castling &= ~(castling_corners.get(start, 0) | castling_corners.get(end, 0))
+
+        if moving == pawn and abs(end - start) == 16:
+            position.en_passant = (start + end) // 2
+        else:
+            position.en_passant = None
+
+        position.side = 1 - color
+        return position
+
+    def legal_moves(self, buffer: MoveBuffer = None) -> MoveBuffer:
+        """
+        Все допустимые ходы стороны, которая ходит
+
+        Args:
+            buffer: буфер для ходов (по умолчанию создается новый)
+
+        Returns:
+            MoveBuffer: упакованные ходы
+        """
+        color = self.side
+        opponent = 1 - color
+        king_sq = self.king_square(color)
+        in_check = king_sq is not None and self.is_square_attacked(king_sq, opponent)
+
+        # Допустимые ходы переписываются в начало того же буфера
+        buffer = self.pseudo_legal_moves(buffer)
+        moves = buffer.moves
+        count = 0
+        for i in range(buffer.count):
+            move = moves[i]
+            if move >> 14 == flag_castling:
+                # Нельзя рокироваться из-под шаха и через атакованное поле
+                if in_check or self.is_square_attacked(((move & 63) + ((move >> 6) & 63)) // 2, opponent):
+                    continue
+            if not self.make_move(move).is_in_check(color):
+                moves[count] = move
+                count += 1
+        buffer.count = count
+        return buffer
+
+    def get_valid_moves(self, x: int, y: int) -> list:
+        """
+        Получить допустимые ходы фигуры в позиции (x, y) стороны, которая ходит
+
+        Returns:
+            list: список клеток (x, y)
+        """
+        start = square_index(x, y)
+        targets = []
+        for move in self.legal_moves():
+            if move & 63 == start and (move >> 12) & 3 == 0:
+                targets.append(square_coords((move >> 6) & 63))
+        return targets
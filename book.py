@@ -0,0 +1,253 @@
+import argparse
+import json
+import mmap
+import os
+import random
+import struct
+
+from archive import ArchiveReader
+from moves import move_name
+from notation import read_pgn, san_to_move
+from rules import Game, start_fen
+
+# Дебютная книга: отсортированный по ключу Зобриста файл записей фиксированной длины.
+# Поиск - двоичный по файлу, отображенному в память только для чтения, поэтому
+# рабочие процессы, открывшие одну книгу, делят одни и те же страницы в кэше ОС.
+#
+# Запись - 14 байт: ключ позиции (8 байт), упакованный ход (2 байта), вес (4 байта).
+# Записи одной позиции идут подряд, внутри позиции - по возрастанию хода.
+
+record_struct = struct.Struct('<QHI')
+record_size = record_struct.size
+key_struct = struct.Struct('<Q')
+
+# Сколько первых полуходов партии добавляется в книгу при сборке
+default_book_plies = 16
+
+# Вес хода по результату партии для стороны, которая его сделала
+result_weights = {'win': 2, 'draw': 1, 'loss': 0}
+
+max_weight = (1 << 32) - 1
+
+
+def move_weight(result: str, color: int) -> int:
+    """
+    Вес хода по результату партии
+
+    Args:
+        result: результат ('1-0', '0-1', '1/2-1/2', '*')
+        color: цвет стороны, сделавшей ход
+
+    Returns:
+        int: вес (неоконченная партия считается ничьей)
+    """
+    if result == '1-0':
+        return result_weights['win' if color == 0 else 'loss']
+    if result == '0-1':
+        return result_weights['win' if color == 1 else 'loss']
+    return result_weights['draw']
+
+
+class BookBuilder:
+    """Сборка дебютной книги: веса ходов накапливаются в памяти и записываются одним файлом"""
+
+    def __init__(self, plies: int = default_book_plies) -> None:
+        """
+        Инициализация сборки
+
+        Args:
+            plies: сколько первых полуходов каждой партии добавлять
+        """
+        self.plies = plies
+        self.weights = {}  # (ключ позиции, ход) -> вес
+        self.games = 0
+
+    def add_moves(self, game: Game, moves, result: str) -> None:
+        """
+        Добавить ходы партии
+
+        Args:
+            game: начальная позиция (меняется: ходы выполняются через push)
+            moves: упакованные ходы
+            result: результат партии
+        """
+        for ply, move in enumerate(moves):
+            if ply >= self.plies:
+                break
+            entry = (game.hash, move)
+            self.weights[entry] = self.weights.get(entry, 0) + move_weight(result, game.current_player)
+            game.push(move)
+        self.games += 1
+
+    def add_pgn(self, path: str) -> None:
+        """Добавить партии из файла PGN (партии с недопустимыми ходами пропускаются)"""
+        for pgn_game in read_pgn(path):
+            game = Game.from_fen(pgn_game.tags.get('FEN', start_fen))
+            moves = []
+            try:
+                for san in pgn_game.moves[:self.plies]:
+                    move = san_to_move(game, san)
+                    game.push(move)
+                    moves.append(move)
+            except ValueError:
+                continue
+            while game.history:
+                game.pop()
+            self.add_moves(game, moves, pgn_game.tags.get('Result', pgn_game.result))
+
+    def add_simulation(self, path: str) -> None:
+        """Добавить партии из результатов simulate.py (записанных с --moves)"""
+        with open(path, encoding='utf-8') as file:
+            for line in file:
+                result = json.loads(line)
+                if 'moves' not in result:
+                    continue
+                game = Game()
+                moves = []
+                for name in result['moves'][:self.plies]:
+                    move = next((move for move in game.generate_moves() if move_name(move) == name), None)
+                    if move is None:
+                        break
+                    game.push(move)
+                    moves.append(move)
+                while game.history:
+                    game.pop()
+                self.add_moves(game, moves, result['outcome'])
+
+    def add_archive(self, path: str) -> None:
+        """Добавить партии из архива archive.py"""
+        with ArchiveReader(path) as reader:
+            for start, moves, result in reader:
+                self.add_moves(start, moves, result)
+
+    def write(self, path: str) -> int:
+        """
+        Записать книгу (через временный файл, чтобы не портить книгу, открытую другими процессами)
+
+        Returns:
+            int: количество записей
+        """
+        entries = sorted((key, move, min(weight, max_weight))
+                         for (key, move), weight in self.weights.items() if weight > 0)
+        temporary = path + '.tmp'
+        with open(temporary, 'wb') as file:
+            for entry in entries:
+                file.write(record_struct.pack(*entry))
+        os.replace(temporary, path)
+        return len(entries)
+
+
+class OpeningBook:
+    """Дебютная книга, отображенная в память только для чтения"""
+
+    def __init__(self, path: str) -> None:
+        """
+        Открыть книгу
+
+        Args:
+            path: путь к файлу книги
+        """
+        self.path = path
+        with open(path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self.count = size // record_size
+
+    def close(self) -> None:
+        """Закрыть отображение файла"""
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def lookup(self, key: int) -> list:
+        """
+        Найти ходы позиции двоичным поиском
+
+        Args:
+            key: ключ Зобриста позиции
+
+        Returns:
+            list: (упакованный ход, вес) для всех записей позиции
+        """
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if key_struct.unpack_from(self.data, middle * record_size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        entries = []
+        for index in range(low, self.count):
+            entry_key, move, weight = record_struct.unpack_from(self.data, index * record_size)
+            if entry_key != key:
+                break
+            entries.append((move, weight))
+        return entries
+
+    def choose(self, game: Game, rng: random.Random = None) -> int:
+        """
+        Выбрать ход из книги с вероятностью, пропорциональной весу
+
+        Ходы проверяются по допустимым ходам позиции на случай совпадения ключей
+
+        Args:
+            game: партия
+            rng: генератор случайных чисел (по умолчанию модуль random)
+
+        Returns:
+            int: упакованный ход или None, если позиции нет в книге
+        """
+        entries = self.lookup(game.hash)
+        if not entries:
+            return None
+        legal = set(game.generate_moves())
+        entries = [(move, weight) for move, weight in entries if move in legal]
+        if not entries:
+            return None
+        moves, weights = zip(*entries)
+        return (rng or random).choices(moves, weights)[0]
+
+
+def main() -> None:
+    """Сборка и просмотр дебютной книги из командной строки"""
+    parser = argparse.ArgumentParser(description='Дебютная книга')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='собрать книгу')
+    build.add_argument('output', help='файл книги')
+    build.add_argument('--pgn', action='append', default=[], help='файл PGN')
+    build.add_argument('--simulation', action='append', default=[],
+                       help='результаты simulate.py, записанные с --moves')
+    build.add_argument('--archive', action='append', default=[], help='архив партий archive.py')
+    build.add_argument('--plies', type=int, default=default_book_plies, help='сколько первых полуходов брать')
+
+    probe = commands.add_parser('probe', help='показать ходы позиции')
+    probe.add_argument('book', help='файл книги')
+    probe.add_argument('--fen', default=start_fen, help='позиция в FEN')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        builder = BookBuilder(args.plies)
+        for path in args.pgn:
+            builder.add_pgn(path)
+        for path in args.simulation:
+            builder.add_simulation(path)
+        for path in args.archive:
+            builder.add_archive(path)
+        count = builder.write(args.output)
+        print(f"Партий: {builder.games}, записей: {count}")
+    else:
+        book = OpeningBook(args.book)
+        game = Game.from_fen(args.fen)
+        entries = sorted(book.lookup(game.hash), key=lambda entry: -entry[1])
+        total = sum(weight for move, weight in entries) or 1
+        for move, weight in entries:
+            print(f"{move_name(move)} {weight} {weight * 100 / total:.1f}%")
+        book.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,17 @@
-import pygame
+# Направления движения фигур (общие для всех экземпляров, чтобы не создавать списки на каждый вызов)
+knight_moves = ((2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (1, -2), (-1, 2), (-1, -2))
+king_moves = ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1))
+rook_directions = ((1, 0), (-1, 0), (0, 1), (0, -1))
+bishop_directions = ((1, 1), (1, -1), (-1, 1), (-1, -1))
+queen_directions = rook_directions + bishop_directions
 
 
 class ChessPiece:
     """Базовый класс для всех шахматных фигур"""
 
+    # Без __dict__ у каждого экземпляра: фигур много, а полей всего три
+    __slots__ = ('color', 'symbol', 'has_moved')
+
     def __init__(self, color: int, symbol: str) -> None:
         """
         Инициализация шахматной фигуры
@@ -35,10 +43,42 @@ class ChessPiece:
         target_piece = board[y][x]
         return target_piece is None or self.is_opponent(target_piece)
 
+    def get_sliding_moves(self, board: list, x: int, y: int, directions: tuple) -> list:
+        """
+        Получить ходы дальнобойной фигуры по заданным направлениям
+
+        Args:
+            board: шахматная доска
+            x: текущая координата x
+            y: текущая координата y
+            directions: направления (dx, dy)
+
+        Returns:
+            list: список допустимых ходов
+        """
+        moves = []
+
+        for dx, dy in directions:
+            new_x, new_y = x + dx, y + dy
+            while 0 <= new_x < 8 and 0 <= new_y < 8:
+                target = board[new_y][new_x]
+                if target is None:
+                    moves.append((new_x, new_y))
+                else:
+                    if target.color != self.color:
+                        moves.append((new_x, new_y))
+                    break
+                new_x += dx
+                new_y += dy
+
+        return moves
+
 
 class Pawn(ChessPiece):
     """Класс пешки"""
 
+    __slots__ = ()
+
     def __init__(self, color: int) -> None:
         super().__init__(color, 'P')
 
@@ -68,7 +108,7 @@ class Pawn(ChessPiece):
                 moves.append((x, y + 2 * direction))
 
         # Взятия
-        for dx in [-1, 1]:
+        for dx in (-1, 1):
             new_x, new_y = x + dx, y + direction
             if 0 <= new_x < 8 and 0 <= new_y < 8:
                 target = board[new_y][new_x]
@@ -125,6 +165,8 @@ class Pawn(ChessPiece):
 class Knight(ChessPiece):
     """Класс коня (обозначается как N в шахматах)"""
 
+    __slots__ = ()
+
     def __init__(self, color: int) -> None:
         super().__init__(color, 'N')
 
@@ -142,10 +184,6 @@ class Knight(ChessPiece):
             list: список допустимых ходов
         """
         moves = []
-        knight_moves = [
-            (2, 1), (2, -1), (-2, 1), (-2, -1),
-            (1, 2), (1, -2), (-1, 2), (-1, -2)
-        ]
 
         for dx, dy in knight_moves:
             new_x, new_y = x + dx, y + dy
@@ -158,6 +196,8 @@ class Knight(ChessPiece):
 class Bishop(ChessPiece):
     """Класс слона"""
 
+    __slots__ = ()
+
     def __init__(self, color: int) -> None:
         super().__init__(color, 'B')
 
@@ -174,29 +214,14 @@ class Bishop(ChessPiece):
         Returns:
             list: список допустимых ходов
         """
-        moves = []
-        directions = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
-
-        for dx, dy in directions:
-            for i in range(1, 8):
-                new_x, new_y = x + i * dx, y + i * dy
-                if not (0 <= new_x < 8 and 0 <= new_y < 8):
-                    break
-
-                if board[new_y][new_x] is None:
-                    moves.append((new_x, new_y))
-                elif self.is_opponent(board[new_y][new_x]):
-                    moves.append((new_x, new_y))
-                    break
-                else:
-                    break
-
-        return moves
+        return self.get_sliding_moves(board, x, y, bishop_directions)
 
 
 class Rook(ChessPiece):
     """Класс ладьи"""
 
+    __slots__ = ()
+
     def __init__(self, color: int) -> None:
         super().__init__(color, 'R')
 
@@ -213,29 +238,14 @@ class Rook(ChessPiece):
         Returns:
             list: список допустимых ходов
         """
-        moves = []
-        directions = [(1, 0), (-1, 0), (0, 1), (0, -1)]
-
-        for dx, dy in directions:
-            for i in range(1, 8):
-                new_x, new_y = x + i * dx, y + i * dy
-                if not (0 <= new_x < 8 and 0 <= new_y < 8):
-                    break
-
-                if board[new_y][new_x] is None:
-                    moves.append((new_x, new_y))
-                elif self.is_opponent(board[new_y][new_x]):
-                    moves.append((new_x, new_y))
-                    break
-                else:
-                    break
-
-        return moves
+        return self.get_sliding_moves(board, x, y, rook_directions)
 
 
 class Queen(ChessPiece):
     """Класс ферзя"""
 
+    __slots__ = ()
+
     def __init__(self, color: int) -> None:
         super().__init__(color, 'Q')
 
@@ -253,14 +263,14 @@ class Queen(ChessPiece):
             list: список допустимых ходов
         """
         # Ферзь ходит как ладья + слон
-        rook_moves = Rook(self.color).get_valid_moves(board, x, y)
-        bishop_moves = Bishop(self.color).get_valid_moves(board, x, y)
-        return rook_moves + bishop_moves
+        return self.get_sliding_moves(board, x, y, queen_directions)
 
 
 class King(ChessPiece):
     """Класс короля"""
 
+    __slots__ = ()
+
     def __init__(self, color: int) -> None:
         super().__init__(color, 'K')
 
@@ -278,10 +288,6 @@ class King(ChessPiece):
             list: список допустимых ходов
         """
         moves = []
-        king_moves = [
-            (1, 0), (-1, 0), (0, 1), (0, -1),
-            (1, 1), (1, -1), (-1, 1), (-1, -1)
-        ]
 
         for dx, dy in king_moves:
             new_x, new_y = x + dx, y + dy
@@ -0,0 +1,517 @@
+import random
+import threading
+import time
+
+from moves import MoveBuffer, flag_en_passant, flag_promotion, promotion_symbols
+from rules import Game
+
+# Оценка позиции в сотых долях пешки
+piece_values = {'P': 100, 'N': 320, 'B': 330, 'R': 500, 'Q': 900, 'K': 0}
+
+# Таблицы бонусов за положение фигур для белых: первая строка - 8-я горизонталь,
+# индекс совпадает с номером клетки y * 8 + x. Для черных клетка отражается (square ^ 56)
+piece_square_tables = {
+    'P': (
+        0, 0, 0, 0, 0, 0, 0, 0,
+        50, 50, 50, 50, 50, 50, 50, 50,
+        10, 10, 20, 30, 30, 20, 10, 10,
+        5, 5, 10, 25, 25, 10, 5, 5,
+        0, 0, 0, 20, 20, 0, 0, 0,
+        5, -5, -10, 0, 0, -10, -5, 5,
+        5, 10, 10, -20, -20, 10, 10, 5,
+        0, 0, 0, 0, 0, 0, 0, 0,
+    ),
+    'N': (
+        -50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20, 0, 0, 0, 0, -20, -40,
+        -30, 0, 10, 15, 15, 10, 0, -30,
+        -30, 5, 15, 20, 20, 15, 5, -30,
+        -30, 0, 15, 20, 20, 15, 0, -30,
+        -30, 5, 10, 15, 15, 10, 5, -30,
+        -40, -20, 0, 5, 5, 0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50,
+    ),
+    'B': (
+        -20, -10, -10, -10, -10, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 10, 10, 5, 0, -10,
+        -10, 5, 5, 10, 10, 5, 5, -10,
+        -10, 0, 10, 10, 10, 10, 0, -10,
+        -10, 10, 10, 10, 10, 10, 10, -10,
+        -10, 5, 0, 0, 0, 0, 5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20,
+    ),
+    'R': (
+        0, 0, 0, 0, 0, 0, 0, 0,
+        5, 10, 10, 10, 10, 10, 10, 5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        0, 0, 0, 5, 5, 0, 0, 0,
+    ),
+    'Q': (
+        -20, -10, -10, -5, -5, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 5, 5, 5, 0, -10,
+        -5, 0, 5, 5, 5, 5, 0, -5,
+        0, 0, 5, 5, 5, 5, 0, -5,
+        -10, 5, 5, 5, 5, 5, 0, -10,
+        -10, 0, 5, 0, 0, 0, 0, -10,
+        -20, -10, -10, -5, -5, -10, -10, -20,
+    ),
+    'K': (
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+        20, 20, 0, 0, 0, 0, 20, 20,
+        20, 30, 10, 0, 0, 10, 30, 20,
+    ),
+}
+
+# Оценка мата; мат в n полуходов оценивается как mate_score - n
+mate_score = 100000
+mate_threshold = mate_score - 1000
+
+max_ply = 64
+
+# Вид оценки в таблице транспозиций
+bound_exact = 0
+bound_lower = 1  # настоящая оценка не меньше сохраненной (отсечение по beta)
+bound_upper = 2  # настоящая оценка не больше сохраненной (ни один ход не улучшил alpha)
+
+# Как часто проверять время и флаг остановки (в узлах)
+time_check_interval = 256
+
+
+class SearchTimeout(Exception):
+    """Время на ход истекло или поиск остановлен"""
+
+
+class TranspositionTable:
+    """Таблица транспозиций фиксированного размера с индексом по ключу Зобриста"""
+
+    def __init__(self, size: int = 1 << 18) -> None:
+        """
+        Инициализация таблицы
+
+        Args:
+            size: количество записей (округляется вниз до степени двойки)
+        """
+        size = 1 << (size.bit_length() - 1)
+        self.mask = size - 1
+        self.entries = [None] * size
+        self.generation = 0
+
+    def new_search(self) -> None:
+        """Начать новый поиск: записи прошлых поисков будут вытесняться в первую очередь"""
+        self.generation += 1
+
+    def clear(self) -> None:
+        """Удалить все записи"""
+        self.entries = [None] * (self.mask + 1)
+
+    def probe(self, key: int) -> tuple:
+        """
+        Найти запись для позиции
+
+        Returns:
+            tuple: (ключ, глубина, оценка, вид оценки, лучший ход, поколение) или None
+        """
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key: int, depth: int, score: int, bound: int, move: int) -> None:
+        """
+        Сохранить результат поиска
+
+        Запись в ячейке заменяется, если она относится к той же позиции, к прошлому
+        поиску или была получена на меньшей глубине
+
+        Args:
+            key: ключ позиции
+            depth: оставшаяся глубина поиска
+            score: оценка
+            bound: вид оценки (bound_*)
+            move: лучший ход или None
+        """
+        index = key & self.mask
+        old = self.entries[index]
+        if (old is None or old[0] == key or old[5] != self.generation or depth >= old[1]):
+            if move is None and old is not None and old[0] == key:
+                move = old[4]
+            self.entries[index] = (key, depth, score, bound, move, self.generation)
+
+
+def evaluate(game: Game) -> int:
+    """
+    Оценить позицию по материалу и положению фигур
+
+    Returns:
+        int: оценка с точки зрения стороны, которая ходит
+    """
+    score = 0
+    square = 0
+    for row in game.board:
+        for piece in row:
+            if piece is not None:
+                symbol = piece.symbol
+                if piece.color == 0:
+                    score += piece_values[symbol] + piece_square_tables[symbol][square]
+                else:
+                    score -= piece_values[symbol] + piece_square_tables[symbol][square ^ 56]
+            square += 1
+    return score if game.current_player == 0 else -score
+
+
+class Engine:
+    """Поиск хода: итеративное углубление, альфа-бета, форсированные варианты и таблица транспозиций"""
+
+    def __init__(self, time_limit: float = 1.0, max_depth: int = max_ply, tt_size: int = 1 << 18,
+                 book=None, book_plies: int = 16, tablebases=None) -> None:
+        """
+        Инициализация движка
+
+        Args:
+            time_limit: время на ход в секундах
+            max_depth: максимальная глубина итеративного углубления
+            tt_size: количество записей в таблице транспозиций
+            book: дебютная книга (OpeningBook из book.py) или None
+            book_plies: до какого полухода партии брать ходы из книги
+            tablebases: эндшпильные таблицы (Tablebases из tablebase.py) или None
+        """
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.table = TranspositionTable(tt_size)
+        self.book = book
+        self.book_plies = book_plies
+        self.tablebases = tablebases
+        self.rng = random.Random()  # выбор хода из книги
+        self.killers = [[None, None] for _ in range(max_ply + 1)]
+        self.buffers = [MoveBuffer() for _ in range(max_ply + 1)]
+        self.nodes = 0
+        self.deadline = 0.0
+        self.stop_event = None
+        self.completed_depth = 0
+        self.root_scores = {}  # ход -> оценка на последней завершенной итерации
+
+    def snapshot(self, game: Game) -> Game:
+        """Данные для поиска в другом потоке: независимая копия партии"""
+        return game.copy()
+
+    def search(self, game: Game, time_limit: float = None, stop_event: threading.Event = None,
+               root_moves: list = None, exact_scores: bool = False) -> int:
+        """
+        Найти лучший ход в позиции
+
+        Позиция меняется через push/pop и после поиска остается прежней
+
+        Args:
+            game: партия (лучше копия, если поиск идет в отдельном потоке)
+            time_limit: время на ход в секундах (по умолчанию self.time_limit)
+            stop_event: событие для досрочной остановки поиска
+            root_moves: рассматривать только эти ходы из корня (по умолчанию все допустимые)
+            exact_scores: искать каждый ход из корня с полным окном, чтобы в root_scores
+                          были точные оценки всех ходов, а не только лучшего (поиск медленнее)
+
+        Returns:
+            int: упакованный ход или None, если ходов нет
+        """
+        if time_limit is None:
+            time_limit = self.time_limit
+        self.deadline = time.perf_counter() + time_limit
+        self.stop_event = stop_event
+        self.nodes = 0
+        self.completed_depth = 0
+        self.root_scores = {}
+        self.killers = [[None, None] for _ in range(max_ply + 1)]
+        self.table.new_search()
+
+        moves = list(game.generate_moves(self.buffers[0]))
+        if root_moves is not None:
+            moves = [move for move in moves if move in root_moves]
+        if not moves:
+            return None
+
+        # В дебюте ход из книги делается без поиска
+        if self.book is not None and (game.fullmove_number - 1) * 2 + game.current_player < self.book_plies:
+            book_move = self.book.choose(game, self.rng)
+            if book_move in moves:
+                return book_move
+
+        # В эндшпиле из таблиц ход известен точно
+        if self.tablebases is not None:
+            table_move = self.tablebases.best_move(game)
+            if table_move in moves:
+                return table_move
+
+        best_move = moves[0]
+        if len(moves) == 1:
+            self.root_scores = {best_move: evaluate(game)}
+            return best_move
+
+        history_size = len(game.history)
+        for depth in range(1, self.max_depth + 1):
+            try:
+                scores = {}
+                score, move = self.search_root(game, moves, depth, scores, exact_scores)
+            except SearchTimeout:
+                # Недосчитанная итерация отбрасывается, позиция восстанавливается
+                while len(game.history) > history_size:
+                    game.pop()
+                break
+            best_move = move
+            self.completed_depth = depth
+            self.root_scores = scores
+            # Лучший ход предыдущей итерации проверяется первым
+            moves.remove(move)
+            moves.insert(0, move)
+            if abs(score) >= mate_threshold:
+                break
+
+        return best_move
+
+    def search_root(self, game: Game, moves: list, depth: int, scores: dict, exact: bool = False) -> tuple:
+        """
+        Перебрать ходы из корня на заданную глубину
+
+        Args:
+            game: партия
+            moves: ходы из корня
+            depth: глубина
+            scores: сюда записываются оценки ходов (для всех, кроме лучшего, - верхние границы,
+                    если не задан exact)
+            exact: искать каждый ход с полным окном, чтобы все оценки были точными
+
+        Returns:
+            tuple: (оценка, лучший ход)
+        """
+        alpha, beta = -mate_score, mate_score
+        best_move = moves[0]
+        for move in moves:
+            game.push(move)
+            # С сужением окна ходы хуже лучшего получают лишь верхнюю границу оценки
+            window = -mate_score if exact else alpha
+            score = -self.alpha_beta(game, depth - 1, -beta, -window, 1)
+            game.pop()
+            scores[move] = score
+            if score > alpha:
+                alpha = score
+                best_move = move
+        self.table.store(game.hash, depth, alpha, bound_exact, best_move)
+        return alpha, best_move
+
+    def check_time(self) -> None:
+        """Прервать поиск, если время истекло или поиск остановлен"""
+        if time.perf_counter() >= self.deadline or (self.stop_event is not None and self.stop_event.is_set()):
+            raise SearchTimeout()
+
+    def capture_value(self, game: Game, move: int) -> int:
+        """
+        Ценность взятия для упорядочивания MVV-LVA (самая ценная жертва, самый дешевый нападающий)
+
+        Returns:
+            int: 0 для тихого хода
+        """
+        board = game.board
+        start, end = move & 63, (move >> 6) & 63
+        flag = move >> 14
+        victim = board[end >> 3][end & 7]
+        if victim is not None:
+            value = piece_values[victim.symbol] * 10
+        elif flag == flag_en_passant:
+            value = piece_values['P'] * 10
+        else:
+            value = 0
+        if flag == flag_promotion:
+            value += piece_values[promotion_symbols[(move >> 12) & 3]] * 10
+        if value:
+            value += 1000 - piece_values[board[start >> 3][start & 7].symbol] // 10
+        return value
+
+    def order_moves(self, game: Game, moves, tt_move: int, ply: int) -> list:
+        """
+        Упорядочить ходы: ход из таблицы транспозиций, взятия по MVV-LVA, ходы-убийцы, остальные
+
+        Returns:
+            list: отсортированные ходы
+        """
+        killers = self.killers[ply]
+        scored = []
+        for move in moves:
+            if move == tt_move:
+                score = 1 << 30
+            else:
+                score = self.capture_value(game, move)
+                if not score and (move == killers[0] or move == killers[1]):
+                    score = 900
+            scored.append((score, move))
+        scored.sort(reverse=True)
+        return [move for score, move in scored]
+
+    def alpha_beta(self, game: Game, depth: int, alpha: int, beta: int, ply: int) -> int:
+        """
+        Поиск с альфа-бета отсечением
+
+        Args:
+            game: партия
+            depth: оставшаяся глубина
+            alpha: нижняя граница оценки
+            beta: верхняя граница оценки
+            ply: расстояние от корня в полуходах
+
+        Returns:
+            int: оценка позиции с точки зрения стороны, которая ходит
+        """
+        if depth <= 0 or ply >= max_ply:
+            return self.quiescence(game, alpha, beta, ply)
+
+        self.nodes += 1
+        if self.nodes % time_check_interval == 0:
+            self.check_time()
+
+        # В дереве перебора уже первое повторение считается ничьей
+        if ply > 0 and game.draw_reason(repetitions=2) is not None:
+            return 0
+
+        if self.tablebases is not None and ply > 0:
+            result = self.tablebases.probe(game)
+            if result is not None:
+                wdl, dtm = result
+                if wdl > 0:
+                    return mate_score - ply - dtm
+                if wdl < 0:
+                    return -mate_score + ply + dtm
+                return 0
+
+        key = game.hash
+        tt_move = None
+        entry = self.table.probe(key)
+        if entry is not None:
+            tt_move = entry[4]
+            if entry[1] >= depth:
+                score = score_from_table(entry[2], ply)
+                bound = entry[3]
+                if (bound == bound_exact or
+                        (bound == bound_lower and score >= beta) or
+                        (bound == bound_upper and score <= alpha)):
+                    return score
+
+        moves = game.generate_moves(self.buffers[ply])
+        if not len(moves):
+            if game.is_in_check(game.current_player):
+                return -mate_score + ply
+            return 0
+
+        original_alpha = alpha
+        best_move = None
+        for move in self.order_moves(game, moves, tt_move, ply):
+            game.push(move)
+            score = -self.alpha_beta(game, depth - 1, -beta, -alpha, ply + 1)
+            game.pop()
+
+            if score > alpha:
+                alpha = score
+                best_move = move
+                if alpha >= beta:
+                    # Тихий ход, вызвавший отсечение, запоминается как ход-убийца
+                    killers = self.killers[ply]
+                    if not self.capture_value(game, move) and move != killers[0]:
+                        killers[1] = killers[0]
+                        killers[0] = move
+                    self.table.store(key, depth, score_to_table(alpha, ply), bound_lower, move)
+                    return alpha
+
+        bound = bound_exact if alpha > original_alpha else bound_upper
+        self.table.store(key, depth, score_to_table(alpha, ply), bound, best_move)
+        return alpha
+
+    def quiescence(self, game: Game, alpha: int, beta: int, ply: int) -> int:
+        """
+        Перебор только взятий и превращений, чтобы не оценивать позицию посреди размена
+
+        Returns:
+            int: оценка позиции с точки зрения стороны, которая ходит
+        """
+        self.nodes += 1
+        if self.nodes % time_check_interval == 0:
+            self.check_time()
+
+        stand_pat = evaluate(game)
+        if stand_pat >= beta or ply >= max_ply:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        captures = []
+        for move in game.generate_moves(self.buffers[ply]):
+            value = self.capture_value(game, move)
+            if value:
+                captures.append((value, move))
+        captures.sort(reverse=True)
+
+        for value, move in captures:
+            game.push(move)
+            score = -self.quiescence(game, -beta, -alpha, ply + 1)
+            game.pop()
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    break
+        return alpha
+
+
+def score_to_table(score: int, ply: int) -> int:
+    """Перевести оценку мата в расстояние от текущей позиции для таблицы транспозиций"""
+    if score >= mate_threshold:
+        return score + ply
+    if score <= -mate_threshold:
+        return score - ply
+    return score
+
+
+def score_from_table(score: int, ply: int) -> int:
+    """Перевести оценку мата из таблицы транспозиций в расстояние от корня"""
+    if score >= mate_threshold:
+        return score - ply
+    if score <= -mate_threshold:
+        return score + ply
+    return score
+
+
+class BackgroundSearch:
+    """Поиск хода в отдельном потоке на копии партии, чтобы не останавливать цикл отрисовки"""
+
+    def __init__(self, engine: Engine, game: Game, on_done) -> None:
+        """
+        Запустить поиск
+
+        Args:
+            engine: движок
+            game: партия (поиск идет на ее снимке, см. Engine.snapshot)
+            on_done: функция on_done(search, move), вызывается из потока поиска
+        """
+        self.engine = engine
+        self.key = game.hash  # позиция, для которой ищется ход
+        self.move = None
+        self.cancelled = False
+        self.stop_event = threading.Event()
+        self.on_done = on_done
+        self.thread = threading.Thread(target=self.run, args=(engine.snapshot(game),), daemon=True)
+        self.thread.start()
+
+    def run(self, snapshot) -> None:
+        """Тело потока поиска"""
+        self.move = self.engine.search(snapshot, stop_event=self.stop_event)
+        self.on_done(self, self.move)
+
+    def cancel(self) -> None:
+        """Остановить поиск (результат будет помечен как отмененный)"""
+        self.cancelled = True
+        self.stop_event.set()
@@ -0,0 +1,334 @@
+import multiprocessing
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from engine import Engine
+from rules import Game, board_size, piece_classes
+
+# Поиск в тумане войны: движок знает только то, что видно на доске игроку.
+# Скрытые фигуры соперника расставляются случайно (детерминизация), каждая расстановка
+# просчитывается обычным движком в отдельном процессе, оценки ходов усредняются
+
+# Оценки выше этой границы (мат в одной расстановке) не должны перевешивать остальные
+score_cap = 2000
+
+# Сколько раз пробовать расставить скрытые фигуры, прежде чем взять неполностью согласованную расстановку
+max_attempts = 50
+
+# Прогрев пула: задачи готовности держат процесс это время, чтобы каждая досталась другому процессу
+warm_up_delay = 0.05
+warm_up_rounds = 20
+
+
+class FogView:
+    """Все, что видит игрок: свои фигуры, видимые фигуры соперника и число скрытых"""
+
+    def __init__(self, game: Game, color: int = None) -> None:
+        """
+        Собрать видимую часть позиции
+
+        Скрытые фигуры соперника - то, что игрок может знать: фигуры соперника в начальной
+        позиции партии без взятых игроком (по истории ходов) и без видимых фигур. Превращения
+        в тумане игрок не видел, поэтому лишние видимые фигуры считаются превращенными пешками,
+        а скрытые превращенные фигуры - пешками. Если партия начата из FEN без истории ходов,
+        начальная позиция совпадает с текущей и набор считается по доске
+
+        Args:
+            game: партия
+            color: цвет игрока (по умолчанию - сторона, которая ходит)
+        """
+        if color is None:
+            color = game.current_player
+        opponent = 1 - color
+        self.color = color
+        self.visibility = game.compute_visibility(color)
+        self.in_check = game.status.check if color == game.current_player else False
+        # Допустимые ходы игрок видит и в интерфейсе, они же ограничивают расстановки
+        self.candidates = list(game.generate_moves()) if color == game.current_player else []
+
+        self.known = []  # (x, y, цвет, символ)
+        hidden = fen_inventory(game.initial_fen, opponent)
+        for record in game.history:
+            captured = record.captured_piece
+            if captured is not None and captured.color == opponent:
+                take_from_inventory(hidden, captured.symbol)
+        for y, row in enumerate(game.board):
+            for x, piece in enumerate(row):
+                if piece is None:
+                    continue
+                if piece.color == color:
+                    self.known.append((x, y, piece.color, piece.symbol))
+                elif self.visibility >> (y * board_size + x) & 1:
+                    self.known.append((x, y, piece.color, piece.symbol))
+                    take_from_inventory(hidden, piece.symbol)
+        self.hidden = [symbol for symbol, count in hidden.items() for _ in range(count)]
+
+        # Права соперника на рокировку неизвестны - считаем, что их нет
+        self.castling_rights = {name: allowed and name.startswith('white' if color == 0 else 'black')
+                                for name, allowed in game.castling_rights.items()}
+        # Взятие на проходе известно, только если видна пешка, которая сделала двойной ход
+        self.en_passant = None
+        if game.en_passant is not None and color == game.current_player:
+            x, y = game.en_passant
+            pawn_y = y + 1 if opponent == 0 else y - 1
+            if self.visibility >> (pawn_y * board_size + x) & 1:
+                self.en_passant = game.en_passant
+
+
+def fen_inventory(fen: str, color: int) -> dict:
+    """Количество фигур цвета по расстановке FEN (символ -> количество)"""
+    placement = fen.split()[0]
+    inventory = {symbol: 0 for symbol in 'PNBRQK'}
+    for letter in placement:
+        if letter.isalpha() and letter.isupper() == (color == 0):
+            inventory[letter.upper()] += 1
+    return inventory
+
+
+def take_from_inventory(inventory: dict, symbol: str) -> None:
+    """Убрать фигуру из набора; лишние ферзи и другие фигуры считаются превращенными пешками"""
+    if inventory[symbol] > 0:
+        inventory[symbol] -= 1
+    elif inventory['P'] > 0:
+        inventory['P'] -= 1
+
+
+def free_squares(view: FogView) -> tuple:
+    """
+    Клетки, на которых могут стоять скрытые фигуры соперника
+
+    Returns:
+        tuple: (все скрытые свободные клетки, те из них, где может стоять пешка)
+    """
+    occupied = {(x, y) for x, y, color, symbol in view.known}
+    # Фигуру соперника по диагонали от своей пешки было бы видно (ее можно взять)
+    direction = -1 if view.color == 0 else 1
+    for x, y, color, symbol in view.known:
+        if color == view.color and symbol == 'P':
+            occupied.add((x - 1, y + direction))
+            occupied.add((x + 1, y + direction))
+
+    squares = [(x, y) for y in range(board_size) for x in range(board_size)
+               if not view.visibility >> (y * board_size + x) & 1 and (x, y) not in occupied]
+    pawn_squares = [(x, y) for x, y in squares if 0 < y < board_size - 1]
+    return squares, pawn_squares
+
+
+def determinize(view: FogView, rng: random.Random) -> Game:
+    """
+    Расставить скрытые фигуры соперника случайно, согласованно с тем, что видит игрок
+
+    Расстановка согласована, если игрок видит те же клетки, его шах и допустимые
+    ходы совпадают, а король соперника не под ударом
+
+    Args:
+        view: видимая часть позиции
+        rng: генератор случайных чисел
+
+    Returns:
+        Game: позиция для поиска или None, если расставить фигуры не удалось
+    """
+    squares, pawn_squares = free_squares(view)
+    candidates = set(view.candidates)
+    game = Game()
+    fallback = None
+
+    for _ in range(max_attempts):
+        board = [[None] * board_size for _ in range(board_size)]
+        for x, y, color, symbol in view.known:
+            board[y][x] = piece_classes[symbol](color)
+
+        # Сначала пешки: для них подходит меньше клеток
+        placed = True
+        free = set(squares)
+        for symbol in sorted(view.hidden, key=lambda symbol: symbol != 'P'):
+            choices = [square for square in (pawn_squares if symbol == 'P' else squares) if square in free]
+            if not choices:
+                placed = False
+                break
+            x, y = rng.choice(choices)
+            free.discard((x, y))
+            board[y][x] = piece_classes[symbol](1 - view.color)
+        if not placed:
+            continue
+
+        game.set_position(board, view.color, view.castling_rights, view.en_passant)
+        if game.is_in_check(1 - view.color) or game.status.check != view.in_check:
+            continue
+        if fallback is None:
+            fallback = game.copy()
+        if (game.compute_visibility(view.color) == view.visibility and
+                set(game.generate_moves()) == candidates):
+            return game
+
+    return fallback
+
+
+# Движок создается один раз в каждом рабочем процессе, таблица транспозиций сохраняется между задачами
+worker_engine = None
+# Общее для пула событие: прервать задачи хода, который уже закончен
+worker_stop = None
+
+
+def init_worker(stop_event) -> None:
+    """Создать движок рабочего процесса при его запуске"""
+    global worker_engine, worker_stop
+    worker_engine = Engine()
+    worker_stop = stop_event
+
+
+def worker_ready(delay: float) -> int:
+    """Задача прогрева пула: занять процесс на delay секунд и вернуть его номер"""
+    time.sleep(delay)
+    return os.getpid()
+
+
+def search_sample(view: FogView, seed: int, time_limit: float, deadline: float) -> dict:
+    """
+    Расставить скрытые фигуры и просчитать позицию (выполняется в рабочем процессе)
+
+    Args:
+        view: видимая часть позиции
+        seed: зерно генератора для расстановки
+        time_limit: время на поиск
+        deadline: время хода по time.time(); задача, начатая позже, сразу возвращается
+
+    Returns:
+        dict: ход -> оценка (пустой, если расстановка не удалась или время хода вышло)
+    """
+    started = time.time()
+    if started >= deadline or worker_stop.is_set():
+        return {}
+    game = determinize(view, random.Random(seed))
+    if game is None:
+        return {}
+    remaining = min(time_limit - (time.time() - started), deadline - time.time())
+    if remaining <= 0:
+        return {}
+    # Оценки усредняются по расстановкам, поэтому нужны точные оценки всех ходов, а не границы
+    move = worker_engine.search(game, remaining, stop_event=worker_stop, root_moves=view.candidates,
+                                exact_scores=True)
+    scores = dict(worker_engine.root_scores)
+    if not scores and move is not None:
+        scores[move] = 0
+    return {move: max(-score_cap, min(score_cap, score)) for move, score in scores.items()}
+
+
+class FogEngine:
+    """Движок, который не видит скрытых туманом фигур: поиск по случайным расстановкам в пуле процессов"""
+
+    def __init__(self, time_limit: float = 1.0, workers: int = None, rounds: int = 2) -> None:
+        """
+        Инициализация движка
+
+        Args:
+            time_limit: время на ход в секундах
+            workers: количество процессов (по умолчанию - по числу ядер)
+            rounds: сколько расстановок просчитывает каждый процесс за ход
+        """
+        self.time_limit = time_limit
+        self.workers = workers or os.cpu_count() or 1
+        self.rounds = rounds
+        self.pool = None
+        self.stop_workers = None  # событие остановки задач в рабочих процессах
+        self.running = set()  # задачи прошлого хода, которые еще выполняются
+        self.rng = random.Random()
+        self.sample_count = 0  # расстановок, просчитанных за последний ход
+        self.start()
+
+    def start(self) -> None:
+        """
+        Запустить рабочие процессы и дождаться их готовности
+
+        Запуск процесса через spawn занимает заметное время, поэтому он делается
+        при создании движка, а не в первом поиске за счет времени хода
+        """
+        if self.pool is not None:
+            return
+        # Процессы запускаются заново, а не копируют окно и потоки родителя через fork
+        context = multiprocessing.get_context('spawn')
+        self.stop_workers = context.Event()
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                        initializer=init_worker, initargs=(self.stop_workers,))
+        ready = set()
+        for _ in range(warm_up_rounds):
+            futures = [self.pool.submit(worker_ready, warm_up_delay) for _ in range(self.workers)]
+            ready.update(future.result() for future in futures)
+            if len(ready) >= self.workers:
+                break
+
+    def close(self) -> None:
+        """Остановить рабочие процессы"""
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+            self.running = set()
+
+    def snapshot(self, game: Game) -> FogView:
+        """Данные для поиска: только видимая часть позиции"""
+        return FogView(game)
+
+    def search(self, view: FogView, time_limit: float = None, stop_event: threading.Event = None) -> int:
+        """
+        Выбрать ход по средней оценке на случайных расстановках скрытых фигур
+
+        Args:
+            view: видимая часть позиции (см. FogView)
+            time_limit: время на ход в секундах (по умолчанию self.time_limit)
+            stop_event: событие для досрочной остановки поиска
+
+        Returns:
+            int: упакованный ход или None, если ходов нет
+        """
+        self.sample_count = 0
+        if not view.candidates:
+            return None
+        if len(view.candidates) == 1:
+            return view.candidates[0]
+
+        self.start()
+        # Задачи прошлого хода прерваны событием; их нужно дождаться, иначе они займут процессы
+        # за счет времени этого хода
+        wait(self.running)
+        self.running = set()
+        self.stop_workers.clear()
+
+        if time_limit is None:
+            time_limit = self.time_limit
+        deadline = time.perf_counter() + time_limit
+        # Срок для рабочих процессов - по часам, общим для всех процессов
+        worker_deadline = time.time() + time_limit
+        # Часть времени уходит на передачу задач и ответов
+        sample_time = time_limit * 0.8 / self.rounds
+
+        pending = {self.pool.submit(search_sample, view, self.rng.getrandbits(64), sample_time, worker_deadline)
+                   for _ in range(self.workers * self.rounds)}
+
+        totals = {}
+        counts = {}
+        while pending:
+            if stop_event is not None and stop_event.is_set():
+                break
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=min(remaining, 0.05), return_when=FIRST_COMPLETED)
+            for future in done:
+                scores = future.result()
+                if scores:
+                    self.sample_count += 1
+                for move, score in scores.items():
+                    totals[move] = totals.get(move, 0) + score
+                    counts[move] = counts.get(move, 0) + 1
+        # Задачи в очереди отменяются, выполняющиеся прерываются событием
+        self.running = {future for future in pending if not future.cancel()}
+        if self.running:
+            self.stop_workers.set()
+
+        if not totals:
+            return view.candidates[0]
+        # Ходы, просчитанные не во всех расстановках, сравниваются по средней оценке
+        return max(totals, key=lambda move: (totals[move] / counts[move], counts[move]))
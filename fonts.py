@@ -0,0 +1,81 @@
+from collections import OrderedDict
+
+import pygame
+
+# Шрифты и надписи: системный шрифт ищется один раз для каждого размера,
+# одинаковые надписи рендерятся один раз и берутся из кэша
+
+
+class FontRegistry:
+    """Шрифты по имени и размеру: поиск системного шрифта выполняется при первом обращении"""
+
+    def __init__(self) -> None:
+        """Инициализация пустого реестра"""
+        self.fonts = {}  # (имя, размер) -> pygame.font.Font
+
+    def get(self, size: int, name: str = None):
+        """
+        Получить шрифт
+
+        Args:
+            size: размер шрифта
+            name: имя системного шрифта (None - шрифт pygame по умолчанию)
+
+        Returns:
+            pygame.font.Font: шрифт
+        """
+        key = (name, size)
+        font = self.fonts.get(key)
+        if font is None:
+            font = pygame.font.SysFont(name, size)
+            self.fonts[key] = font
+        return font
+
+    def clear(self) -> None:
+        """Забыть шрифты (после pygame.font.quit они недействительны)"""
+        self.fonts.clear()
+
+
+class TextCache:
+    """Кэш отрендеренных надписей с вытеснением давно не использованных"""
+
+    def __init__(self, fonts: FontRegistry, capacity: int = 256) -> None:
+        """
+        Инициализация кэша
+
+        Args:
+            fonts: реестр шрифтов
+            capacity: максимальное количество надписей
+        """
+        self.fonts = fonts
+        self.capacity = capacity
+        self.surfaces = OrderedDict()  # (текст, размер, цвет, имя шрифта) -> поверхность
+
+    def render(self, text: str, size: int, color: tuple, name: str = None):
+        """
+        Получить надпись (со сглаживанием)
+
+        Args:
+            text: текст
+            size: размер шрифта
+            color: цвет текста
+            name: имя системного шрифта (None - шрифт по умолчанию)
+
+        Returns:
+            pygame.Surface: поверхность с текстом (не изменять: она общая для всех вызовов)
+        """
+        key = (text, size, tuple(color), name)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            return surface
+
+        surface = self.fonts.get(size, name).render(text, True, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.capacity:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def clear(self) -> None:
+        """Очистить кэш надписей"""
+        self.surfaces.clear()
@@ -1,13 +1,25 @@
+import argparse
+import cProfile
+import pstats
+
 import pygame
+from analysis import AnalysisService, PositionAnalysis
+from book import OpeningBook
 from chess_pieces import Pawn, Knight, Bishop, Rook, Queen, King
-
-# Инициализация pygame
-pygame.init()
+from engine import BackgroundSearch, Engine
+from fog_search import FogEngine
+from fonts import FontRegistry, TextCache
+from profiler import Profiler
+from renderer import BoardRenderer
+from rules import Game, GameStatus, board_size
+from sprites import SpriteAtlas
+from tablebase import Tablebases
 
 # Константы
 window_size = 640
-board_size = 8
 square_size = window_size // board_size
+piece_image_size = square_size - 10
+promotion_image_size = square_size - 20
 fps = 60
 
 # Цвета
@@ -19,80 +31,183 @@ check_highlight = (255, 0, 0, 150)
 fog_of_war = (0, 0, 0)  # Непрозрачный черный цвет
 promotion_background = (50, 50, 50, 200)
 
-# Настройка дисплея
-screen = pygame.display.set_mode((window_size, window_size))
-pygame.display.set_caption('Шахматы')
-clock = pygame.time.Clock()
+# Надписи о ничьей по причинам из GameStatus.draw_reason
+draw_messages = {
+    'stalemate': "Пат - Ничья!",
+    'fifty_moves': "Правило 50 ходов - Ничья!",
+    'repetition': "Троекратное повторение - Ничья!",
+    'insufficient_material': "Недостаточно материала - Ничья!"
+}
+
+# Дисплей создается в init_display(), чтобы импорт модуля не открывал окно
+screen = None
+clock = None
+
+# Изображения фигур загружаются один раз и хранятся в памяти
+sprite_atlas = SpriteAtlas()
+
+# Шрифты ищутся один раз для каждого размера, одинаковые надписи рендерятся один раз
+font_registry = FontRegistry()
+text_cache = TextCache(font_registry)
+
 
-# Инициализация шрифта
-pygame.font.init()
+def init_display() -> None:
+    """Инициализация pygame, окна игры и шрифтов"""
+    global screen, clock
 
+    pygame.init()
+    screen = pygame.display.set_mode((window_size, window_size))
+    pygame.display.set_caption('Шахматы')
+    clock = pygame.time.Clock()
 
-class ChessGame:
-    """Основной класс шахматной игры"""
+    # Инициализация шрифта (шрифты прошлой инициализации pygame недействительны)
+    pygame.font.init()
+    font_registry.clear()
+    text_cache.clear()
 
-    def __init__(self) -> None:
-        """Инициализация шахматной игры"""
-        self.board = [[None for _ in range(board_size)] for _ in range(board_size)]
+
+class ChessGame(Game):
+    """Отрисовка и управление мышью поверх правил игры из rules.Game"""
+
+    def __init__(self, viewer: int = None, analysis: AnalysisService = None) -> None:
+        """
+        Инициализация шахматной игры
+
+        Args:
+            viewer: цвет игрока, чей туман войны показывается (None - сторона, которая ходит)
+            analysis: фоновый анализ позиций (None - ходы и состояние игры считаются сразу)
+        """
+        self.viewer = viewer
+        self.analysis = analysis
+        self.analysis_pending = False  # состояние игры еще считается в фоновом потоке
+        # Выбор задается до Game.__init__: update_status может сразу применить анализ из кэша
         self.selected_piece = None
         self.valid_moves = []
-        self.current_player = 0  # 0 для белых, 1 для черных
+        self.fog_cache = None  # (маска, поверхность тумана) для последней отрисованной маски
+        super().__init__()
+
+    def update_visibility(self) -> None:
+        """Пересчитать маску видимости для игрока за доской"""
+        self.visibility = self.compute_visibility(self.viewer)
+
+    def update_status(self) -> None:
+        """Взять состояние игры из кэша анализа или поставить позицию в очередь на анализ"""
+        if self.analysis is None:
+            super().update_status()
+            return
+
+        result = self.analysis.get(self.hash)
+        if result is not None:
+            self.apply_analysis(result)
+            return
+
+        # Пока анализ не готов, шах (быстрая проверка) уже показывается, а конец игры - еще нет
+        self.analysis_pending = True
+        self.status = GameStatus(check=self.is_in_check(self.current_player))
+        self.check = self.status.check
         self.game_over = False
-        self.check = False
-        self.en_passant = None
-        self.promotion_pending = None  # (x, y) координаты пешки для превращения
-        self.castling_rights = {
-            'white_king_side': True,
-            'white_queen_side': True,
-            'black_king_side': True,
-            'black_queen_side': True
-        }
-        self.initialize_board()
-
-    def initialize_board(self) -> None:
-        """Начальная расстановка фигур на доске"""
-        # Пешки
-        for i in range(board_size):
-            self.board[1][i] = Pawn(1)  # Черные пешки
-            self.board[6][i] = Pawn(0)  # Белые пешки
-
-        # Остальные фигуры
-        back_row_order = [Rook, Knight, Bishop, Queen, King, Bishop, Knight, Rook]
-
-        # Черные фигуры (верх)
-        for i, piece_class in enumerate(back_row_order):
-            self.board[0][i] = piece_class(1)
-
-        # Белые фигуры (низ)
-        for i, piece_class in enumerate(back_row_order):
-            self.board[7][i] = piece_class(0)
-
-    def draw_board(self) -> None:
-        """Отрисовка шахматной доски"""
+        self.analysis.submit(self)
+
+    def apply_analysis(self, result: PositionAnalysis) -> None:
+        """
+        Применить готовый результат анализа, если он относится к текущей позиции
+
+        Args:
+            result: результат анализа
+        """
+        if result.key != self.hash or self.promotion_pending:
+            return
+        self.analysis_pending = False
+        self.legal_moves_cache = result.moves
+        # Повторения зависят от истории партии, а не только от позиции, поэтому правила ничьей
+        # проверяются здесь, а не берутся из кэша
+        self.set_status(result.status.check, result.status.legal_move_count)
+        # Если фигура выбрана до готовности анализа, ее ходы подсвечиваются сейчас
+        if self.selected_piece is not None:
+            self.valid_moves = self.get_valid_moves_for_piece(*self.selected_piece)
+
+    def get_valid_moves_for_piece(self, x: int, y: int, include_checks: bool = True) -> list:
+        """Получить допустимые ходы фигуры; для стороны, которая ходит, - из кэша анализа"""
+        if include_checks and self.analysis is not None:
+            piece = self.board[y][x]
+            if piece is not None and piece.color == self.current_player:
+                result = self.analysis.get(self.hash)
+                if result is None:
+                    # Ходы появятся, когда анализ будет готов (см. apply_analysis)
+                    return []
+                return list(result.moves_by_square.get((x, y), ()))
+        return super().get_valid_moves_for_piece(x, y, include_checks)
+
+    def draw_board(self, squares: list = None) -> None:
+        """
+        Отрисовка шахматной доски
+
+        Args:
+            squares: клетки (x, y) для перерисовки, None - вся доска
+        """
+        if squares is None:
+            squares = self.all_squares()
+
         # Отрисовка клеток
-        for row in range(board_size):
-            for col in range(board_size):
-                color = light_square if (row + col) % 2 == 0 else dark_square
-                pygame.draw.rect(screen, color,
-                                 (col * square_size, row * square_size,
-                                  square_size, square_size))
-
-    def draw_pieces(self) -> None:
-        """Отрисовка всех фигур на доске"""
-        for row in range(board_size):
-            for col in range(board_size):
-                piece = self.board[row][col]
-                if piece:
-                    try:
-                        image = pygame.image.load(piece.get_image_path())
-                        image = pygame.transform.scale(image, (square_size - 10, square_size - 10))
-                        screen.blit(image, (col * square_size + 5, row * square_size + 5))
-                    except pygame.error:
-                        # Запасной вариант если картинок нет
-                        font = pygame.font.SysFont(None, 36)
-                        text_color = (255, 255, 255) if piece.color == 1 else (0, 0, 0)
-                        text = font.render(piece.symbol, True, text_color)
-                        screen.blit(text, (col * square_size + 20, row * square_size + 20))
+        for col, row in squares:
+            color = light_square if (row + col) % 2 == 0 else dark_square
+            pygame.draw.rect(screen, color,
+                             (col * square_size, row * square_size,
+                              square_size, square_size))
+
+    def draw_pieces(self, squares: list = None) -> None:
+        """
+        Отрисовка фигур на доске
+
+        Args:
+            squares: клетки (x, y) для перерисовки, None - вся доска
+        """
+        if squares is None:
+            squares = self.all_squares()
+
+        for col, row in squares:
+            piece = self.board[row][col]
+            if piece:
+                image = sprite_atlas.get(piece.color, piece.symbol, piece_image_size)
+                if image is not None:
+                    screen.blit(image, (col * square_size + 5, row * square_size + 5))
+                else:
+                    # Запасной вариант если картинок нет
+                    text_color = (255, 255, 255) if piece.color == 1 else (0, 0, 0)
+                    text = text_cache.render(piece.symbol, 36, text_color)
+                    screen.blit(text, (col * square_size + 20, row * square_size + 20))
+
+    def get_promotion_menu_rect(self) -> tuple:
+        """
+        Получить размеры и позицию меню превращения пешки
+
+        Returns:
+            tuple: (x, y, ширина, высота) меню
+        """
+        menu_width = square_size * 2
+        menu_height = square_size * 4
+        menu_x = (window_size - menu_width) // 2
+        menu_y = (window_size - menu_height) // 2
+        return menu_x, menu_y, menu_width, menu_height
+
+    def get_promotion_hover(self) -> int:
+        """
+        Получить номер пункта меню превращения под курсором
+
+        Returns:
+            int: номер пункта (0-3) или None, если курсор вне меню
+        """
+        if not self.promotion_pending:
+            return None
+
+        menu_x, menu_y, menu_width, menu_height = self.get_promotion_menu_rect()
+        mouse_x, mouse_y = pygame.mouse.get_pos()
+        for i in range(4):
+            piece_y = menu_y + i * (menu_height // 4)
+            if (menu_x <= mouse_x <= menu_x + menu_width and
+                    piece_y <= mouse_y <= piece_y + menu_height // 4):
+                return i
+        return None
 
     def draw_promotion_menu(self) -> None:
         """Отрисовка меню превращения пешки"""
@@ -102,10 +217,7 @@ class ChessGame:
         x, y = self.promotion_pending
         color = self.board[y][x].color
 
-        menu_width = square_size * 2
-        menu_height = square_size * 4
-        menu_x = (window_size - menu_width) // 2
-        menu_y = (window_size - menu_height) // 2
+        menu_x, menu_y, menu_width, menu_height = self.get_promotion_menu_rect()
 
         # Рисуем фон меню
         menu_bg = pygame.Surface((menu_width, menu_height), pygame.SRCALPHA)
@@ -113,9 +225,8 @@ class ChessGame:
         screen.blit(menu_bg, (menu_x, menu_y))
 
         # Заголовок меню
-        font_title = pygame.font.SysFont(None, 32)
         title_text = "Выберите фигуру для превращения"
-        title_surface = font_title.render(title_text, True, (255, 255, 255))
+        title_surface = text_cache.render(title_text, 32, (255, 255, 255))
         title_width = title_surface.get_width() + 20
         title_height = title_surface.get_height() + 10
         title_bg = pygame.Surface((title_width, title_height), pygame.SRCALPHA)
@@ -127,15 +238,14 @@ class ChessGame:
 
         # Фигуры для превращения
         pieces = [Queen, Rook, Bishop, Knight]
+        hovered = self.get_promotion_hover()
         piece_names = ["Ферзь", "Ладья", "Слон", "Конь"]
 
         for i, (piece_class, piece_name) in enumerate(zip(pieces, piece_names)):
             piece_y = menu_y + i * (menu_height // 4)
 
             # Подсветка при наведении
-            mouse_x, mouse_y = pygame.mouse.get_pos()
-            if (menu_x <= mouse_x <= menu_x + menu_width and
-                    piece_y <= mouse_y <= piece_y + menu_height // 4):
+            if i == hovered:
                 highlight_surface = pygame.Surface((menu_width, menu_height // 4), pygame.SRCALPHA)
                 highlight_surface.fill((100, 150, 255, 100))
                 screen.blit(highlight_surface, (menu_x, piece_y))
@@ -149,13 +259,10 @@ class ChessGame:
             # Отображение фигуры
             temp_piece = piece_class(color)
 
-            try:
-                image_size = (menu_height // 4 - 20, menu_height // 4 - 20)
-                image = pygame.image.load(temp_piece.get_image_path())
-                image = pygame.transform.scale(image, image_size)
+            image = sprite_atlas.get(color, temp_piece.symbol, promotion_image_size)
+            if image is not None:
                 screen.blit(image, (menu_x + 15, piece_y + 10))
-            except pygame.error:
-                font_symbol = pygame.font.SysFont(None, 48)
+            else:
                 symbol_color = (0, 0, 0) if color == 0 else (255, 255, 255)
                 symbol_bg_color = (255, 255, 255) if color == 1 else (0, 0, 0)
 
@@ -164,184 +271,143 @@ class ChessGame:
                 symbol_bg.fill(symbol_bg_color)
                 screen.blit(symbol_bg, (menu_x + 10, piece_y + 5))
 
-                symbol_surface = font_symbol.render(temp_piece.symbol, True, symbol_color)
+                symbol_surface = text_cache.render(temp_piece.symbol, 48, symbol_color)
                 symbol_rect = symbol_surface.get_rect(center=(menu_x + 30, piece_y + menu_height // 8))
                 screen.blit(symbol_surface, symbol_rect)
 
             # Отображаем название фигуры
-            font_text = pygame.font.SysFont(None, 28)
-            name_surface = font_text.render(piece_name, True, (0, 0, 0))
+            name_surface = text_cache.render(piece_name, 28, (0, 0, 0))
             name_rect = name_surface.get_rect(midleft=(menu_x + 80, piece_y + menu_height // 8))
             screen.blit(name_surface, name_rect)
 
-    def draw_highlights(self) -> None:
-        """Отрисовка подсветки выбранной фигуры и допустимых ходов"""
+    def get_cursor_square(self) -> tuple:
+        """
+        Получить клетку под курсором, если она подсвечивается
+
+        Returns:
+            tuple: координаты (x, y) или None, если фигура не выбрана или курсор вне доски
+        """
+        if self.promotion_pending or not self.selected_piece:
+            return None
+
+        mouse_x, mouse_y = pygame.mouse.get_pos()
+        grid_x, grid_y = mouse_x // square_size, mouse_y // square_size
+        if 0 <= grid_x < board_size and 0 <= grid_y < board_size:
+            return (grid_x, grid_y)
+        return None
+
+    def draw_highlights(self, squares: list = None) -> None:
+        """
+        Отрисовка подсветки выбранной фигуры и допустимых ходов
+
+        Args:
+            squares: клетки (x, y) для перерисовки, None - вся доска
+        """
         if self.promotion_pending:
             return
 
+        if squares is None:
+            squares = self.all_squares()
+        squares = set(squares)
+
         # Подсветка выбранной фигуры
         if self.selected_piece:
             x, y = self.selected_piece
-            highlight_surface = pygame.Surface((square_size, square_size), pygame.SRCALPHA)
-            highlight_surface.fill(highlight)
-            screen.blit(highlight_surface, (x * square_size, y * square_size))
+            if (x, y) in squares:
+                highlight_surface = pygame.Surface((square_size, square_size), pygame.SRCALPHA)
+                highlight_surface.fill(highlight)
+                screen.blit(highlight_surface, (x * square_size, y * square_size))
 
             # Подсветка позиции курсора
-            mouse_x, mouse_y = pygame.mouse.get_pos()
-            grid_x, grid_y = mouse_x // square_size, mouse_y // square_size
-            if 0 <= grid_x < board_size and 0 <= grid_y < board_size:
+            cursor = self.get_cursor_square()
+            if cursor in squares:
+                grid_x, grid_y = cursor
                 cursor_surface = pygame.Surface((square_size, square_size), pygame.SRCALPHA)
                 cursor_surface.fill(move_highlight)
                 screen.blit(cursor_surface, (grid_x * square_size, grid_y * square_size))
 
         # Отрисовка допустимых ходов
         for x, y in self.valid_moves:
-            pygame.draw.circle(screen, (200, 200, 200),
-                               (x * square_size + square_size // 2,
-                                y * square_size + square_size // 2),
-                               10)
+            if (x, y) in squares:
+                pygame.draw.circle(screen, (200, 200, 200),
+                                   (x * square_size + square_size // 2,
+                                    y * square_size + square_size // 2),
+                                   10)
 
-    def draw_fog_of_war(self) -> None:
-        """Отрисовка тумана войны - показываются все клетки, куда могут пойти фигуры текущего игрока за один ход"""
-        # Создаем поверхность для тумана войны
-        fog_surface = pygame.Surface((window_size, window_size))
-        fog_surface.fill(fog_of_war)
+    def get_fog_surface(self):
+        """
+        Получить поверхность тумана войны для текущей маски видимости
 
-        # Определяем видимые области для текущего игрока
-        visible_areas = []
+        Поверхность строится один раз для каждой маски и используется повторно
 
-        # Добавляем позиции всех фигур текущего игрока
-        for row in range(board_size):
-            for col in range(board_size):
-                piece = self.board[row][col]
-                if piece is not None and piece.color == self.current_player:
-                    visible_areas.append((col * square_size, row * square_size, square_size, square_size))
+        Returns:
+            pygame.Surface: черный туман с прозрачными видимыми клетками
+        """
+        if self.fog_cache is not None and self.fog_cache[0] == self.visibility:
+            return self.fog_cache[1]
 
-                    # Показываем возможные ходы из этой позиции
-                    moves = piece.get_valid_moves(self.board, col, row, self.en_passant)
-                    for move_x, move_y in moves:
-                        visible_areas.append((move_x * square_size, move_y * square_size, square_size, square_size))
+        # Создаем поверхность для тумана войны
+        fog_surface = pygame.Surface((window_size, window_size))
+        fog_surface.fill(fog_of_war)
 
         # Вырезаем видимые области из тумана войны
-        for area in visible_areas:
-            pygame.draw.rect(fog_surface, (255, 255, 255), area)
+        for col, row in self.all_squares():
+            if self.is_square_visible(col, row):
+                pygame.draw.rect(fog_surface, (255, 255, 255),
+                                 (col * square_size, row * square_size, square_size, square_size))
 
+        fog_surface = fog_surface.convert()
         fog_surface.set_colorkey((255, 255, 255))
-        screen.blit(fog_surface, (0, 0))
+        self.fog_cache = (self.visibility, fog_surface)
+        return fog_surface
 
-    def draw_check_indicator(self) -> None:
-        """Подсветка короля при шаге"""
-        if self.promotion_pending:
-            return
-
-        king_pos = self.find_king(self.current_player)
-        if king_pos and self.is_in_check(self.current_player):
-            x, y = king_pos
-            check_surface = pygame.Surface((square_size, square_size), pygame.SRCALPHA)
-            check_surface.fill(check_highlight)
-            screen.blit(check_surface, (x * square_size, y * square_size))
-
-    def find_king(self, color: int) -> tuple:
-        """
-        Найти короля указанного цвета
-
-        Args:
-            color: цвет короля (0 - белый, 1 - черный)
-
-        Returns:
-            tuple: координаты короля (x, y) или None если не найден
-        """
-        for row in range(board_size):
-            for col in range(board_size):
-                piece = self.board[row][col]
-                if isinstance(piece, King) and piece.color == color:
-                    return (col, row)
-        return None
-
-    def is_in_check(self, color: int) -> bool:
+    def draw_fog_of_war(self, squares: list = None) -> None:
         """
-        Проверить, находится ли король указанного цвета под шахом
+        Отрисовка тумана войны - показываются все клетки, куда могут пойти фигуры текущего игрока за один ход
 
         Args:
-            color: цвет короля (0 - белый, 1 - черный)
-
-        Returns:
-            bool: True если король под шахом
+            squares: клетки (x, y) для перерисовки, None - вся доска
         """
-        king_pos = self.find_king(color)
-        if not king_pos:
-            return False
-
-        opponent_color = 1 - color
-        for row in range(board_size):
-            for col in range(board_size):
-                piece = self.board[row][col]
-                if piece is not None and piece.color == opponent_color:
-                    moves = piece.get_valid_moves(self.board, col, row, self.en_passant)
-                    if king_pos in moves:
-                        return True
+        if squares is not None:
+            # Частичная перерисовка: закрываем только невидимые клетки из списка
+            for col, row in squares:
+                if not self.is_square_visible(col, row):
+                    pygame.draw.rect(screen, fog_of_war,
+                                     (col * square_size, row * square_size,
+                                      square_size, square_size))
+            return
 
-        return False
+        screen.blit(self.get_fog_surface(), (0, 0))
 
-    def get_valid_moves_for_piece(self, x: int, y: int, include_checks: bool = True) -> list:
+    def get_check_square(self) -> tuple:
         """
-        Получить допустимые ходы для фигуры в позиции (x, y)
-
-        Args:
-            x: координата x фигуры
-            y: координата y фигуры
-            include_checks: учитывать ли проверку шаха
+        Получить клетку короля текущего игрока, если он под шахом
 
         Returns:
-            list: список допустимых ходов
+            tuple: координаты (x, y) или None
         """
-        piece = self.board[y][x]
-        if piece is None:
-            return []
-
-        # Получить базовые ходы
-        moves = piece.get_valid_moves(self.board, x, y, self.en_passant)
-
-        if not include_checks:
-            return moves
+        if self.promotion_pending or not self.status.check:
+            return None
+        return self.find_king(self.current_player)
 
-        # Отфильтровать ходы, которые ставят/оставляют короля под шахом
-        valid_moves = []
-        for move_x, move_y in moves:
-            if self.is_move_valid((x, y), (move_x, move_y)):
-                valid_moves.append((move_x, move_y))
-
-        return valid_moves
-
-    def is_move_valid(self, start_pos: tuple, end_pos: tuple) -> bool:
+    def draw_check_indicator(self, squares: list = None) -> None:
         """
-        Проверить, является ли ход допустимым (не оставляет короля под шахом)
+        Подсветка короля при шаге
 
         Args:
-            start_pos: начальная позиция (x, y)
-            end_pos: конечная позиция (x, y)
-
-        Returns:
-            bool: True если ход допустим
+            squares: клетки (x, y) для перерисовки, None - вся доска
         """
-        start_x, start_y = start_pos
-        end_x, end_y = end_pos
-
-        # Временное выполнение хода
-        temp_piece = self.board[end_y][end_x]
-        moving_piece = self.board[start_y][start_x]
-
-        self.board[end_y][end_x] = moving_piece
-        self.board[start_y][start_x] = None
-
-        # Проверить, находится ли король под шахом после хода
-        in_check = self.is_in_check(moving_piece.color)
-
-        # Отменить временный ход
-        self.board[start_y][start_x] = moving_piece
-        self.board[end_y][end_x] = temp_piece
+        if self.promotion_pending:
+            return
 
-        return not in_check
+        king_pos = self.find_king(self.current_player)
+        if king_pos and self.status.check:
+            if squares is not None and king_pos not in squares:
+                return
+            x, y = king_pos
+            check_surface = pygame.Surface((square_size, square_size), pygame.SRCALPHA)
+            check_surface.fill(check_highlight)
+            screen.blit(check_surface, (x * square_size, y * square_size))
 
 
     def handle_promotion_click(self, pos: tuple) -> None:
@@ -352,19 +418,13 @@ class ChessGame:
         click_x, click_y = pos
 
         # Размеры и позиция увеличенного меню
-        menu_width = square_size * 2
-        menu_height = square_size * 4
-        menu_x = (window_size - menu_width) // 2
-        menu_y = (window_size - menu_height) // 2
+        menu_x, menu_y, menu_width, menu_height = self.get_promotion_menu_rect()
 
         # Проверяем, был ли клик в области меню
         if not (menu_x <= click_x <= menu_x + menu_width and
                 menu_y <= click_y <= menu_y + menu_height):
             return
 
-        x, y = self.promotion_pending
-        pawn = self.board[y][x]
-
         # Определяем, какую фигуру выбрал игрок
         relative_y = click_y - menu_y
         piece_index = relative_y // (menu_height // 4)
@@ -372,19 +432,7 @@ class ChessGame:
         piece_types = ['Q', 'R', 'B', 'N']
 
         if 0 <= piece_index < len(piece_types):
-            new_piece = pawn.promote(piece_types[piece_index])
-            self.board[y][x] = new_piece
-            self.promotion_pending = None
-
-            # Следующий ход
-            self.current_player = 1 - self.current_player
-
-            # Проверяем состояние игры после превращения
-            self.check = self.is_in_check(self.current_player)
-            if self.is_checkmate():
-                self.game_over = True
-            elif self.is_stalemate():
-                self.game_over = True
+            self.promote(piece_types[piece_index])
 
     def handle_click(self, pos: tuple) -> None:
         """
@@ -431,110 +479,17 @@ class ChessGame:
                 self.selected_piece = (grid_x, grid_y)
                 self.valid_moves = self.get_valid_moves_for_piece(grid_x, grid_y)
 
-    def make_move(self, start_pos: tuple, end_pos: tuple) -> None:
-        """
-        Выполнить ход на доске
-
-        Args:
-            start_pos: начальная позиция (x, y)
-            end_pos: конечная позиция (x, y)
-        """
-        start_x, start_y = start_pos
-        end_x, end_y = end_pos
-
-        moving_piece = self.board[start_y][start_x]
-
-        # Обработка взятия на проходе
-        if isinstance(moving_piece, Pawn) and end_pos == self.en_passant:
-            # Удалить взятую пешку
-            capture_y = end_y + 1 if moving_piece.color == 0 else end_y - 1
-            self.board[capture_y][end_x] = None
-
-        # Обработка рокировки
-        if isinstance(moving_piece, King) and abs(end_x - start_x) == 2:
-            # Короткая рокировка
-            if end_x > start_x:
-                rook = self.board[start_y][7]
-                self.board[start_y][5] = rook
-                self.board[start_y][7] = None
-                if rook:
-                    rook.has_moved = True
-            # Длинная рокировка
-            else:
-                rook = self.board[start_y][0]
-                self.board[start_y][3] = rook
-                self.board[start_y][0] = None
-                if rook:
-                    rook.has_moved = True
-
-        # Обновление позиции фигуры
-        self.board[end_y][end_x] = moving_piece
-        self.board[start_y][start_x] = None
-        moving_piece.has_moved = True
-
-        # Проверка на превращение пешки
-        if isinstance(moving_piece, Pawn) and moving_piece.should_promote(end_y):
-            self.promotion_pending = (end_x, end_y)
+    def take_back(self) -> None:
+        """Отменить последний ход (в том числе ход, ожидающий выбора фигуры превращения)"""
+        if not self.history:
             return
 
-        # Установка цели для взятия на проходе
-        if (isinstance(moving_piece, Pawn) and
-                abs(end_y - start_y) == 2):
-            self.en_passant = (start_x, (start_y + end_y) // 2)
-        else:
-            self.en_passant = None
-
-        # Смена игрока
-        self.current_player = 1 - self.current_player
-
-        # Проверка окончания игры
-        self.check = self.is_in_check(self.current_player)
-        if self.is_checkmate():
-            self.game_over = True
-        elif self.is_stalemate():
-            self.game_over = True
-
-    def is_checkmate(self) -> bool:
-        """
-        Проверить, находится ли текущий игрок в мате
-
-        Returns:
-            bool: True если мат
-        """
-        if not self.is_in_check(self.current_player):
-            return False
-
-        # Проверить, может ли любой ход вывести из-под шаха
-        for row in range(board_size):
-            for col in range(board_size):
-                piece = self.board[row][col]
-                if piece is not None and piece.color == self.current_player:
-                    moves = self.get_valid_moves_for_piece(col, row)
-                    if moves:
-                        return False
-
-        return True
-
-    def is_stalemate(self) -> bool:
-        """
-        Проверить, находится ли текущий игрок в пате
-
-        Returns:
-            bool: True если пат
-        """
-        if self.is_in_check(self.current_player):
-            return False
-
-        # Проверить, существует ли любой допустимый ход
-        for row in range(board_size):
-            for col in range(board_size):
-                piece = self.board[row][col]
-                if piece is not None and piece.color == self.current_player:
-                    moves = self.get_valid_moves_for_piece(col, row)
-                    if moves:
-                        return False
-
-        return True
+        self.pop()
+        self.selected_piece = None
+        self.valid_moves = []
+        # Сохраненное состояние могло быть предварительным - берем его из кэша анализа
+        if self.analysis is not None and not self.promotion_pending:
+            self.update_status()
 
     def draw_game_state(self) -> None:
         """Отрисовка текста состояния игры"""
@@ -542,14 +497,13 @@ class ChessGame:
             return
 
         if self.game_over:
-            if self.is_checkmate():
-                winner = "Черные" if self.current_player == 0 else "Белые"
+            if self.status.checkmate:
+                winner = "Черные" if self.status.winner == 1 else "Белые"
                 text = f"{winner} побеждают матом!"
             else:
-                text = "Пат - Ничья!"
+                text = draw_messages[self.status.draw_reason]
 
-            font = pygame.font.SysFont(None, 36)
-            text_surface = font.render(text, True, (255, 255, 255))
+            text_surface = text_cache.render(text, 36, (255, 255, 255))
             text_rect = text_surface.get_rect(center=(window_size // 2, window_size // 2))
 
             # Отрисовка фона для текста
@@ -558,41 +512,163 @@ class ChessGame:
                               text_rect.width + 20, text_rect.height + 20))
             screen.blit(text_surface, text_rect)
 
-        elif self.check:
-            font = pygame.font.SysFont(None, 24)
+        elif self.status.check:
             text = f"{'Белые' if self.current_player == 0 else 'Черные'} под шахом!"
-            text_surface = font.render(text, True, (255, 0, 0))
+            text_surface = text_cache.render(text, 24, (255, 0, 0))
             screen.blit(text_surface, (10, 10))
 
 
+def instrument(profiler: Profiler) -> None:
+    """Подключить таймеры отрисовки и счетчики вызовов правил"""
+    for name in ('draw_board', 'draw_pieces', 'draw_highlights', 'draw_fog_of_war', 'draw_check_indicator',
+                 'draw_game_state', 'draw_promotion_menu'):
+        profiler.time_stage(ChessGame, name)
+    for piece_class in (Pawn, Knight, Bishop, Rook, Queen, King):
+        profiler.count_calls(piece_class, 'get_valid_moves')
+    profiler.count_calls(Game, 'is_in_check')
+    profiler.count_calls(Game, 'generate_moves')
+    profiler.count_calls(Game, 'make_packed_move')
+    profiler.mark_moves(Game, 'make_move')
+
+
 def main() -> None:
     """Главная функция игры"""
-    game = ChessGame()
+    parser = argparse.ArgumentParser(description='Шахматы с туманом войны')
+    parser.add_argument('--ai', choices=('white', 'black'), help='цвет, которым играет компьютер')
+    parser.add_argument('--time', type=float, default=1.0, help='время компьютера на ход в секундах')
+    parser.add_argument('--fog', action='store_true',
+                        help='компьютер видит только то, что не скрыто туманом войны')
+    parser.add_argument('--book', help='дебютная книга компьютера (без тумана войны, см. book.py)')
+    parser.add_argument('--tablebases', help='каталог эндшпильных таблиц компьютера (без тумана войны)')
+    parser.add_argument('--instrument', action='store_true',
+                        help='показывать FPS, время отрисовки и количество вызовов правил')
+    parser.add_argument('--trace', help='записать кадры и счетчики в файл .json или .csv (включает --instrument)')
+    parser.add_argument('--profile', nargs='?', const='profile.out', metavar='FILE',
+                        help='запустить игру под cProfile и сохранить статистику в файл')
+    args = parser.parse_args()
+
+    if args.profile:
+        profile = cProfile.Profile()
+        try:
+            profile.runcall(play, args)
+        finally:
+            profile.dump_stats(args.profile)
+            pstats.Stats(profile).sort_stats('cumulative').print_stats(25)
+    else:
+        play(args)
+
+
+def play(args: argparse.Namespace) -> None:
+    """
+    Игровая сессия: окно, цикл событий и компьютер
+
+    Args:
+        args: параметры командной строки
+    """
+    ai_color = {'white': 0, 'black': 1}.get(args.ai)
+    engine = None
+    if ai_color is not None:
+        if args.fog:
+            engine = FogEngine(time_limit=args.time)
+        else:
+            engine = Engine(time_limit=args.time, book=OpeningBook(args.book) if args.book else None,
+                            tablebases=Tablebases(args.tablebases) if args.tablebases else None)
+    search = None
+
+    # Без профилирования методы не оборачиваются и ничего не стоят
+    profiler = None
+    if args.instrument or args.trace:
+        profiler = Profiler()
+        instrument(profiler)
+
+    init_display()
+
+    # Поток анализа будит цикл событий, когда ходы и состояние новой позиции готовы
+    analysis_ready_event = pygame.event.custom_type()
+    analysis = AnalysisService(
+        on_ready=lambda key: pygame.event.post(pygame.event.Event(analysis_ready_event, key=key)))
+
+    # Против компьютера доска всегда показывается так, как ее видит человек
+    game = ChessGame(viewer=None if ai_color is None else 1 - ai_color, analysis=analysis)
+    sprite_atlas.rebuild((piece_image_size, promotion_image_size))
+    renderer = BoardRenderer(game, screen, square_size)
     running = True
 
+    # Поток поиска будит цикл событий, когда ход найден
+    engine_move_event = pygame.event.custom_type()
+
+    def post_engine_move(finished: BackgroundSearch, move: int) -> None:
+        pygame.event.post(pygame.event.Event(engine_move_event, search=finished, move=move))
+
+    if profiler is not None:
+        profiler.begin_frame()
     while running:
-        for event in pygame.event.get():
+        # Перерисовываются только изменившиеся клетки
+        previous_overlay = profiler.overlay_rect if profiler is not None else None
+        if previous_overlay is not None:
+            # Клетки под прошлой сводкой рисуются заново: новая сводка может быть меньше
+            renderer.invalidate_area(previous_overlay)
+        dirty_rects = renderer.render()
+        if profiler is not None:
+            dirty_rects.append(profiler.draw_overlay(screen, font_registry))
+        if previous_overlay is not None:
+            dirty_rects.append(previous_overlay)
+        if dirty_rects:
+            pygame.display.update(dirty_rects)
+        # Кадр - обработка событий и отрисовка, без ожидания следующего события
+        if profiler is not None:
+            profiler.end_frame()
+        clock.tick(fps)
+
+        # Ход компьютера ищется в отдельном потоке, окно продолжает обрабатывать события
+        if (search is None and game.current_player == ai_color and not game.analysis_pending and
+                not game.game_over and not game.promotion_pending):
+            search = BackgroundSearch(engine, game, post_engine_move)
+
+        # Если событий нет, процесс спит до следующего ввода вместо перерисовки
+        events = [pygame.event.wait()] + pygame.event.get()
+        if profiler is not None:
+            profiler.begin_frame()
+        for event in events:
             if event.type == pygame.QUIT:
                 running = False
+            elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                renderer.invalidate()
+            elif event.type == analysis_ready_event:
+                result = analysis.get(event.key)
+                if result is not None:
+                    game.apply_analysis(result)
+            elif event.type == engine_move_event:
+                if event.search is search:
+                    search = None
+                # Результат устаревшего поиска (например после возврата хода) не применяется
+                if (not event.search.cancelled and event.move is not None and
+                        event.search.key == game.hash):
+                    game.make_packed_move(event.move)
             elif event.type == pygame.MOUSEBUTTONDOWN:
-                if event.button == 1:
+                if event.button == 1 and game.current_player != ai_color:
                     game.handle_click(event.pos)
-
-        # Отрисовка всего (основные элементы)
-        game.draw_board()
-        game.draw_pieces()
-        game.draw_highlights()
-        game.draw_fog_of_war()
-        game.draw_check_indicator()
-        game.draw_game_state()
-
-        if game.promotion_pending:
-            game.draw_promotion_menu()
-
-        pygame.display.flip()
-        clock.tick(fps)
-
+            elif event.type == pygame.KEYDOWN:
+                # Backspace или Ctrl+Z - вернуть ход
+                if (event.key == pygame.K_BACKSPACE or
+                        (event.key == pygame.K_z and event.mod & pygame.KMOD_CTRL)):
+                    if search is not None:
+                        search.cancel()
+                    game.take_back()
+                    # Против компьютера возвращается и его ответ, чтобы снова ходил человек
+                    if game.current_player == ai_color:
+                        game.take_back()
+
+    if search is not None:
+        search.cancel()
+    if isinstance(engine, FogEngine):
+        engine.close()
+    analysis.close()
+    if profiler is not None:
+        if args.trace:
+            profiler.export(args.trace)
+        profiler.uninstall()
     pygame.quit()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
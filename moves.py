@@ -0,0 +1,117 @@
+from itertools import islice
+
+# Упакованный ход - целое число в 16 битах:
+#   биты 0-5   - клетка, откуда ходит фигура (y * 8 + x)
+#   биты 6-11  - клетка, куда ходит фигура
+#   биты 12-13 - фигура превращения (promotion_symbols)
+#   биты 14-15 - вид хода (flag_*)
+
+flag_normal = 0
+flag_promotion = 1
+flag_en_passant = 2
+flag_castling = 3
+
+promotion_symbols = ('N', 'B', 'R', 'Q')
+
+# Самое большое известное количество допустимых ходов в одной позиции - 218
+max_moves = 256
+
+
+def encode_move(start: int, end: int, flag: int = flag_normal, promotion: str = None) -> int:
+    """
+    Упаковать ход в целое число
+
+    Args:
+        start: номер клетки, откуда ходит фигура
+        end: номер клетки, куда ходит фигура
+        flag: вид хода
+        promotion: фигура превращения ('Q', 'R', 'B', 'N') для flag_promotion
+
+    Returns:
+        int: упакованный ход
+    """
+    move = start | (end << 6) | (flag << 14)
+    if promotion is not None:
+        move |= promotion_symbols.index(promotion) << 12
+    return move
+
+
+def move_start(move: int) -> int:
+    """Клетка, откуда ходит фигура"""
+    return move & 63
+
+
+def move_end(move: int) -> int:
+    """Клетка, куда ходит фигура"""
+    return (move >> 6) & 63
+
+
+def move_flag(move: int) -> int:
+    """Вид хода"""
+    return move >> 14
+
+
+def move_promotion(move: int) -> str:
+    """Фигура превращения или None, если ход не превращение"""
+    if move >> 14 != flag_promotion:
+        return None
+    return promotion_symbols[(move >> 12) & 3]
+
+
+def move_coords(move: int) -> tuple:
+    """
+    Распаковать ход в координаты доски
+
+    Returns:
+        tuple: ((x1, y1), (x2, y2), фигура превращения или None)
+    """
+    start = move & 63
+    end = (move >> 6) & 63
+    return (start & 7, start >> 3), (end & 7, end >> 3), move_promotion(move)
+
+
+def square_name(square: int) -> str:
+    """Название клетки в алгебраической нотации (например, e2)"""
+    return f"{chr(ord('a') + (square & 7))}{8 - (square >> 3)}"
+
+
+def move_name(move: int) -> str:
+    """Ход в координатной нотации (например, e2e4 или e7e8q)"""
+    promotion = move_promotion(move)
+    return square_name(move_start(move)) + square_name(move_end(move)) + (promotion.lower() if promotion else '')
+
+
+class MoveBuffer:
+    """Заранее выделенный буфер ходов, который переиспользуется между позициями"""
+
+    __slots__ = ('moves', 'count')
+
+    def __init__(self, capacity: int = max_moves) -> None:
+        """
+        Инициализация буфера
+
+        Args:
+            capacity: максимальное количество ходов
+        """
+        self.moves = [0] * capacity
+        self.count = 0
+
+    def clear(self) -> None:
+        """Очистить буфер (память не освобождается)"""
+        self.count = 0
+
+    def append(self, move: int) -> None:
+        """Добавить упакованный ход"""
+        self.moves[self.count] = move
+        self.count += 1
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index: int) -> int:
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return self.moves[index]
+
+    def __iter__(self):
+        return islice(self.moves, self.count)
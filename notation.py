@@ -0,0 +1,326 @@
+import re
+
+from moves import flag_castling, move_coords, square_name
+from rules import Game, start_fen
+
+# Стандартная алгебраическая нотация (SAN) и запись партий в PGN
+
+# Обязательные теги PGN в порядке записи
+seven_tag_roster = ('Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result')
+
+results = ('1-0', '0-1', '1/2-1/2', '*')
+
+# Ширина строки с ходами в экспортируемом PGN
+pgn_line_width = 80
+
+tag_pattern = re.compile(r'^\[(\w+)\s+"((?:[^"\\]|\\.)*)"\]\s*$')
+move_number_pattern = re.compile(r'^\d+\.+')
+# Ход в SAN без знаков шаха: фигура, необязательное уточнение (вертикаль, горизонталь или обе),
+# необязательный знак взятия, клетка и фигура превращения (в любом регистре, '=' необязателен)
+san_pattern = re.compile(r'^([KQRBN])?([a-h])?([1-8])?x?([a-h][1-8])=?([QRBNqrbn])?$')
+
+
+def move_to_san(game: Game, move: int) -> str:
+    """
+    Записать ход в стандартной алгебраической нотации
+
+    Args:
+        game: партия в позиции до хода
+        move: упакованный ход (допустимый в этой позиции)
+
+    Returns:
+        str: ход в SAN (например Nbd7, exd5, e8=Q+, O-O-O#)
+    """
+    san = san_without_check(game, move)
+
+    # Шах или мат определяются пробным ходом
+    game.push(move)
+    if game.is_in_check(game.current_player):
+        san += '+' if game.generate_legal_moves() else '#'
+    game.pop()
+    return san
+
+
+def san_without_check(game: Game, move: int) -> str:
+    """Записать ход в SAN без знаков шаха и мата"""
+    (start_x, start_y), (end_x, end_y), promotion = move_coords(move)
+    piece = game.board[start_y][start_x]
+    target = square_name(end_y * 8 + end_x)
+
+    if move >> 14 == flag_castling:
+        san = 'O-O' if end_x > start_x else 'O-O-O'
+    else:
+        capture = game.board[end_y][end_x] is not None or (piece.symbol == 'P' and end_x != start_x)
+        if piece.symbol == 'P':
+            san = (square_name(start_y * 8 + start_x)[0] + 'x' if capture else '') + target
+            if promotion is not None:
+                san += '=' + promotion
+        else:
+            # Уточнение, если на ту же клетку может пойти другая такая же фигура
+            rivals = [start for start, end in game.generate_legal_moves()
+                      if end == (end_x, end_y) and start != (start_x, start_y) and
+                      game.board[start[1]][start[0]].symbol == piece.symbol]
+            prefix = ''
+            if rivals:
+                origin = square_name(start_y * 8 + start_x)
+                if all(x != start_x for x, y in rivals):
+                    prefix = origin[0]
+                elif all(y != start_y for x, y in rivals):
+                    prefix = origin[1]
+                else:
+                    prefix = origin
+            san = piece.symbol + prefix + ('x' if capture else '') + target
+    return san
+
+
+def strip_san(san: str) -> str:
+    """Убрать из SAN знаки шаха, мата и оценки хода (и '=' перед фигурой превращения)"""
+    return san.rstrip('+#!?').replace('0', 'O').replace('=', '')
+
+
+def san_to_move(game: Game, san: str) -> int:
+    """
+    Найти допустимый ход по записи в SAN
+
+    Args:
+        game: партия в позиции до хода
+        san: ход в SAN (знаки шаха и оценки не обязательны)
+
+    Returns:
+        int: упакованный ход
+
+    Raises:
+        ValueError: если запись некорректна, такого допустимого хода нет или ходов несколько
+    """
+    wanted = strip_san(san)
+    if wanted in ('O-O', 'O-O-O'):
+        for move in game.generate_moves():
+            if move >> 14 == flag_castling and san_without_check(game, move) == wanted:
+                return move
+        raise ValueError(f"Недопустимый ход {san} в позиции {game.to_fen()}")
+
+    match = san_pattern.match(wanted)
+    if match is None:
+        raise ValueError(f"Некорректная запись хода {san}")
+    symbol, file, rank, target, promotion = match.groups()
+    symbol = symbol or 'P'
+    promotion = promotion.upper() if promotion else None
+
+    # Лишнее уточнение (например Ngf3, когда на f3 может пойти только один конь) допускается:
+    # ход принимается, если записи соответствует ровно один допустимый ход
+    found = []
+    for move in game.generate_moves():
+        if move >> 14 == flag_castling:
+            continue
+        (start_x, start_y), (end_x, end_y), move_promotion = move_coords(move)
+        origin = square_name(start_y * 8 + start_x)
+        if (game.board[start_y][start_x].symbol == symbol and square_name(end_y * 8 + end_x) == target and
+                move_promotion == promotion and (file is None or origin[0] == file) and
+                (rank is None or origin[1] == rank)):
+            found.append(move)
+    if len(found) != 1:
+        reason = 'Неоднозначный' if found else 'Недопустимый'
+        raise ValueError(f"{reason} ход {san} в позиции {game.to_fen()}")
+    return found[0]
+
+
+def game_result(game: Game) -> str:
+    """Результат партии для тега Result"""
+    if game.status.checkmate:
+        return '1-0' if game.status.winner == 0 else '0-1'
+    if game.status.is_draw():
+        return '1/2-1/2'
+    return '*'
+
+
+def game_to_pgn(game: Game, tags: dict = None) -> str:
+    """
+    Записать партию в PGN по ее истории ходов
+
+    Args:
+        game: партия
+        tags: дополнительные теги (Event, White, Black и т.д.)
+
+    Returns:
+        str: текст PGN
+    """
+    tags = dict(tags or {})
+    tags.setdefault('Result', game_result(game))
+    header = {name: tags.pop(name, '?') for name in seven_tag_roster}
+    header['Result'] = header['Result'] if header['Result'] != '?' else '*'
+    if game.initial_fen != start_fen:
+        header['SetUp'] = '1'
+        header['FEN'] = game.initial_fen
+    header.update(tags)
+
+    replay = Game.from_fen(game.initial_fen)
+    tokens = []
+    for index, move in enumerate(game.move_history()):
+        if replay.current_player == 0:
+            tokens.append(f"{replay.fullmove_number}.")
+        elif index == 0:
+            tokens.append(f"{replay.fullmove_number}...")
+        tokens.append(move_to_san(replay, move))
+        replay.push(move)
+    tokens.append(header['Result'])
+
+    lines = [f'[{name} "{escape_tag(value)}"]' for name, value in header.items()]
+    lines.append('')
+    line = ''
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > pgn_line_width:
+            lines.append(line)
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    lines.append(line)
+    return '\n'.join(lines) + '\n'
+
+
+def escape_tag(value) -> str:
+    """Экранировать значение тега PGN"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+class PgnGame:
+    """Партия, прочитанная из PGN: теги и ходы в SAN"""
+
+    def __init__(self, tags: dict, moves: list, result: str) -> None:
+        """
+        Инициализация партии
+
+        Args:
+            tags: теги PGN
+            moves: ходы в SAN
+            result: результат из текста ходов
+        """
+        self.tags = tags
+        self.moves = moves
+        self.result = result
+
+    def to_game(self) -> Game:
+        """
+        Воспроизвести партию по правилам
+
+        Returns:
+            Game: партия после всех ходов
+
+        Raises:
+            ValueError: если в записи недопустимый ход
+        """
+        game = Game.from_fen(self.tags.get('FEN', start_fen))
+        for san in self.moves:
+            game.make_packed_move(san_to_move(game, san))
+        return game
+
+
+def iter_pgn(lines):
+    """
+    Читать партии из PGN по одной, не загружая весь файл
+
+    Комментарии, варианты и NAG пропускаются
+
+    Args:
+        lines: открытый текстовый файл или другой итератор строк
+
+    Yields:
+        PgnGame: очередная партия
+    """
+    tags = {}
+    moves = []
+    depth = 0  # вложенность вариантов в скобках
+    in_comment = False
+    has_moves = False
+
+    for line in lines:
+        if in_comment:
+            end = line.find('}')
+            if end < 0:
+                continue
+            line = line[end + 1:]
+            in_comment = False
+
+        stripped = line.strip()
+        if not stripped or stripped.startswith('%'):
+            continue
+
+        match = tag_pattern.match(stripped) if depth == 0 else None
+        if match:
+            # Теги после ходов начинают новую партию, даже если результат не был записан
+            if has_moves:
+                yield PgnGame(tags, moves, '*')
+                tags, moves, has_moves = {}, [], False
+            tags[match.group(1)] = re.sub(r'\\(.)', r'\1', match.group(2))
+            continue
+
+        for token in tokenize_movetext(stripped):
+            if token == '{':
+                in_comment = True
+                break
+            if token == '(':
+                depth += 1
+            elif token == ')':
+                depth = max(depth - 1, 0)
+            elif depth:
+                continue
+            elif token in results:
+                yield PgnGame(tags, moves, token)
+                tags, moves, has_moves = {}, [], False
+            else:
+                moves.append(token)
+                has_moves = True
+
+    if has_moves or tags:
+        yield PgnGame(tags, moves, '*')
+
+
+def tokenize_movetext(text: str) -> list:
+    """
+    Разбить строку с ходами на лексемы
+
+    Однострочные комментарии {...} и ; удаляются, незакрытый { возвращается
+    как отдельная лексема, чтобы продолжить пропуск на следующих строках
+
+    Returns:
+        list: ходы, результаты и скобки вариантов
+    """
+    tokens = []
+    position = 0
+    while position < len(text):
+        char = text[position]
+        if char == ';':
+            break
+        if char == '{':
+            end = text.find('}', position)
+            if end < 0:
+                tokens.append('{')
+                break
+            position = end + 1
+            continue
+        if char in '()':
+            tokens.append(char)
+            position += 1
+            continue
+        if char.isspace():
+            position += 1
+            continue
+
+        end = position
+        while end < len(text) and not text[end].isspace() and text[end] not in '(){;':
+            end += 1
+        word = move_number_pattern.sub('', text[position:end])
+        if word and not word.startswith('$'):
+            tokens.append(word)
+        position = end
+    return tokens
+
+
+def read_pgn(path: str):
+    """
+    Читать партии из файла PGN по одной
+
+    Yields:
+        PgnGame: очередная партия
+    """
+    with open(path, encoding='utf-8', errors='replace') as file:
+        yield from iter_pgn(file)
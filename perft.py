@@ -0,0 +1,150 @@
+import argparse
+import sys
+import time
+
+from moves import MoveBuffer, move_name
+from rules import Game, start_fen
+
+# Эталонные позиции и известные количества узлов по глубинам (1, 2, 3, ...).
+# Позиции проверяют рокировку, взятие на проходе, превращение и связки
+reference_positions = [
+    ('Начальная позиция', start_fen,
+     [20, 400, 8902, 197281, 4865609]),
+    ('Kiwipete: рокировки, взятие на проходе, связки',
+     'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+     [48, 2039, 97862, 4085603]),
+    ('Эндшпиль: горизонтальная связка при взятии на проходе',
+     '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+     [14, 191, 2812, 43238, 674624]),
+    ('Превращение со взятием и шахи',
+     'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+     [6, 264, 9467, 422333]),
+    ('Превращение с шахом и потеря права на рокировку',
+     'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+     [44, 1486, 62379, 2103487]),
+    ('Миттельшпиль без рокировок',
+     'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+     [46, 2079, 89890, 3894594]),
+]
+
+
+def perft(game: Game, depth: int, buffers: list = None) -> int:
+    """
+    Посчитать количество листовых узлов дерева ходов заданной глубины
+
+    Args:
+        game: партия в исходной позиции (после подсчета позиция не меняется)
+        depth: глубина перебора в полуходах
+        buffers: буферы ходов для каждого уровня (создаются один раз на весь подсчет)
+
+    Returns:
+        int: количество узлов
+    """
+    if depth == 0:
+        return 1
+    if buffers is None:
+        buffers = [MoveBuffer() for _ in range(depth + 1)]
+
+    moves = game.generate_moves(buffers[depth])
+    if depth == 1:
+        return len(moves)
+
+    nodes = 0
+    for move in moves:
+        game.push(move)
+        nodes += perft(game, depth - 1, buffers)
+        game.pop()
+    return nodes
+
+
+def divide(game: Game, depth: int) -> dict:
+    """
+    Посчитать узлы отдельно для каждого хода из корня
+
+    Returns:
+        dict: ход в координатной нотации -> количество узлов
+    """
+    results = {}
+    buffers = [MoveBuffer() for _ in range(depth + 1)]
+    for move in list(game.generate_moves()):
+        game.push(move)
+        results[move_name(move)] = perft(game, depth - 1, buffers)
+        game.pop()
+    return results
+
+
+def timed_perft(fen: str, depth: int) -> tuple:
+    """
+    Выполнить perft и измерить время
+
+    Returns:
+        tuple: (количество узлов, время в секундах)
+    """
+    game = Game.from_fen(fen)
+    start_time = time.perf_counter()
+    nodes = perft(game, depth)
+    return nodes, time.perf_counter() - start_time
+
+
+def run_suite(max_depth: int) -> bool:
+    """
+    Проверить генератор ходов на эталонных позициях
+
+    Args:
+        max_depth: максимальная глубина для каждой позиции
+
+    Returns:
+        bool: True, если все количества совпали с эталоном
+    """
+    passed = True
+    total_nodes = 0
+    total_time = 0.0
+
+    for name, fen, expected in reference_positions:
+        print(name)
+        print(f"  {fen}")
+        for depth, expected_nodes in enumerate(expected[:max_depth], start=1):
+            nodes, elapsed = timed_perft(fen, depth)
+            total_nodes += nodes
+            total_time += elapsed
+            status = 'OK' if nodes == expected_nodes else f'ОШИБКА (ожидалось {expected_nodes})'
+            print(f"  глубина {depth}: {nodes} узлов, {elapsed:.2f} с - {status}")
+            passed = passed and nodes == expected_nodes
+
+    if total_time > 0:
+        print(f"Всего: {total_nodes} узлов за {total_time:.2f} с, {total_nodes / total_time:.0f} узлов/с")
+    return passed
+
+
+def main() -> None:
+    """Запуск perft из командной строки"""
+    parser = argparse.ArgumentParser(description='Perft: подсчет узлов дерева ходов для проверки и замера генератора')
+    parser.add_argument('--fen', default=start_fen, help='позиция в нотации FEN')
+    parser.add_argument('--depth', type=int, default=3, help='глубина перебора')
+    parser.add_argument('--divide', action='store_true', help='вывести количество узлов для каждого хода из корня')
+    parser.add_argument('--suite', action='store_true', help='проверить эталонные позиции до глубины --depth')
+    args = parser.parse_args()
+
+    if args.suite:
+        sys.exit(0 if run_suite(args.depth) else 1)
+
+    if args.divide:
+        game = Game.from_fen(args.fen)
+        start_time = time.perf_counter()
+        results = divide(game, args.depth)
+        elapsed = time.perf_counter() - start_time
+        for move in sorted(results):
+            print(f"{move}: {results[move]}")
+        nodes = sum(results.values())
+        print(f"\nХодов: {len(results)}")
+    else:
+        nodes, elapsed = timed_perft(args.fen, args.depth)
+
+    nps = nodes / elapsed if elapsed > 0 else 0
+    print(f"Узлов: {nodes}")
+    print(f"Время: {elapsed:.3f} с")
+    print(f"Скорость: {nps:.0f} узлов/с")
+
+
+if __name__ == '__main__':
+    main()
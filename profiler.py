@@ -0,0 +1,221 @@
+import csv
+import functools
+import json
+import threading
+import time
+from collections import deque
+
+import pygame
+
+from fonts import FontRegistry
+
+# Встроенное профилирование по кадрам: время каждого draw_* и количество вызовов правил.
+# Методы оборачиваются только при install(), поэтому без профилирования игра работает
+# с исходными методами и не платит ничего
+
+# Сколько последних кадров учитывать в FPS и процентилях
+window_frames = 600
+
+overlay_font_size = 20
+overlay_color = (255, 255, 0)
+overlay_background = (0, 0, 0)
+
+
+def percentile(values: list, fraction: float) -> float:
+    """Процентиль отсортированного списка (ближайшее значение)"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class Profiler:
+    """Таймеры этапов кадра, счетчики вызовов по кадрам и ходам, экспорт трассы"""
+
+    def __init__(self) -> None:
+        """Инициализация пустой трассы"""
+        self.frames = []  # записи кадров для экспорта
+        self.moves = []  # счетчики вызовов между ходами
+        self.recent = deque(maxlen=window_frames)  # (начало кадра, длительность) последних кадров
+        self.stages = {}  # этап -> секунды в текущем кадре
+        self.counters = {}  # счетчик -> вызовы в текущем кадре
+        self.move_counters = {}  # счетчик -> вызовы с последнего хода
+        # Счетчики меняются из потоков анализа и поиска, а сменяются в потоке окна
+        self.counters_lock = threading.Lock()
+        self.frame_started = None
+        self.installed = []  # (класс, имя, исходный атрибут) для uninstall
+        self.overlay_rect = None  # область сводки на последнем кадре
+
+    def install(self, cls: type, name: str, wrapper) -> None:
+        """
+        Заменить метод класса оберткой
+
+        Args:
+            cls: класс
+            name: имя метода
+            wrapper: функция, которая по исходному методу возвращает обертку
+        """
+        original = cls.__dict__.get(name)
+        self.installed.append((cls, name, original))
+        setattr(cls, name, wrapper(getattr(cls, name)))
+
+    def uninstall(self) -> None:
+        """Вернуть исходные методы"""
+        for cls, name, original in reversed(self.installed):
+            if original is None:
+                delattr(cls, name)
+            else:
+                setattr(cls, name, original)
+        self.installed.clear()
+
+    def time_stage(self, cls: type, name: str) -> None:
+        """Накапливать время вызовов метода в этапе кадра с именем метода"""
+        def wrapper(function):
+            @functools.wraps(function)
+            def timed(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - started
+            return timed
+
+        self.install(cls, name, wrapper)
+
+    def count_calls(self, cls: type, name: str, counter: str = None) -> None:
+        """Считать вызовы метода за кадр и за ход (из всех потоков)"""
+        counter = counter or name
+
+        def wrapper(function):
+            @functools.wraps(function)
+            def counted(*args, **kwargs):
+                with self.counters_lock:
+                    self.counters[counter] = self.counters.get(counter, 0) + 1
+                    self.move_counters[counter] = self.move_counters.get(counter, 0) + 1
+                return function(*args, **kwargs)
+            return counted
+
+        self.install(cls, name, wrapper)
+
+    def mark_moves(self, cls: type, name: str) -> None:
+        """Закрывать счетчики хода после каждого вызова метода, делающего ход"""
+        def wrapper(function):
+            @functools.wraps(function)
+            def moved(*args, **kwargs):
+                result = function(*args, **kwargs)
+                self.end_move()
+                return result
+            return moved
+
+        self.install(cls, name, wrapper)
+
+    def begin_frame(self) -> None:
+        """Начать кадр (вызовы из других потоков между кадрами засчитываются в этот кадр)"""
+        self.frame_started = time.perf_counter()
+        self.stages = {}
+
+    def end_frame(self) -> None:
+        """Закончить кадр: записать длительность, этапы и счетчики"""
+        if self.frame_started is None:
+            return
+        seconds = time.perf_counter() - self.frame_started
+        self.recent.append((self.frame_started, seconds))
+        with self.counters_lock:
+            # Вызовы из других потоков после конца кадра попадают в новый словарь, а не в записанный
+            counters, self.counters = self.counters, {}
+        self.frames.append({
+            'frame': len(self.frames),
+            'start': round(self.frame_started, 6),
+            'seconds': seconds,
+            'stages': self.stages,
+            'counters': counters,
+        })
+        self.frame_started = None
+
+    def end_move(self) -> None:
+        """Закончить ход: сохранить счетчики вызовов с предыдущего хода"""
+        with self.counters_lock:
+            counters, self.move_counters = self.move_counters, {}
+        self.moves.append({'move': len(self.moves), 'frame': len(self.frames), 'counters': counters})
+
+    def summary(self) -> dict:
+        """
+        Сводка по последним кадрам
+
+        Returns:
+            dict: fps (кадров в секунду за окно) и процентили длительности кадра в миллисекундах
+        """
+        if not self.recent:
+            return {'fps': 0.0, 'p50': 0.0, 'p95': 0.0, 'p99': 0.0}
+        durations = sorted(seconds for started, seconds in self.recent)
+        first = self.recent[0][0]
+        last = self.recent[-1][0] + self.recent[-1][1]
+        span = last - first
+        return {
+            'fps': len(self.recent) / span if span > 0 else 0.0,
+            'p50': percentile(durations, 0.5) * 1000,
+            'p95': percentile(durations, 0.95) * 1000,
+            'p99': percentile(durations, 0.99) * 1000,
+        }
+
+    def overlay_lines(self) -> list:
+        """Строки для вывода поверх окна: FPS, процентили, этапы и счетчики последнего кадра"""
+        summary = self.summary()
+        lines = [f"FPS {summary['fps']:.1f}",
+                 f"кадр p50 {summary['p50']:.2f} p95 {summary['p95']:.2f} p99 {summary['p99']:.2f} мс"]
+        if self.frames:
+            last = self.frames[-1]
+            for stage, seconds in sorted(last['stages'].items(), key=lambda item: -item[1]):
+                lines.append(f"{stage} {seconds * 1000:.2f} мс")
+            for counter, count in sorted(last['counters'].items()):
+                lines.append(f"{counter} {count}")
+        return lines
+
+    def draw_overlay(self, surface, fonts: FontRegistry) -> pygame.Rect:
+        """
+        Нарисовать сводку в правом верхнем углу
+
+        Строки меняются каждый кадр, поэтому рендерятся без кэша надписей. Область сводки
+        считается заново каждый кадр; доску под прошлой областью перерисовывает вызывающий код
+        (см. overlay_rect)
+
+        Args:
+            surface: поверхность дисплея
+            fonts: реестр шрифтов
+
+        Returns:
+            pygame.Rect: область, которую нужно обновить на экране
+        """
+        font = fonts.get(overlay_font_size)
+        surfaces = [font.render(line, True, overlay_color) for line in self.overlay_lines()]
+        width = max(text.get_width() for text in surfaces) + 10
+        height = sum(text.get_height() for text in surfaces) + 10
+        rect = pygame.Rect(surface.get_width() - width, 0, width, height)
+        self.overlay_rect = rect
+
+        surface.fill(overlay_background, rect)
+        y = rect.y + 5
+        for text in surfaces:
+            surface.blit(text, (rect.right - text.get_width() - 5, y))
+            y += text.get_height()
+        return rect
+
+    def export(self, path: str) -> None:
+        """
+        Записать трассу в файл: JSON (кадры и ходы) или CSV (строка на кадр)
+
+        Args:
+            path: путь к файлу, формат определяется по расширению .json или .csv
+        """
+        if path.endswith('.csv'):
+            stages = sorted({stage for frame in self.frames for stage in frame['stages']})
+            counters = sorted({counter for frame in self.frames for counter in frame['counters']})
+            with open(path, 'w', newline='', encoding='utf-8') as file:
+                writer = csv.writer(file)
+                writer.writerow(['frame', 'start', 'seconds'] + stages + counters)
+                for frame in self.frames:
+                    writer.writerow([frame['frame'], frame['start'], f"{frame['seconds']:.6f}"] +
+                                    [f"{frame['stages'].get(stage, 0.0):.6f}" for stage in stages] +
+                                    [frame['counters'].get(counter, 0) for counter in counters])
+        else:
+            with open(path, 'w', encoding='utf-8') as file:
+                json.dump({'summary': self.summary(), 'frames': self.frames, 'moves': self.moves}, file)
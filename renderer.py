@@ -0,0 +1,139 @@
+import pygame
+
+
+class BoardRenderer:
+    """Перерисовка только тех клеток доски, состояние которых изменилось с прошлого кадра"""
+
+    def __init__(self, game, surface, square_size: int) -> None:
+        """
+        Инициализация отрисовщика
+
+        Args:
+            game: шахматная игра, которую нужно отображать
+            surface: поверхность дисплея
+            square_size: размер клетки в пикселях
+        """
+        self.game = game
+        self.surface = surface
+        self.square_size = square_size
+        self.square_states = {}  # (x, y) -> состояние клетки на последнем кадре
+        self.overlay_state = None
+        self.full_redraw = True
+
+    def invalidate(self) -> None:
+        """Запросить полную перерисовку на следующем кадре (например после сворачивания окна)"""
+        self.full_redraw = True
+
+    def invalidate_area(self, rect) -> None:
+        """
+        Перерисовать на следующем кадре клетки под областью (например под сводкой профилировщика)
+
+        Args:
+            rect: pygame.Rect в пикселях окна
+        """
+        size = self.square_size
+        for square in list(self.square_states):
+            col, row = square
+            if rect.colliderect(pygame.Rect(col * size, row * size, size, size)):
+                del self.square_states[square]
+
+    def get_square_states(self) -> dict:
+        """
+        Собрать состояние всех клеток: все, что влияет на их внешний вид
+
+        Returns:
+            dict: (x, y) -> кортеж с фигурой, подсветкой, курсором, туманом и шахом
+        """
+        game = self.game
+        selected = None if game.promotion_pending else game.selected_piece
+        valid_moves = set() if game.promotion_pending else set(game.valid_moves)
+        cursor = game.get_cursor_square()
+        check_square = game.get_check_square()
+
+        states = {}
+        for col, row in game.all_squares():
+            piece = game.board[row][col]
+            square = (col, row)
+            states[square] = (
+                (piece.color, piece.symbol) if piece is not None else None,
+                square == selected,
+                square in valid_moves,
+                square == cursor,
+                game.is_square_visible(col, row),
+                square == check_square
+            )
+        return states
+
+    def get_overlay_state(self) -> tuple:
+        """
+        Получить состояние элементов поверх доски (надписи и меню превращения)
+
+        Returns:
+            tuple: состояние надписей и меню
+        """
+        game = self.game
+        # Цвет игрока влияет только на текст надписи о шахе или конце игры
+        player = game.current_player if (game.status.check or game.game_over) else None
+        return (game.promotion_pending, game.get_promotion_hover(),
+                game.game_over, game.status.check, game.status.draw_reason, player)
+
+    def has_overlay(self) -> bool:
+        """Проверить, отображается ли что-то поверх доски"""
+        game = self.game
+        return bool(game.promotion_pending or game.game_over or game.status.check)
+
+    def draw_overlays(self) -> None:
+        """Отрисовка надписей и меню превращения поверх доски"""
+        self.game.draw_game_state()
+        if self.game.promotion_pending:
+            self.game.draw_promotion_menu()
+
+    def render(self) -> list:
+        """
+        Перерисовать изменившиеся клетки
+
+        Returns:
+            list: прямоугольники, которые нужно передать в pygame.display.update
+                  (пустой список, если ничего не изменилось)
+        """
+        game = self.game
+        states = self.get_square_states()
+        overlay_state = self.get_overlay_state()
+
+        # Изменение надписей или меню затрагивает произвольную область - перерисовываем все
+        if self.full_redraw or overlay_state != self.overlay_state:
+            self.square_states = states
+            self.overlay_state = overlay_state
+            self.full_redraw = False
+
+            game.draw_board()
+            game.draw_pieces()
+            game.draw_highlights()
+            game.draw_fog_of_war()
+            game.draw_check_indicator()
+            self.draw_overlays()
+            return [self.surface.get_rect()]
+
+        dirty = [square for square, state in states.items() if self.square_states.get(square) != state]
+        self.square_states = states
+        if not dirty:
+            return []
+
+        game.draw_board(dirty)
+        game.draw_pieces(dirty)
+        game.draw_highlights(dirty)
+        game.draw_fog_of_war(dirty)
+        game.draw_check_indicator(dirty)
+
+        size = self.square_size
+        rects = [pygame.Rect(col * size, row * size, size, size) for col, row in dirty]
+
+        # Надписи поверх перерисованных клеток восстанавливаем только внутри этих клеток,
+        # чтобы полупрозрачный фон не накладывался сам на себя
+        if self.has_overlay():
+            for rect in rects:
+                self.surface.set_clip(rect)
+                self.draw_overlays()
+            self.surface.set_clip(None)
+
+        return rects
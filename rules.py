@@ -0,0 +1,1196 @@
+from bitboard import BitboardPosition
+from chess_pieces import Pawn, Knight, Bishop, Rook, Queen, King
+from moves import (MoveBuffer, encode_move, flag_castling, flag_en_passant, flag_normal, flag_promotion,
+                   move_coords, promotion_symbols)
+from zobrist import castling_key, en_passant_key, hash_board, piece_key, side_key
+
+# Правила игры без отображения: модуль не импортирует pygame и может работать
+# на сервере, в рабочем процессе или в тестах
+
+board_size = 8
+
+# Направления для поиска атакующих фигур
+knight_offsets = [(2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (1, -2), (-1, 2), (-1, -2)]
+king_offsets = [(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1)]
+orthogonal_directions = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+diagonal_directions = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+# Битбордовое представление позиции для быстрых расчетов
+Position = BitboardPosition
+
+# Начальная позиция в нотации FEN
+start_fen = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+# Угловые клетки ладей и права на рокировку, которые теряются при ходе с них или взятии на них
+castling_corners = {
+    (7, 7): 'white_king_side',
+    (0, 7): 'white_queen_side',
+    (7, 0): 'black_king_side',
+    (0, 0): 'black_queen_side'
+}
+
+# Классы фигур по символу FEN (без учета регистра)
+piece_classes = {'P': Pawn, 'N': Knight, 'B': Bishop, 'R': Rook, 'Q': Queen, 'K': King}
+
+# Ничья по правилу 50 ходов: столько полуходов без взятий и ходов пешкой
+fifty_move_limit = 100
+
+# Ничья при повторении позиции столько раз
+repetition_limit = 3
+
+# Причины ничьей в GameStatus.draw_reason
+draw_reasons = ('stalemate', 'fifty_moves', 'repetition', 'insufficient_material')
+
+
+class GameStatus:
+    """Состояние игры для текущей позиции: вычисляется один раз после хода и читается при отрисовке"""
+
+    def __init__(self, check: bool = False, checkmate: bool = False, stalemate: bool = False,
+                 legal_move_count: int = 0, winner: int = None, draw_reason: str = None) -> None:
+        """
+        Инициализация состояния игры
+
+        Args:
+            check: король стороны, которая ходит, под шахом
+            checkmate: мат
+            stalemate: пат
+            legal_move_count: количество допустимых ходов
+            winner: цвет победителя (0 - белые, 1 - черные) или None
+            draw_reason: причина ничьей из draw_reasons или None
+        """
+        self.check = check
+        self.checkmate = checkmate
+        self.stalemate = stalemate
+        self.legal_move_count = legal_move_count
+        self.winner = winner
+        self.draw_reason = 'stalemate' if stalemate else draw_reason
+
+    def is_draw(self) -> bool:
+        """Проверить, закончилась ли игра вничью"""
+        return self.draw_reason is not None
+
+    def is_over(self) -> bool:
+        """Проверить, закончена ли игра"""
+        return self.checkmate or self.draw_reason is not None
+
+
+class UndoRecord:
+    """Запись в стеке ходов: состояние до хода, достаточное для его отмены"""
+
+    __slots__ = ('start_pos', 'end_pos', 'moving_piece', 'moving_had_moved', 'captured_piece',
+                 'captured_pos', 'rook_move', 'promotion', 'en_passant', 'castling_rights', 'hash',
+                 'current_player', 'promotion_pending', 'halfmove_clock', 'fullmove_number',
+                 'legal_moves_cache', 'status', 'visibility', 'check', 'game_over')
+
+    def __init__(self, game: 'Game', start_pos: tuple, end_pos: tuple, moving_piece, captured_piece) -> None:
+        """
+        Запомнить состояние партии перед ходом
+
+        Args:
+            game: партия
+            start_pos: начальная позиция (x, y)
+            end_pos: конечная позиция (x, y)
+            moving_piece: фигура, которая ходит
+            captured_piece: фигура на конечной клетке или None
+        """
+        self.start_pos = start_pos
+        self.end_pos = end_pos
+        self.moving_piece = moving_piece
+        self.moving_had_moved = moving_piece.has_moved
+        self.captured_piece = captured_piece
+        self.captured_pos = end_pos
+        self.rook_move = None  # (ладья, откуда x, куда x, y, has_moved) при рокировке
+        self.promotion = None  # фигура превращения, когда она выбрана
+        self.en_passant = game.en_passant
+        self.castling_rights = dict(game.castling_rights)
+        self.hash = game.hash
+        self.current_player = game.current_player
+        self.promotion_pending = game.promotion_pending
+        self.halfmove_clock = game.halfmove_clock
+        self.fullmove_number = game.fullmove_number
+        self.legal_moves_cache = game.legal_moves_cache
+        self.status = game.status
+        self.visibility = game.visibility
+        self.check = game.check
+        self.game_over = game.game_over
+
+    def restore(self, game: 'Game') -> None:
+        """Вернуть партию в состояние до хода"""
+        board = game.board
+        start_x, start_y = self.start_pos
+        end_x, end_y = self.end_pos
+        moving_piece = self.moving_piece
+
+        # Фигура возвращается на место (после превращения вместо новой фигуры снова пешка)
+        counts = game.piece_counts
+        promoted = board[end_y][end_x]
+        if promoted is not moving_piece:
+            counts[promoted.color][promoted.symbol] -= 1
+            counts[promoted.color]['P'] += 1
+        board[end_y][end_x] = None
+        board[start_y][start_x] = moving_piece
+        moving_piece.has_moved = self.moving_had_moved
+        if self.captured_piece is not None:
+            captured_x, captured_y = self.captured_pos
+            board[captured_y][captured_x] = self.captured_piece
+            counts[self.captured_piece.color][self.captured_piece.symbol] += 1
+
+        if self.rook_move is not None:
+            rook, rook_from, rook_to, rook_y, rook_had_moved = self.rook_move
+            board[rook_y][rook_to] = None
+            board[rook_y][rook_from] = rook
+            rook.has_moved = rook_had_moved
+
+        if moving_piece.symbol == 'K':
+            game.king_positions[moving_piece.color] = self.start_pos
+
+        game.en_passant = self.en_passant
+        game.castling_rights = self.castling_rights
+        game.hash = self.hash
+        game.current_player = self.current_player
+        game.promotion_pending = self.promotion_pending
+        game.halfmove_clock = self.halfmove_clock
+        game.fullmove_number = self.fullmove_number
+        game.legal_moves_cache = self.legal_moves_cache
+        game.status = self.status
+        game.visibility = self.visibility
+        game.check = self.check
+        game.game_over = self.game_over
+
+    def packed_move(self) -> int:
+        """Ход в упакованном виде (см. moves.py)"""
+        start = self.start_pos[1] * 8 + self.start_pos[0]
+        end = self.end_pos[1] * 8 + self.end_pos[0]
+        if self.promotion is not None:
+            return encode_move(start, end, flag_promotion, self.promotion)
+        if self.rook_move is not None:
+            return encode_move(start, end, flag_castling)
+        if self.captured_pos != self.end_pos:
+            return encode_move(start, end, flag_en_passant)
+        return encode_move(start, end, flag_normal)
+
+
+class Game:
+    """Шахматная партия с туманом войны: доска, ходы и правила без отрисовки"""
+
+    def __init__(self) -> None:
+        """Инициализация партии в начальной позиции"""
+        self.board = [[None for _ in range(board_size)] for _ in range(board_size)]
+        self.current_player = 0  # 0 для белых, 1 для черных
+        self.game_over = False
+        self.check = False
+        self.en_passant = None
+        self.promotion_pending = None  # (x, y) координаты пешки для превращения
+        self.halfmove_clock = 0  # полуходов после последнего взятия или хода пешкой
+        self.fullmove_number = 1  # номер хода, увеличивается после хода черных
+        self.castling_rights = {
+            'white_king_side': True,
+            'white_queen_side': True,
+            'black_king_side': True,
+            'black_queen_side': True
+        }
+        self.visibility = 0  # Маска клеток, видимых текущему игроку
+        self.king_positions = {}  # Цвет -> координаты короля (x, y)
+        self.legal_moves_cache = None  # Допустимые ходы для текущей позиции
+        self.history = []  # Стек UndoRecord для отмены ходов
+        self.earlier_hashes = []  # ключи позиций до начала истории (для повторений после copy)
+        self.initial_fen = start_fen  # позиция, с которой начата история ходов
+        self.status = GameStatus()
+        self.initialize_board()
+        self.piece_counts = self.count_pieces()  # цвет -> символ -> количество, обновляется при ходе
+        self.hash = self.compute_hash()  # Ключ Зобриста, обновляется в make_move
+        self.update_king_positions()
+        self.update_visibility()
+        self.update_status()
+
+    def initialize_board(self) -> None:
+        """Начальная расстановка фигур на доске"""
+        # Пешки
+        for i in range(board_size):
+            self.board[1][i] = Pawn(1)  # Черные пешки
+            self.board[6][i] = Pawn(0)  # Белые пешки
+
+        # Остальные фигуры
+        back_row_order = [Rook, Knight, Bishop, Queen, King, Bishop, Knight, Rook]
+
+        # Черные фигуры (верх)
+        for i, piece_class in enumerate(back_row_order):
+            self.board[0][i] = piece_class(1)
+
+        # Белые фигуры (низ)
+        for i, piece_class in enumerate(back_row_order):
+            self.board[7][i] = piece_class(0)
+
+    @classmethod
+    def from_fen(cls, fen: str) -> 'Game':
+        """
+        Создать партию из позиции в нотации FEN
+
+        Args:
+            fen: строка FEN
+
+        Returns:
+            Game: партия в указанной позиции
+        """
+        game = cls()
+        game.load_fen(fen)
+        return game
+
+    def load_fen(self, fen: str) -> None:
+        """
+        Расставить фигуры по строке FEN
+
+        Args:
+            fen: строка FEN
+        """
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError(f"Некорректная строка FEN: {fen}")
+        placement, side, castling, en_passant = fields[:4]
+
+        rows = placement.split('/')
+        if len(rows) != board_size:
+            raise ValueError(f"Некорректная расстановка в FEN: {placement}")
+
+        board = [[None for _ in range(board_size)] for _ in range(board_size)]
+        for y, row in enumerate(rows):
+            x = 0
+            for char in row:
+                if char.isdigit():
+                    x += int(char)
+                    continue
+                piece_class = piece_classes.get(char.upper())
+                if piece_class is None or x >= board_size:
+                    raise ValueError(f"Некорректная расстановка в FEN: {placement}")
+                board[y][x] = piece_class(0 if char.isupper() else 1)
+                x += 1
+
+        castling_rights = {
+            'white_king_side': 'K' in castling,
+            'white_queen_side': 'Q' in castling,
+            'black_king_side': 'k' in castling,
+            'black_queen_side': 'q' in castling
+        }
+        if en_passant == '-':
+            en_passant = None
+        else:
+            en_passant = (ord(en_passant[0]) - ord('a'), board_size - int(en_passant[1]))
+
+        # Счетчики ходов необязательны (во многих источниках FEN без них)
+        halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+        fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+
+        self.set_position(board, 0 if side == 'w' else 1, castling_rights, en_passant,
+                          halfmove_clock, fullmove_number)
+
+    def set_position(self, board: list, current_player: int, castling_rights: dict, en_passant: tuple,
+                     halfmove_clock: int = 0, fullmove_number: int = 1) -> None:
+        """
+        Установить произвольную позицию и пересчитать все производные данные
+
+        Права на рокировку переводятся во флаги has_moved короля и ладей,
+        которые проверяет King.get_valid_moves
+
+        Args:
+            board: доска с фигурами
+            current_player: цвет стороны, которая ходит
+            castling_rights: права на рокировку (невозможные при данной расстановке снимаются)
+            en_passant: координаты для взятия на проходе или None
+            halfmove_clock: полуходов после последнего взятия или хода пешкой
+            fullmove_number: номер хода
+        """
+        self.board = board
+        # Король и ладьи считаются сходившими, если у них нет права на рокировку
+        for row in board:
+            for piece in row:
+                if piece is not None:
+                    piece.has_moved = piece.symbol in 'KR'
+
+        self.castling_rights = dict(castling_rights)
+        for color, y, king_side, queen_side in ((0, 7, 'white_king_side', 'white_queen_side'),
+                                                (1, 0, 'black_king_side', 'black_queen_side')):
+            for right, rook_x in ((king_side, 7), (queen_side, 0)):
+                king = board[y][4]
+                rook = board[y][rook_x]
+                if (self.castling_rights[right] and isinstance(king, King) and king.color == color and
+                        isinstance(rook, Rook) and rook.color == color):
+                    king.has_moved = False
+                    rook.has_moved = False
+                else:
+                    self.castling_rights[right] = False
+
+        self.current_player = current_player
+        self.update_king_positions()
+        # Клетка взятия на проходе хранится, только если взятие возможно (как в FEN других программ)
+        if en_passant is not None and not self.can_capture_en_passant(en_passant, current_player):
+            en_passant = None
+        self.en_passant = en_passant
+        self.halfmove_clock = halfmove_clock
+        self.fullmove_number = fullmove_number
+        self.promotion_pending = None
+        self.legal_moves_cache = None
+        self.history = []
+        self.earlier_hashes = []
+        self.initial_fen = self.to_fen()
+        self.piece_counts = self.count_pieces()
+        self.hash = self.compute_hash()
+        self.update_visibility()
+        self.update_status()
+
+    def copy(self) -> 'Game':
+        """
+        Создать независимую копию позиции без отрисовки и истории ходов (например для поиска в другом потоке)
+
+        Returns:
+            Game: партия с копиями фигур
+        """
+        game = Game.__new__(Game)
+        game.board = [[None] * board_size for _ in range(board_size)]
+        for y, row in enumerate(self.board):
+            for x, piece in enumerate(row):
+                if piece is not None:
+                    clone = piece_classes[piece.symbol](piece.color)
+                    clone.has_moved = piece.has_moved
+                    game.board[y][x] = clone
+
+        game.current_player = self.current_player
+        game.game_over = self.game_over
+        game.check = self.check
+        game.en_passant = self.en_passant
+        game.promotion_pending = self.promotion_pending
+        game.halfmove_clock = self.halfmove_clock
+        game.fullmove_number = self.fullmove_number
+        game.castling_rights = dict(self.castling_rights)
+        game.visibility = self.visibility
+        game.king_positions = dict(self.king_positions)
+        game.legal_moves_cache = None
+        game.history = []
+        # Ключи прошлых позиций нужны копии, чтобы находить повторения в поиске и анализе
+        game.earlier_hashes = self.recent_hashes()
+        game.initial_fen = self.to_fen()
+        game.piece_counts = [dict(counts) for counts in self.piece_counts]
+        game.status = self.status
+        game.hash = self.hash
+        return game
+
+    def to_fen(self) -> str:
+        """
+        Записать позицию в нотации FEN
+
+        Returns:
+            str: строка FEN со счетчиками ходов
+        """
+        rows = []
+        for row in self.board:
+            text = ''
+            empty = 0
+            for piece in row:
+                if piece is None:
+                    empty += 1
+                    continue
+                if empty:
+                    text += str(empty)
+                    empty = 0
+                text += piece.symbol if piece.color == 0 else piece.symbol.lower()
+            if empty:
+                text += str(empty)
+            rows.append(text)
+
+        castling = ''.join(letter for letter, name in (('K', 'white_king_side'), ('Q', 'white_queen_side'),
+                                                       ('k', 'black_king_side'), ('q', 'black_queen_side'))
+                           if self.castling_rights[name]) or '-'
+        if self.en_passant is None:
+            en_passant = '-'
+        else:
+            en_passant = f"{chr(ord('a') + self.en_passant[0])}{board_size - self.en_passant[1]}"
+
+        side = 'w' if self.current_player == 0 else 'b'
+        return (f"{'/'.join(rows)} {side} {castling} {en_passant} "
+                f"{self.halfmove_clock} {self.fullmove_number}")
+
+    def move_history(self) -> list:
+        """
+        Ходы партии с позиции initial_fen
+
+        Returns:
+            list: упакованные ходы (см. moves.py)
+        """
+        return [record.packed_move() for record in self.history]
+
+    def recent_hashes(self) -> list:
+        """
+        Ключи позиций после последнего необратимого хода (взятия или хода пешкой)
+
+        Returns:
+            list: ключи от старых к новым, без текущей позиции
+        """
+        history = self.history
+        count = min(self.halfmove_clock, len(history) + len(self.earlier_hashes))
+        from_history = min(count, len(history))
+        keys = [record.hash for record in history[len(history) - from_history:]]
+        if count > from_history:
+            keys = self.earlier_hashes[len(self.earlier_hashes) - (count - from_history):] + keys
+        return keys
+
+    def count_pieces(self) -> list:
+        """
+        Посчитать фигуры на доске
+
+        Returns:
+            list: для каждого цвета словарь символ -> количество
+        """
+        counts = [dict.fromkeys(piece_classes, 0), dict.fromkeys(piece_classes, 0)]
+        for row in self.board:
+            for piece in row:
+                if piece is not None:
+                    counts[piece.color][piece.symbol] += 1
+        return counts
+
+    def compute_hash(self) -> int:
+        """
+        Вычислить ключ Зобриста текущей позиции с нуля
+
+        Returns:
+            int: 64-битный ключ (фигуры, очередь хода, права на рокировку, вертикаль взятия на проходе)
+        """
+        return hash_board(self.board, self.current_player, self.castling_rights, self.en_passant)
+
+    def all_squares(self) -> list:
+        """Получить список всех клеток доски в виде (x, y)"""
+        return [(col, row) for row in range(board_size) for col in range(board_size)]
+
+    def get_position(self) -> BitboardPosition:
+        """
+        Получить битбордовое представление текущей позиции
+
+        Returns:
+            BitboardPosition: позиция для быстрой генерации ходов, проверки шаха и тумана войны
+        """
+        return BitboardPosition.from_game(self)
+
+    def compute_visibility(self, color: int = None) -> int:
+        """
+        Вычислить видимость для игрока: его фигуры и все клетки, куда они могут пойти
+
+        Args:
+            color: цвет игрока (по умолчанию - текущий игрок)
+
+        Returns:
+            int: 64-битная маска, бит y * 8 + x установлен для видимой клетки (x, y)
+        """
+        if color is None:
+            color = self.current_player
+        return self.get_position().visibility(color)
+
+    def update_visibility(self) -> None:
+        """Пересчитать маску видимости после изменения позиции или смены хода"""
+        self.visibility = self.compute_visibility()
+
+    def is_square_visible(self, x: int, y: int) -> bool:
+        """Проверить, видна ли клетка (x, y) текущему игроку"""
+        return bool(self.visibility >> (y * board_size + x) & 1)
+
+    def get_visible_squares(self) -> set:
+        """
+        Получить клетки, видимые текущему игроку
+
+        Returns:
+            set: множество координат (x, y)
+        """
+        return {(col, row) for col, row in self.all_squares() if self.is_square_visible(col, row)}
+
+    def locate_king(self, color: int) -> tuple:
+        """
+        Найти короля указанного цвета полным просмотром доски
+
+        Args:
+            color: цвет короля (0 - белый, 1 - черный)
+
+        Returns:
+            tuple: координаты короля (x, y) или None если не найден
+        """
+        for row in range(board_size):
+            for col in range(board_size):
+                piece = self.board[row][col]
+                if isinstance(piece, King) and piece.color == color:
+                    return (col, row)
+        return None
+
+    def update_king_positions(self) -> None:
+        """Заново найти обоих королей (после расстановки фигур)"""
+        self.king_positions = {color: self.locate_king(color) for color in (0, 1)}
+
+    def find_king(self, color: int) -> tuple:
+        """
+        Найти короля указанного цвета
+
+        Позиция короля хранится в кэше и обновляется при каждом его ходе
+
+        Args:
+            color: цвет короля (0 - белый, 1 - черный)
+
+        Returns:
+            tuple: координаты короля (x, y) или None если не найден
+        """
+        return self.king_positions.get(color)
+
+    def is_square_attacked(self, x: int, y: int, by_color: int) -> bool:
+        """
+        Проверить, атакована ли клетка фигурами указанного цвета
+
+        Поиск идет от клетки наружу по лучам, ходам коня, пешки и короля
+        и заканчивается на первом найденном атакующем
+
+        Args:
+            x: координата x клетки
+            y: координата y клетки
+            by_color: цвет атакующих фигур
+
+        Returns:
+            bool: True если клетка атакована
+        """
+        board = self.board
+
+        # Пешки: белая пешка бьет вверх, поэтому атакует клетку снизу
+        pawn_y = y + 1 if by_color == 0 else y - 1
+        if 0 <= pawn_y < board_size:
+            for pawn_x in (x - 1, x + 1):
+                if 0 <= pawn_x < board_size:
+                    piece = board[pawn_y][pawn_x]
+                    if piece is not None and piece.color == by_color and piece.symbol == 'P':
+                        return True
+
+        # Конь и король
+        for offsets, symbol in ((knight_offsets, 'N'), (king_offsets, 'K')):
+            for dx, dy in offsets:
+                new_x, new_y = x + dx, y + dy
+                if 0 <= new_x < board_size and 0 <= new_y < board_size:
+                    piece = board[new_y][new_x]
+                    if piece is not None and piece.color == by_color and piece.symbol == symbol:
+                        return True
+
+        # Дальнобойные фигуры: первая фигура на луче
+        for directions, symbols in ((orthogonal_directions, 'RQ'), (diagonal_directions, 'BQ')):
+            for dx, dy in directions:
+                new_x, new_y = x + dx, y + dy
+                while 0 <= new_x < board_size and 0 <= new_y < board_size:
+                    piece = board[new_y][new_x]
+                    if piece is not None:
+                        if piece.color == by_color and piece.symbol in symbols:
+                            return True
+                        break
+                    new_x += dx
+                    new_y += dy
+
+        return False
+
+    def is_in_check(self, color: int) -> bool:
+        """
+        Проверить, находится ли король указанного цвета под шахом
+
+        Args:
+            color: цвет короля (0 - белый, 1 - черный)
+
+        Returns:
+            bool: True если король под шахом
+        """
+        king_pos = self.find_king(color)
+        if not king_pos:
+            return False
+
+        return self.is_square_attacked(king_pos[0], king_pos[1], 1 - color)
+
+    def find_checks_and_pins(self, color: int) -> tuple:
+        """
+        Найти фигуры, объявляющие шах королю, и связанные фигуры
+
+        Args:
+            color: цвет короля (0 - белый, 1 - черный)
+
+        Returns:
+            tuple: (checkers, pins), где checkers - список множеств клеток, которые закрывают
+                   каждый шах (клетка атакующего и клетки между ним и королем),
+                   а pins - словарь: клетка связанной фигуры -> множество клеток, по которым она может ходить
+        """
+        board = self.board
+        king_x, king_y = self.find_king(color)
+        opponent = 1 - color
+        checkers = []
+        pins = {}
+
+        # Дальнобойные фигуры: шах или связка по лучу от короля
+        for directions, symbols in ((orthogonal_directions, 'RQ'), (diagonal_directions, 'BQ')):
+            for dx, dy in directions:
+                ray = set()
+                blocker = None
+                new_x, new_y = king_x + dx, king_y + dy
+                while 0 <= new_x < board_size and 0 <= new_y < board_size:
+                    ray.add((new_x, new_y))
+                    piece = board[new_y][new_x]
+                    if piece is not None:
+                        if piece.color == color:
+                            if blocker is not None:
+                                break
+                            blocker = (new_x, new_y)
+                        else:
+                            if piece.symbol in symbols:
+                                if blocker is None:
+                                    checkers.append(ray)
+                                else:
+                                    pins[blocker] = ray
+                            break
+                    new_x += dx
+                    new_y += dy
+
+        # Конь и пешка дают шах, который нельзя закрыть
+        pawn_y = king_y - 1 if color == 0 else king_y + 1
+        pawn_squares = [(king_x - 1, pawn_y), (king_x + 1, pawn_y)]
+        knight_squares = [(king_x + dx, king_y + dy) for dx, dy in knight_offsets]
+        for squares, symbol in ((pawn_squares, 'P'), (knight_squares, 'N')):
+            for new_x, new_y in squares:
+                if 0 <= new_x < board_size and 0 <= new_y < board_size:
+                    piece = board[new_y][new_x]
+                    if piece is not None and piece.color == opponent and piece.symbol == symbol:
+                        checkers.append({(new_x, new_y)})
+
+        return checkers, pins
+
+    def is_king_move_safe(self, king_pos: tuple, end_pos: tuple, color: int) -> bool:
+        """
+        Проверить, что король не окажется под боем после хода на клетку end_pos
+
+        Король временно снимается с доски, чтобы дальнобойная фигура, дающая шах,
+        била и клетки за ним на том же луче
+        """
+        king_x, king_y = king_pos
+        king = self.board[king_y][king_x]
+        self.board[king_y][king_x] = None
+        attacked = self.is_square_attacked(end_pos[0], end_pos[1], 1 - color)
+        self.board[king_y][king_x] = king
+        return not attacked
+
+    def is_en_passant_safe(self, start_pos: tuple, end_pos: tuple, color: int) -> bool:
+        """
+        Проверить взятие на проходе пробным ходом
+
+        Со связками по горизонтали (две пешки уходят с одной линии) проще всего разобраться,
+        выполнив ход на доске, а такие ходы встречаются редко
+        """
+        start_x, start_y = start_pos
+        end_x, end_y = end_pos
+        board = self.board
+        pawn = board[start_y][start_x]
+        captured = board[start_y][end_x]
+
+        board[end_y][end_x] = pawn
+        board[start_y][start_x] = None
+        board[start_y][end_x] = None
+        in_check = self.is_in_check(color)
+        board[start_y][start_x] = pawn
+        board[end_y][end_x] = None
+        board[start_y][end_x] = captured
+
+        return not in_check
+
+    def can_capture_en_passant(self, target: tuple, color: int) -> bool:
+        """
+        Проверить, что у стороны есть допустимое взятие на проходе
+
+        Args:
+            target: клетка, через которую прошла пешка соперника
+            color: цвет стороны, которая берет
+
+        Returns:
+            bool: True, если рядом с пешкой соперника стоит своя пешка и взятие не оставляет короля под шахом
+        """
+        x, y = target
+        pawn_y = y + 1 if color == 0 else y - 1
+        if not 0 <= pawn_y < board_size or self.board[y][x] is not None:
+            return False
+        passed = self.board[pawn_y][x]
+        if not isinstance(passed, Pawn) or passed.color == color:
+            return False
+        for pawn_x in (x - 1, x + 1):
+            if 0 <= pawn_x < board_size:
+                piece = self.board[pawn_y][pawn_x]
+                if (isinstance(piece, Pawn) and piece.color == color and
+                        self.is_en_passant_safe((pawn_x, pawn_y), target, color)):
+                    return True
+        return False
+
+    def generate_legal_moves(self) -> list:
+        """
+        Получить все допустимые ходы стороны, которая ходит
+
+        Шахи и связки вычисляются один раз для позиции, после чего каждый ход
+        проверяется по готовым множествам клеток без пробного выполнения
+
+        Returns:
+            list: список ходов ((x1, y1), (x2, y2))
+        """
+        if self.legal_moves_cache is not None:
+            return self.legal_moves_cache
+
+        board = self.board
+        color = self.current_player
+        king_pos = self.find_king(color)
+        moves = []
+
+        if king_pos is None:
+            # Без короля проверять шахи не нужно
+            for row in range(board_size):
+                for col in range(board_size):
+                    piece = board[row][col]
+                    if piece is not None and piece.color == color:
+                        for target in piece.get_valid_moves(board, col, row, self.en_passant):
+                            moves.append(((col, row), target))
+            self.legal_moves_cache = moves
+            return moves
+
+        checkers, pins = self.find_checks_and_pins(color)
+        block_squares = checkers[0] if len(checkers) == 1 else None
+
+        for row in range(board_size):
+            for col in range(board_size):
+                piece = board[row][col]
+                if piece is None or piece.color != color:
+                    continue
+                start = (col, row)
+                targets = piece.get_valid_moves(board, col, row, self.en_passant)
+
+                if start == king_pos:
+                    for target in targets:
+                        if abs(target[0] - col) == 2:
+                            # Рокировка: не из-под шаха и не через атакованное поле
+                            passed = ((col + target[0]) // 2, row)
+                            if (checkers or not self.is_king_move_safe(king_pos, passed, color) or
+                                    not self.is_king_move_safe(king_pos, target, color)):
+                                continue
+                        elif not self.is_king_move_safe(king_pos, target, color):
+                            continue
+                        moves.append((start, target))
+                    continue
+
+                # При двойном шахе может ходить только король
+                if len(checkers) > 1:
+                    continue
+
+                pin_ray = pins.get(start)
+                for target in targets:
+                    if piece.symbol == 'P' and target == self.en_passant and target[0] != col:
+                        if self.is_en_passant_safe(start, target, color):
+                            moves.append((start, target))
+                        continue
+                    if pin_ray is not None and target not in pin_ray:
+                        continue
+                    if block_squares is not None and target not in block_squares:
+                        continue
+                    moves.append((start, target))
+
+        self.legal_moves_cache = moves
+        return moves
+
+    def generate_moves(self, buffer: MoveBuffer = None) -> MoveBuffer:
+        """
+        Получить допустимые ходы стороны, которая ходит, в упакованном виде
+
+        Превращение пешки раскрывается в четыре хода, взятие на проходе и рокировка
+        помечаются флагами (см. moves.py)
+
+        Args:
+            buffer: буфер для ходов (по умолчанию создается новый)
+
+        Returns:
+            MoveBuffer: упакованные ходы
+        """
+        if buffer is None:
+            buffer = MoveBuffer()
+        buffer.clear()
+
+        board = self.board
+        for (start_x, start_y), (end_x, end_y) in self.generate_legal_moves():
+            symbol = board[start_y][start_x].symbol
+            start = start_y * board_size + start_x
+            end = end_y * board_size + end_x
+            if symbol == 'P':
+                if end_y == 0 or end_y == board_size - 1:
+                    for promotion in promotion_symbols:
+                        buffer.append(encode_move(start, end, flag_promotion, promotion))
+                elif end_x != start_x and board[end_y][end_x] is None:
+                    buffer.append(encode_move(start, end, flag_en_passant))
+                else:
+                    buffer.append(start | (end << 6))
+            elif symbol == 'K' and abs(end_x - start_x) == 2:
+                buffer.append(encode_move(start, end, flag_castling))
+            else:
+                buffer.append(start | (end << 6))
+
+        return buffer
+
+    def get_valid_moves_for_piece(self, x: int, y: int, include_checks: bool = True) -> list:
+        """
+        Получить допустимые ходы для фигуры в позиции (x, y)
+
+        Args:
+            x: координата x фигуры
+            y: координата y фигуры
+            include_checks: учитывать ли проверку шаха
+
+        Returns:
+            list: список допустимых ходов
+        """
+        piece = self.board[y][x]
+        if piece is None:
+            return []
+
+        if include_checks and piece.color == self.current_player:
+            return [end for start, end in self.generate_legal_moves() if start == (x, y)]
+
+        # Получить базовые ходы
+        moves = piece.get_valid_moves(self.board, x, y, self.en_passant)
+
+        if not include_checks:
+            return moves
+
+        # Отфильтровать ходы, которые ставят/оставляют короля под шахом
+        valid_moves = []
+        for move_x, move_y in moves:
+            if self.is_move_valid((x, y), (move_x, move_y)):
+                valid_moves.append((move_x, move_y))
+
+        return valid_moves
+
+    def is_move_valid(self, start_pos: tuple, end_pos: tuple) -> bool:
+        """
+        Проверить, является ли ход допустимым (не оставляет короля под шахом)
+
+        Ход выполняется через push() и отменяется через pop(), поэтому
+        взятие на проходе и рокировка проверяются так же, как обычные ходы
+
+        Args:
+            start_pos: начальная позиция (x, y)
+            end_pos: конечная позиция (x, y)
+
+        Returns:
+            bool: True если ход допустим
+        """
+        color = self.board[start_pos[1]][start_pos[0]].color
+
+        # Временное выполнение хода (превращение сразу в ферзя, чтобы ход не ждал выбора)
+        self.history.append(self.apply_move(start_pos, end_pos, 'Q'))
+
+        # Проверить, находится ли король под шахом после хода
+        in_check = self.is_in_check(color)
+
+        # Отменить временный ход
+        self.pop()
+
+        return not in_check
+
+    def apply_move(self, start_pos: tuple, end_pos: tuple, promotion: str = None) -> 'UndoRecord':
+        """
+        Изменить доску, ключ позиции, права на рокировку и очередь хода без пересчета состояния игры
+
+        Args:
+            start_pos: начальная позиция (x, y)
+            end_pos: конечная позиция (x, y)
+            promotion: фигура для превращения пешки или None
+
+        Returns:
+            UndoRecord: все, что нужно для отмены хода
+        """
+        start_x, start_y = start_pos
+        end_x, end_y = end_pos
+
+        moving_piece = self.board[start_y][start_x]
+        captured_piece = self.board[end_y][end_x]
+        record = UndoRecord(self, start_pos, end_pos, moving_piece, captured_piece)
+        self.legal_moves_cache = None
+
+        # Ключ позиции обновляется по разнице: убираем старые права и взятие на проходе
+        key = self.hash ^ castling_key(self.castling_rights) ^ en_passant_key(self.en_passant)
+        key ^= piece_key(moving_piece, start_x, start_y)
+        if captured_piece is not None:
+            key ^= piece_key(captured_piece, end_x, end_y)
+
+        # Обработка взятия на проходе
+        if isinstance(moving_piece, Pawn) and end_pos == self.en_passant:
+            # Удалить взятую пешку
+            capture_y = end_y + 1 if moving_piece.color == 0 else end_y - 1
+            captured_piece = self.board[capture_y][end_x]
+            record.captured_piece = captured_piece
+            record.captured_pos = (end_x, capture_y)
+            key ^= piece_key(captured_piece, end_x, capture_y)
+            self.board[capture_y][end_x] = None
+
+        # Обработка рокировки
+        if isinstance(moving_piece, King) and abs(end_x - start_x) == 2:
+            # Короткая рокировка
+            if end_x > start_x:
+                rook_from, rook_to = 7, 5
+            # Длинная рокировка
+            else:
+                rook_from, rook_to = 0, 3
+            rook = self.board[start_y][rook_from]
+            self.board[start_y][rook_to] = rook
+            self.board[start_y][rook_from] = None
+            if rook:
+                record.rook_move = (rook, rook_from, rook_to, start_y, rook.has_moved)
+                rook.has_moved = True
+                key ^= piece_key(rook, rook_from, start_y) ^ piece_key(rook, rook_to, start_y)
+
+        # Обновление позиции фигуры
+        self.board[end_y][end_x] = moving_piece
+        self.board[start_y][start_x] = None
+        moving_piece.has_moved = True
+        key ^= piece_key(moving_piece, end_x, end_y)
+        if isinstance(moving_piece, King):
+            self.king_positions[moving_piece.color] = end_pos
+
+        # Права на рокировку теряются при ходе короля, ходе ладьи из угла или взятии в углу
+        if isinstance(moving_piece, King):
+            side = 'white' if moving_piece.color == 0 else 'black'
+            self.castling_rights[f'{side}_king_side'] = False
+            self.castling_rights[f'{side}_queen_side'] = False
+        for square in (start_pos, end_pos):
+            right = castling_corners.get(square)
+            if right is not None:
+                self.castling_rights[right] = False
+        key ^= castling_key(self.castling_rights)
+
+        # Счетчик полуходов для правила 50 ходов обнуляется взятием и ходом пешки
+        captured_piece = record.captured_piece
+        if captured_piece is not None:
+            self.piece_counts[captured_piece.color][captured_piece.symbol] -= 1
+            self.halfmove_clock = 0
+        elif isinstance(moving_piece, Pawn):
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+
+        # Проверка на превращение пешки
+        if isinstance(moving_piece, Pawn) and moving_piece.should_promote(end_y):
+            self.en_passant = None
+            self.hash = key
+            self.promotion_pending = (end_x, end_y)
+            if promotion is not None:
+                record.promotion = promotion
+                self.replace_promoted_pawn(promotion)
+            return record
+
+        # Установка цели для взятия на проходе: только если соперник может ее взять,
+        # иначе одинаковые позиции отличались бы ключом и записью FEN
+        self.en_passant = None
+        if isinstance(moving_piece, Pawn) and abs(end_y - start_y) == 2:
+            target = (start_x, (start_y + end_y) // 2)
+            if self.can_capture_en_passant(target, 1 - moving_piece.color):
+                self.en_passant = target
+
+        # Смена игрока
+        if self.current_player == 1:
+            self.fullmove_number += 1
+        self.current_player = 1 - self.current_player
+        self.hash = key ^ en_passant_key(self.en_passant) ^ side_key
+        return record
+
+    def replace_promoted_pawn(self, piece_type: str) -> None:
+        """Заменить пешку, ожидающую превращения, и передать ход сопернику"""
+        x, y = self.promotion_pending
+        pawn = self.board[y][x]
+        new_piece = pawn.promote(piece_type)
+        self.board[y][x] = new_piece
+        counts = self.piece_counts[pawn.color]
+        counts['P'] -= 1
+        counts[new_piece.symbol] += 1
+        self.promotion_pending = None
+        self.legal_moves_cache = None
+
+        # Следующий ход
+        if self.current_player == 1:
+            self.fullmove_number += 1
+        self.current_player = 1 - self.current_player
+        self.hash ^= piece_key(pawn, x, y) ^ piece_key(new_piece, x, y) ^ side_key
+
+    def push(self, move: int) -> None:
+        """
+        Выполнить упакованный ход для перебора: без пересчета тумана войны и состояния игры
+
+        Отменяется вызовом pop() за O(1)
+
+        Args:
+            move: упакованный ход (см. moves.py)
+        """
+        start_pos, end_pos, promotion = move_coords(move)
+        self.history.append(self.apply_move(start_pos, end_pos, promotion or 'Q'))
+
+    def pop(self) -> None:
+        """Отменить последний ход (сделанный через push или make_move) за O(1)"""
+        self.history.pop().restore(self)
+
+    def make_move(self, start_pos: tuple, end_pos: tuple, promotion: str = None) -> None:
+        """
+        Выполнить ход на доске
+
+        Если пешка дошла до последней горизонтали и promotion не указан,
+        ход ожидает выбора фигуры через promote()
+
+        Args:
+            start_pos: начальная позиция (x, y)
+            end_pos: конечная позиция (x, y)
+            promotion: фигура для превращения пешки ('Q', 'R', 'B', 'N')
+        """
+        self.history.append(self.apply_move(start_pos, end_pos, promotion))
+        self.update_visibility()
+
+        # Проверка окончания игры (после превращения - когда фигура будет выбрана)
+        if not self.promotion_pending:
+            self.update_status()
+
+    def make_packed_move(self, move: int) -> None:
+        """
+        Выполнить упакованный ход (см. moves.py)
+
+        Args:
+            move: упакованный ход
+        """
+        start_pos, end_pos, promotion = move_coords(move)
+        self.make_move(start_pos, end_pos, promotion)
+
+    def promote(self, piece_type: str) -> None:
+        """
+        Завершить ход превращением пешки и передать ход сопернику
+
+        Args:
+            piece_type: тип фигуры для превращения ('Q', 'R', 'B', 'N')
+        """
+        if not self.promotion_pending:
+            return
+
+        x, y = self.promotion_pending
+        self.replace_promoted_pawn(piece_type)
+        if self.history:
+            self.history[-1].promotion = self.board[y][x].symbol
+        self.update_visibility()
+
+        # Проверяем состояние игры после превращения
+        self.update_status()
+
+    def update_status(self) -> None:
+        """Пересчитать состояние игры после изменения позиции (один раз за ход)"""
+        self.set_status(self.is_in_check(self.current_player), len(self.generate_legal_moves()))
+
+    def set_status(self, check: bool, legal_move_count: int) -> None:
+        """
+        Установить состояние игры по шаху и количеству ходов, проверив правила ничьей
+
+        Args:
+            check: король стороны, которая ходит, под шахом
+            legal_move_count: количество допустимых ходов
+        """
+        checkmate = check and legal_move_count == 0
+        self.status = GameStatus(
+            check=check,
+            checkmate=checkmate,
+            stalemate=not check and legal_move_count == 0,
+            legal_move_count=legal_move_count,
+            winner=1 - self.current_player if checkmate else None,
+            draw_reason=None if checkmate else self.draw_reason()
+        )
+        self.check = self.status.check
+        self.game_over = self.status.is_over()
+
+    def draw_reason(self, repetitions: int = repetition_limit) -> str:
+        """
+        Проверить ничью по правилам, не зависящим от допустимых ходов (пат проверяется в update_status)
+
+        Args:
+            repetitions: сколько раз должна встретиться позиция (в поиске достаточно двух)
+
+        Returns:
+            str: 'fifty_moves', 'insufficient_material', 'repetition' или None
+        """
+        if self.halfmove_clock >= fifty_move_limit:
+            return 'fifty_moves'
+        if self.insufficient_material():
+            return 'insufficient_material'
+        if self.repetition_count(repetitions - 1) >= repetitions - 1:
+            return 'repetition'
+        return None
+
+    def repetition_count(self, limit: int = repetition_limit - 1) -> int:
+        """
+        Сколько раз текущая позиция встречалась раньше
+
+        Просматриваются только позиции после последнего взятия или хода пешкой
+        (раньше повторений быть не может) и только с той же очередью хода
+
+        Args:
+            limit: остановить подсчет, когда найдено столько повторений
+
+        Returns:
+            int: количество повторений (не больше limit)
+        """
+        key = self.hash
+        history = self.history
+        earlier = self.earlier_hashes
+        distance = min(self.halfmove_clock, len(history) + len(earlier))
+        count = 0
+        for back in range(2, distance + 1, 2):
+            if back <= len(history):
+                previous = history[-back].hash
+            else:
+                previous = earlier[len(history) - back]
+            if previous == key:
+                count += 1
+                if count >= limit:
+                    break
+        return count
+
+    def insufficient_material(self) -> bool:
+        """
+        Проверить, что мат невозможен: король против короля с одной легкой фигурой
+        или только слоны на полях одного цвета
+
+        Returns:
+            bool: True если матовать нечем
+        """
+        white, black = self.piece_counts
+        if white['P'] or black['P'] or white['R'] or black['R'] or white['Q'] or black['Q']:
+            return False
+        knights = white['N'] + black['N']
+        bishops = white['B'] + black['B']
+        if knights + bishops <= 1:
+            return True
+        if knights:
+            return False
+
+        # Только слоны: доску просматриваем лишь в этом редком случае
+        square_colors = {(x + y) % 2 for y, row in enumerate(self.board)
+                         for x, piece in enumerate(row) if piece is not None and piece.symbol == 'B'}
+        return len(square_colors) == 1
+
+    def is_checkmate(self) -> bool:
+        """
+        Проверить, находится ли текущий игрок в мате
+
+        Returns:
+            bool: True если мат
+        """
+        if not self.is_in_check(self.current_player):
+            return False
+
+        # Проверить, может ли любой ход вывести из-под шаха
+        return not self.generate_legal_moves()
+
+    def is_stalemate(self) -> bool:
+        """
+        Проверить, находится ли текущий игрок в пате
+
+        Returns:
+            bool: True если пат
+        """
+        if self.is_in_check(self.current_player):
+            return False
+
+        # Проверить, существует ли любой допустимый ход
+        return not self.generate_legal_moves()
@@ -0,0 +1,595 @@
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import secrets
+import sys
+import traceback
+
+from moves import move_name
+from rules import Game, board_size
+
+# Сетевая игра: сервер хранит партии и отправляет каждому игроку только то, что он видит.
+# Протокол - строки JSON через TCP, после каждого хода игрок получает только изменения
+#
+# Клиент -> сервер:
+#   {"type": "join"}                        - сесть за свободную партию или создать новую
+#   {"type": "join", "game": 5}             - сесть за партию с номером 5
+#   {"type": "join", "new": true}           - создать новую партию и ждать соперника
+#   {"type": "join", "moves": true}         - получать список допустимых ходов в своей очереди
+#   {"type": "join", "game": 5, "token": "..."} - вернуться на свое место после отключения
+#   {"type": "move", "move": "e2e4"}        - ход в координатной нотации (e7e8q - превращение)
+# Сервер -> клиент:
+#   {"type": "joined", "game": 5, "color": 0, "token": "..."} - token нужен, чтобы вернуться на место
+#   {"type": "opponent", "color": 1}        - соперник сел за партию (или вернулся), можно ходить
+#   {"type": "opponent_left", "color": 1}   - соперник отключился; его место ждет только его
+#   {"type": "view", "pieces": {...}, ...}  - полное видимое состояние (после входа)
+#   {"type": "delta", "set": {...}, "clear": [...], ...} - изменения после хода
+#                                            (клетки в set и clear - строки с номером клетки)
+#   {"type": "error", "message": "..."}
+
+default_port = 8765
+
+# Максимальная длина строки от клиента: ходы короткие, длинные строки - ошибка или атака
+max_message_size = 4096
+
+
+def piece_letter(piece) -> str:
+    """Символ фигуры как в FEN: белые - заглавные, черные - строчные"""
+    return piece.symbol if piece.color == 0 else piece.symbol.lower()
+
+
+def visible_pieces(game: Game, color: int) -> tuple:
+    """
+    Видимая игроку часть доски
+
+    Args:
+        game: партия
+        color: цвет игрока
+
+    Returns:
+        tuple: (маска видимых клеток, словарь номер клетки -> символ фигуры)
+    """
+    mask = game.compute_visibility(color)
+    pieces = {}
+    for y, row in enumerate(game.board):
+        for x, piece in enumerate(row):
+            square = y * board_size + x
+            if piece is not None and mask >> square & 1:
+                pieces[square] = piece_letter(piece)
+    return mask, pieces
+
+
+def game_state(game: Game, color: int, include_moves: bool = False) -> dict:
+    """
+    Общая часть сообщений о позиции: очередь хода, шах и результат
+
+    Args:
+        game: партия
+        color: цвет игрока
+        include_moves: добавить допустимые ходы, если игрок ходит
+    """
+    to_move = game.current_player == color
+    state = {
+        'turn': game.current_player,
+        'check': game.status.check and to_move,
+        'result': None,
+    }
+    if game.status.checkmate:
+        state['result'] = '1-0' if game.status.winner == 0 else '0-1'
+    elif game.status.is_draw():
+        state['result'] = '1/2-1/2'
+        state['draw_reason'] = game.status.draw_reason
+    if include_moves and to_move and state['result'] is None:
+        state['moves'] = [move_name(move) for move in game.generate_moves()]
+    return state
+
+
+class GameRoom:
+    """Партия на сервере: правила, подключенные игроки и последнее отправленное каждому состояние"""
+
+    def __init__(self, game_id: int) -> None:
+        """
+        Инициализация партии
+
+        Args:
+            game_id: номер партии
+        """
+        self.game_id = game_id
+        self.game = Game()
+        self.players = {}  # цвет -> Connection
+        self.views = {}  # цвет -> (маска, фигуры), отправленные игроку последними
+        self.tokens = {}  # цвет -> ключ, по которому игрок возвращается на свое место
+        self.started = False  # оба игрока садились за партию: свободное место занимает только его владелец
+
+    def free_color(self) -> int:
+        """Свободный цвет или None, если оба места заняты"""
+        for color in (0, 1):
+            if color not in self.players:
+                return color
+        return None
+
+    def full_view(self, color: int) -> dict:
+        """Полное видимое состояние для игрока (запоминается как отправленное)"""
+        mask, pieces = visible_pieces(self.game, color)
+        self.views[color] = (mask, pieces)
+        message = {
+            'type': 'view',
+            'visible': mask,
+            'pieces': {str(square): letter for square, letter in pieces.items()},
+        }
+        message.update(game_state(self.game, color, self.players[color].want_moves))
+        return message
+
+    def delta_view(self, color: int) -> dict:
+        """Изменения видимого состояния с последнего сообщения игроку"""
+        mask, pieces = visible_pieces(self.game, color)
+        old_mask, old_pieces = self.views.get(color, (0, {}))
+        self.views[color] = (mask, pieces)
+        message = {
+            'type': 'delta',
+            'set': {str(square): letter for square, letter in pieces.items() if old_pieces.get(square) != letter},
+            'clear': [str(square) for square in old_pieces if square not in pieces],
+        }
+        if mask != old_mask:
+            message['visible'] = mask
+        message.update(game_state(self.game, color, self.players[color].want_moves))
+        return message
+
+
+class Connection:
+    """Подключение клиента: поток строк JSON в обе стороны"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.room = None
+        self.color = None
+        self.want_moves = False  # отправлять список допустимых ходов
+
+    def send(self, message: dict) -> None:
+        """Поставить сообщение в очередь на отправку (без ожидания)"""
+        self.writer.write(json.dumps(message, separators=(',', ':')).encode() + b'\n')
+
+    async def receive(self) -> dict:
+        """Прочитать следующее сообщение или None, если клиент отключился"""
+        line = await self.reader.readline()
+        if not line:
+            return None
+        return json.loads(line)
+
+
+class GameServer:
+    """Сервер партий: одна задача asyncio на подключение, все партии в одном процессе"""
+
+    def __init__(self) -> None:
+        self.rooms = {}  # номер партии -> GameRoom
+        self.waiting = []  # партии, где ждут второго игрока
+        self.room_ids = itertools.count(1)
+        self.server = None
+        self.handlers = {}  # задача обработки -> Connection, для остановки сервера
+
+    async def start(self, host: str = '127.0.0.1', port: int = default_port) -> int:
+        """
+        Начать принимать подключения
+
+        Returns:
+            int: порт, на котором работает сервер (полезно при port=0)
+        """
+        self.server = await asyncio.start_server(self.handle_client, host, port, limit=max_message_size)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        """Остановить сервер: закрыть подключения и дождаться их обработчиков"""
+        self.server.close()
+        for connection in self.handlers.values():
+            connection.writer.close()
+        await asyncio.gather(*self.handlers, return_exceptions=True)
+        await self.server.wait_closed()
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Обработка одного подключения до его закрытия"""
+        connection = Connection(reader, writer)
+        task = asyncio.current_task()
+        self.handlers[task] = connection
+        try:
+            while True:
+                try:
+                    message = await connection.receive()
+                except (ValueError, asyncio.LimitOverrunError):
+                    connection.send({'type': 'error', 'message': 'некорректное сообщение'})
+                    break
+                if message is None:
+                    break
+                try:
+                    self.handle_message(connection, message)
+                except Exception:
+                    # Ошибка в одном сообщении не должна обрывать подключение
+                    traceback.print_exc()
+                    connection.send({'type': 'error', 'message': 'ошибка обработки сообщения'})
+                await self.flush(connection)
+        except ConnectionError:
+            pass
+        finally:
+            self.leave(connection)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+            del self.handlers[task]
+
+    async def flush(self, connection: Connection) -> None:
+        """Дождаться отправки сообщений игроку и его сопернику"""
+        await connection.writer.drain()
+        if connection.room is None:
+            return
+        for player in list(connection.room.players.values()):
+            if player is not connection:
+                try:
+                    await player.writer.drain()
+                except ConnectionError:
+                    # Отключение соперника обработает его собственная задача
+                    pass
+
+    def handle_message(self, connection: Connection, message: dict) -> None:
+        """Обработать одно сообщение клиента (поля с неверными типами отклоняются)"""
+        kind = message.get('type') if isinstance(message, dict) else None
+        if kind == 'join':
+            game_id = message.get('game')
+            if game_id is not None and (not isinstance(game_id, int) or isinstance(game_id, bool)):
+                connection.send({'type': 'error', 'message': 'номер партии должен быть целым числом'})
+                return
+            token = message.get('token')
+            if token is not None and not isinstance(token, str):
+                connection.send({'type': 'error', 'message': 'ключ возвращения должен быть строкой'})
+                return
+            connection.want_moves = bool(message.get('moves'))
+            self.join(connection, game_id, bool(message.get('new')), token)
+        elif kind == 'move':
+            name = message.get('move')
+            if not isinstance(name, str):
+                connection.send({'type': 'error', 'message': 'ход должен быть строкой'})
+                return
+            self.move(connection, name)
+        else:
+            connection.send({'type': 'error', 'message': f'неизвестное сообщение: {kind}'})
+
+    def join(self, connection: Connection, game_id: int = None, new: bool = False, token: str = None) -> None:
+        """
+        Посадить игрока за партию
+
+        Args:
+            connection: подключение игрока
+            game_id: номер партии (None - любая партия, где ждут соперника)
+            new: создать новую партию
+            token: ключ из сообщения joined, чтобы вернуться на свое место в начатой партии
+        """
+        if connection.room is not None:
+            connection.send({'type': 'error', 'message': 'игрок уже в партии'})
+            return
+
+        if game_id is not None:
+            room = self.rooms.get(game_id)
+            color = None if room is None else room.free_color()
+            if room is not None and room.started:
+                # В начатой партии место отключившегося игрока занимает только он сам
+                color = next((free for free, owner in room.tokens.items()
+                              if free not in room.players and token is not None and
+                              secrets.compare_digest(owner, token)), None)
+            if color is None:
+                connection.send({'type': 'error', 'message': f'партия {game_id} недоступна'})
+                return
+        else:
+            if self.waiting and not new:
+                room = self.waiting[0]
+            else:
+                room = GameRoom(next(self.room_ids))
+                self.rooms[room.game_id] = room
+                self.waiting.append(room)
+            color = room.free_color()
+
+        room.players[color] = connection
+        room.tokens.setdefault(color, secrets.token_hex(16))
+        connection.room = room
+        connection.color = color
+        if room.free_color() is None:
+            room.started = True
+            if room in self.waiting:
+                self.waiting.remove(room)
+
+        connection.send({'type': 'joined', 'game': room.game_id, 'color': color, 'token': room.tokens[color]})
+        connection.send(room.full_view(color))
+        for player in room.players.values():
+            if player is not connection:
+                player.send({'type': 'opponent', 'color': color})
+
+    def move(self, connection: Connection, name: str) -> None:
+        """Проверить и выполнить ход игрока, разослать изменения обоим игрокам"""
+        room = connection.room
+        if room is None:
+            connection.send({'type': 'error', 'message': 'игрок не в партии'})
+            return
+        if room.free_color() is not None:
+            connection.send({'type': 'error', 'message': 'соперник еще не подключился'})
+            return
+        game = room.game
+        if game.game_over or game.current_player != connection.color:
+            connection.send({'type': 'error', 'message': 'сейчас не ваш ход'})
+            return
+
+        for move in game.generate_moves():
+            if move_name(move) == name:
+                break
+        else:
+            connection.send({'type': 'error', 'message': f'недопустимый ход: {name}'})
+            return
+
+        game.make_packed_move(move)
+        for color, player in room.players.items():
+            player.send(room.delta_view(color))
+
+    def leave(self, connection: Connection) -> None:
+        """
+        Освободить место игрока
+
+        Пустая партия удаляется. Из начатой партии она не возвращается в очередь ожидания:
+        оставшийся игрок получает opponent_left, а место ждет вернувшегося с ключом игрока
+        """
+        room = connection.room
+        if room is None:
+            return
+        room.players.pop(connection.color, None)
+        room.views.pop(connection.color, None)
+        connection.room = None
+        if not room.players:
+            self.rooms.pop(room.game_id, None)
+            if room in self.waiting:
+                self.waiting.remove(room)
+            return
+        for player in room.players.values():
+            player.send({'type': 'opponent_left', 'color': connection.color})
+
+
+class GameClient:
+    """Клиент для проверки сервера: собирает видимую доску из полного состояния и изменений"""
+
+    def __init__(self) -> None:
+        self.reader = None
+        self.writer = None
+        self.game_id = None
+        self.color = None
+        self.token = None  # ключ для возвращения на свое место
+        self.opponent = False  # соперник за партией
+        self.visible = 0
+        self.pieces = {}  # номер клетки -> символ фигуры
+        self.state = {}  # последнее сообщение о позиции
+        self.bytes_received = 0
+
+    async def connect(self, host: str = '127.0.0.1', port: int = default_port) -> None:
+        """Подключиться к серверу"""
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+
+    async def close(self) -> None:
+        """Закрыть подключение"""
+        self.writer.close()
+        await self.writer.wait_closed()
+
+    async def send(self, message: dict) -> None:
+        """Отправить сообщение"""
+        self.writer.write(json.dumps(message).encode() + b'\n')
+        await self.writer.drain()
+
+    async def receive(self) -> dict:
+        """Получить сообщение и применить его к видимой доске"""
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError('сервер закрыл подключение')
+        self.bytes_received += len(line)
+        message = json.loads(line)
+        kind = message['type']
+        if kind == 'joined':
+            self.game_id = message['game']
+            self.color = message['color']
+            self.token = message['token']
+        elif kind == 'opponent':
+            self.opponent = True
+        elif kind == 'opponent_left':
+            self.opponent = False
+        elif kind == 'view':
+            self.visible = message['visible']
+            self.pieces = {int(square): letter for square, letter in message['pieces'].items()}
+            self.state = message
+        elif kind == 'delta':
+            self.visible = message.get('visible', self.visible)
+            for square in message['clear']:
+                self.pieces.pop(int(square), None)
+            for square, letter in message['set'].items():
+                self.pieces[int(square)] = letter
+            self.state = message
+        return message
+
+    async def join(self, game_id: int = None, new: bool = False, moves: bool = True, token: str = None) -> None:
+        """
+        Сесть за партию (или создать новую) и дождаться полного состояния
+
+        Raises:
+            ValueError: если сервер отказал
+        """
+        message = {'type': 'join', 'moves': moves}
+        if game_id is not None:
+            message['game'] = game_id
+        if new:
+            message['new'] = True
+        if token is not None:
+            message['token'] = token
+        await self.send(message)
+        while True:
+            reply = await self.receive()
+            if reply['type'] == 'error':
+                raise ValueError(reply['message'])
+            if reply['type'] == 'view':
+                break
+
+    async def wait_opponent(self) -> None:
+        """Дождаться, пока за партию сядет соперник"""
+        while not self.opponent:
+            await self.receive()
+
+    async def move(self, name: str) -> None:
+        """Сделать ход"""
+        await self.send({'type': 'move', 'move': name})
+
+
+async def play_random_game(port: int, seed: int) -> tuple:
+    """
+    Сыграть случайную партию двумя клиентами через сервер
+
+    Returns:
+        tuple: (результат, количество полуходов, байт получено клиентами)
+    """
+    rng = random.Random(seed)
+    white, black = GameClient(), GameClient()
+    await white.connect(port=port)
+    await black.connect(port=port)
+    await white.join(new=True)
+    await black.join(white.game_id)
+    await white.wait_opponent()
+    clients = (white, black)
+
+    plies = 0
+    result = None
+    while result is None and plies < 400:
+        mover = clients[white.state['turn']]
+        await mover.move(rng.choice(mover.state['moves']))
+        # После хода оба игрока получают изменения своей видимой доски
+        await white.receive()
+        await black.receive()
+        result = white.state['result']
+        plies += 1
+
+    received = white.bytes_received + black.bytes_received
+    await white.close()
+    await black.close()
+    return result or '*', plies, received
+
+
+def fog_errors(server: GameServer, client: GameClient, message: dict) -> list:
+    """
+    Проверить сообщение о позиции, полученное клиентом: фигуры только на видимых клетках,
+    собранная клиентом доска совпадает с тем, что игрок видит на сервере
+
+    Returns:
+        list: описания нарушений (пустой, если их нет)
+    """
+    if message['type'] not in ('view', 'delta'):
+        return []
+    errors = []
+    squares = message['pieces'] if message['type'] == 'view' else message['set']
+    for square in squares:
+        if not client.visible >> int(square) & 1:
+            errors.append(f"партия {client.game_id}, цвет {client.color}: клетка {square} вне видимости")
+    mask, pieces = visible_pieces(server.rooms[client.game_id].game, client.color)
+    if client.visible != mask or client.pieces != pieces:
+        errors.append(f"партия {client.game_id}, цвет {client.color}: доска клиента не совпадает с видимой")
+    return errors
+
+
+async def check_game(server: GameServer, port: int, seed: int) -> list:
+    """
+    Сыграть случайную партию и проверить каждое сообщение о позиции (см. fog_errors)
+
+    Returns:
+        list: описания нарушений
+    """
+    rng = random.Random(seed)
+    white, black = GameClient(), GameClient()
+    await white.connect(port=port)
+    await black.connect(port=port)
+    await white.join(new=True)
+    await black.join(white.game_id)
+    await white.wait_opponent()
+    clients = (white, black)
+    errors = fog_errors(server, white, white.state) + fog_errors(server, black, black.state)
+
+    plies = 0
+    while white.state['result'] is None and plies < 400:
+        mover = clients[white.state['turn']]
+        await mover.move(rng.choice(mover.state['moves']))
+        for client in clients:
+            errors += fog_errors(server, client, await client.receive())
+        plies += 1
+
+    await white.close()
+    await black.close()
+    return errors
+
+
+async def run_check(games: int) -> bool:
+    """
+    Проверить фильтрацию тумана войны на случайных партиях через сервер в этом же процессе
+
+    Returns:
+        bool: True, если ни один клиент не получил фигуру вне своей видимости
+    """
+    server = GameServer()
+    port = await server.start(port=0)
+    results = await asyncio.gather(*(check_game(server, port, seed) for seed in range(games)))
+    await server.stop()
+
+    errors = [error for result in results for error in result]
+    for error in errors[:20]:
+        print(error)
+    print(f"Партий: {games}, нарушений: {len(errors)}")
+    return not errors
+
+
+async def run_demo(games: int, port: int) -> None:
+    """Запустить сервер и сыграть на нем несколько случайных партий одновременно"""
+    server = GameServer()
+    port = await server.start(port=port)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    results = await asyncio.gather(*(play_random_game(port, seed) for seed in range(games)))
+    elapsed = loop.time() - started
+    await server.stop()
+
+    plies = sum(result[1] for result in results)
+    received = sum(result[2] for result in results)
+    print(f"Партий: {games}, полуходов: {plies}, {elapsed:.2f} с, {plies / elapsed:.0f} ходов/с")
+    print(f"Получено клиентами: {received} байт, {received / max(plies, 1):.0f} байт на ход")
+
+
+def main() -> None:
+    """Запуск сервера из командной строки"""
+    parser = argparse.ArgumentParser(description='Сервер шахмат с туманом войны')
+    parser.add_argument('--host', default='127.0.0.1', help='адрес для подключений')
+    parser.add_argument('--port', type=int, default=default_port, help='порт')
+    parser.add_argument('--demo', type=int, metavar='N',
+                        help='сыграть N случайных партий локальными клиентами и выйти')
+    parser.add_argument('--check', type=int, metavar='N',
+                        help='проверить на N случайных партиях, что клиенты получают только видимые клетки')
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(0 if asyncio.run(run_check(args.check)) else 1)
+
+    if args.demo:
+        asyncio.run(run_demo(args.demo, 0))
+        return
+
+    async def serve() -> None:
+        server = GameServer()
+        port = await server.start(args.host, args.port)
+        print(f"Сервер слушает {args.host}:{port}", file=sys.stderr)
+        await server.server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from book import OpeningBook
+from engine import Engine
+from moves import MoveBuffer, move_name
+from rules import Game
+from tablebase import Tablebases
+
+# Пакетная игра без окна: партии распределяются по процессам, результаты пишутся в JSONL.
+# Партия зависит только от общего зерна и своего номера, но не от числа процессов,
+# если поиск ограничен глубиной: ограничение по времени (--time) зависит от загрузки машины
+
+player_types = ('random', 'engine')
+
+# Движок создается один раз в каждом рабочем процессе (см. init_worker)
+worker_engine = None
+
+
+def init_worker(depth: int, move_time: float, book_path: str = None, book_plies: int = 16,
+                tablebase_directory: str = None) -> None:
+    """Подготовить рабочий процесс: движок с таблицей транспозиций, книгой и эндшпильными таблицами"""
+    global worker_engine
+    # Книга и таблицы отображаются в память только для чтения: процессы делят их страницы в кэше ОС
+    book = OpeningBook(book_path) if book_path else None
+    tablebases = Tablebases(tablebase_directory) if tablebase_directory else None
+    worker_engine = Engine(time_limit=move_time, max_depth=depth, book=book, book_plies=book_plies,
+                           tablebases=tablebases)
+
+
+def game_seed(seed: int, index: int) -> int:
+    """Зерно генератора для партии: не зависит от того, какой процесс ее сыграл"""
+    return (seed << 32) | index
+
+
+def play_game(task: tuple) -> dict:
+    """
+    Сыграть одну партию
+
+    Args:
+        task: (номер партии, общее зерно, игрок белых, игрок черных, максимум полуходов,
+               сколько первых полуходов делать случайно, записывать ли ходы)
+
+    Returns:
+        dict: результат партии (исход, длина, причина окончания)
+    """
+    index, seed, white, black, max_plies, random_plies, record_moves = task
+    rng = random.Random(game_seed(seed, index))
+    players = (white, black)
+    game = Game()
+    buffer = MoveBuffer()
+    moves = []
+    worker_engine.rng.seed(game_seed(seed, index))
+    # Записи прошлых партий процесса влияли бы на поиск, а какие партии достались процессу, случайно
+    worker_engine.table.clear()
+    started = time.perf_counter()
+
+    while not game.game_over and len(moves) < max_plies:
+        player = players[game.current_player]
+        if player == 'engine' and len(moves) >= random_plies:
+            move = worker_engine.search(game)
+        else:
+            legal = game.generate_moves(buffer)
+            move = legal[rng.randrange(len(legal))]
+        game.make_packed_move(move)
+        moves.append(move)
+
+    if game.status.checkmate:
+        termination = 'checkmate'
+        outcome = '1-0' if game.status.winner == 0 else '0-1'
+    elif game.status.is_draw():
+        termination = game.status.draw_reason
+        outcome = '1/2-1/2'
+    else:
+        termination = 'max_plies'
+        outcome = '*'
+
+    result = {
+        'game': index,
+        'seed': game_seed(seed, index),
+        'white': white,
+        'black': black,
+        'outcome': outcome,
+        'termination': termination,
+        'length': len(moves),
+        'seconds': round(time.perf_counter() - started, 4),
+    }
+    if record_moves:
+        result['moves'] = [move_name(move) for move in moves]
+    return result
+
+
+def run(games: int, workers: int, seed: int, white: str, black: str, max_plies: int, random_plies: int,
+        depth: int, move_time: float, record_moves: bool, output, book_path: str = None,
+        book_plies: int = 16, tablebase_directory: str = None) -> dict:
+    """
+    Сыграть партии в пуле процессов и записать результаты по мере готовности
+
+    Args:
+        games: количество партий
+        workers: количество процессов
+        seed: общее зерно генераторов
+        white: игрок белых ('random' или 'engine')
+        black: игрок черных
+        max_plies: максимальная длина партии в полуходах
+        random_plies: сколько первых полуходов движок делает случайно (чтобы партии различались)
+        depth: глубина поиска движка
+        move_time: ограничение времени движка на ход
+        record_moves: записывать ли ходы партии
+        output: файл для строк JSONL
+        book_path: файл дебютной книги движка или None
+        book_plies: до какого полухода движок берет ходы из книги
+        tablebase_directory: каталог эндшпильных таблиц движка или None
+
+    Returns:
+        dict: сводка (количество партий по исходам, время, партий в секунду)
+    """
+    tasks = ((index, seed, white, black, max_plies, random_plies, record_moves) for index in range(games))
+    outcomes = {}
+    started = time.perf_counter()
+
+    initargs = (depth, move_time, book_path, book_plies, tablebase_directory)
+    with multiprocessing.Pool(workers, initializer=init_worker, initargs=initargs) as pool:
+        # Короткие партии раздаются пачками, чтобы процессы не простаивали на передаче задач
+        chunk_size = max(1, min(64, games // (workers * 8)))
+        for result in pool.imap_unordered(play_game, tasks, chunksize=chunk_size):
+            output.write(json.dumps(result, ensure_ascii=False) + '\n')
+            outcomes[result['outcome']] = outcomes.get(result['outcome'], 0) + 1
+
+    elapsed = time.perf_counter() - started
+    return {
+        'games': games,
+        'outcomes': outcomes,
+        'seconds': round(elapsed, 3),
+        'games_per_second': round(games / elapsed, 2) if elapsed > 0 else 0,
+    }
+
+
+def main() -> None:
+    """Запуск симуляции из командной строки"""
+    parser = argparse.ArgumentParser(description='Пакетная игра партий без окна в нескольких процессах')
+    parser.add_argument('--games', type=int, default=100, help='количество партий')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='количество процессов')
+    parser.add_argument('--seed', type=int, default=0, help='зерно генераторов случайных чисел')
+    parser.add_argument('--white', choices=player_types, default='random', help='игрок белых')
+    parser.add_argument('--black', choices=player_types, default='random', help='игрок черных')
+    parser.add_argument('--max-plies', type=int, default=400, help='максимальная длина партии в полуходах')
+    parser.add_argument('--random-plies', type=int, default=4,
+                        help='сколько первых полуходов движок делает случайно')
+    parser.add_argument('--depth', type=int, default=2, help='глубина поиска движка')
+    parser.add_argument('--time', type=float, default=1.0,
+                        help='ограничение времени движка на ход в секундах (если время кончается раньше '
+                             'глубины, результаты перестают быть воспроизводимыми)')
+    parser.add_argument('--moves', action='store_true', help='записывать ходы партий')
+    parser.add_argument('--output', default='-', help='файл JSONL для результатов (- для вывода на экран)')
+    parser.add_argument('--book', help='файл дебютной книги (см. book.py)')
+    parser.add_argument('--book-plies', type=int, default=16, help='до какого полухода брать ходы из книги')
+    parser.add_argument('--tablebases', help='каталог эндшпильных таблиц (см. tablebase.py)')
+    args = parser.parse_args()
+
+    output = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    try:
+        summary = run(args.games, args.workers, args.seed, args.white, args.black, args.max_plies,
+                      args.random_plies, args.depth, args.time, args.moves, output, args.book,
+                      args.book_plies, args.tablebases)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    print(f"Партий: {summary['games']} за {summary['seconds']} с, "
+          f"{summary['games_per_second']} партий/с", file=sys.stderr)
+    for outcome, count in sorted(summary['outcomes'].items()):
+        print(f"  {outcome}: {count}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
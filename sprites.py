@@ -0,0 +1,90 @@
+import pygame
+
+# Цвета и символы фигур, для которых есть изображения {color}{symbol}.png
+piece_colors = (0, 1)
+piece_symbols = ('K', 'Q', 'R', 'B', 'N', 'P')
+
+
+class SpriteAtlas:
+    """Кэш изображений фигур: файлы читаются с диска один раз, масштабированные копии хранятся в памяти"""
+
+    def __init__(self) -> None:
+        """Инициализация пустого атласа (загрузка откладывается до первого обращения)"""
+        self.originals = {}  # (color, symbol) -> исходное изображение
+        self.scaled = {}  # (color, symbol, size) -> масштабированное изображение
+        self.missing = set()  # (color, symbol) фигуры, для которых нет картинки
+        self.loaded = False
+
+    def load(self) -> None:
+        """Загрузить все двенадцать изображений фигур и привести их к формату дисплея"""
+        self.originals.clear()
+        self.missing.clear()
+
+        for color in piece_colors:
+            for symbol in piece_symbols:
+                path = f"{color}{symbol}.png"
+                try:
+                    image = pygame.image.load(path)
+                except (pygame.error, FileNotFoundError):
+                    # Запасной вариант отрисовки выберет вызывающий код
+                    self.missing.add((color, symbol))
+                    continue
+
+                # Формат дисплея ускоряет blit, но доступен только при открытом окне
+                if pygame.display.get_surface() is not None:
+                    image = image.convert_alpha()
+                self.originals[(color, symbol)] = image
+
+        self.loaded = True
+
+    def prescale(self, sizes: tuple) -> None:
+        """
+        Заранее подготовить изображения всех фигур для указанных размеров
+
+        Args:
+            sizes: размеры стороны изображения в пикселях
+        """
+        for size in sizes:
+            for color in piece_colors:
+                for symbol in piece_symbols:
+                    self.get(color, symbol, size)
+
+    def rebuild(self, sizes: tuple = ()) -> None:
+        """
+        Перестроить атлас после создания окна или смены режима дисплея (изображения
+        переводятся в формат нового дисплея)
+
+        Args:
+            sizes: размеры, которые сразу нужно подготовить
+        """
+        self.scaled.clear()
+        self.load()
+        self.prescale(sizes)
+
+    def get(self, color: int, symbol: str, size: int):
+        """
+        Получить изображение фигуры нужного размера
+
+        Args:
+            color: цвет фигуры (0 - белые, 1 - черные)
+            symbol: символ фигуры
+            size: сторона изображения в пикселях
+
+        Returns:
+            pygame.Surface: изображение или None, если картинки нет
+        """
+        key = (color, symbol, size)
+        image = self.scaled.get(key)
+        if image is not None:
+            return image
+
+        if not self.loaded:
+            self.load()
+
+        original = self.originals.get((color, symbol))
+        if original is None:
+            return None
+
+        image = pygame.transform.scale(original, (size, size))
+        self.scaled[key] = image
+        return image
@@ -0,0 +1,599 @@
+import argparse
+import mmap
+import multiprocessing
+import os
+import time
+from array import array
+
+from bitboard import BitboardPosition, iter_bits, king, pawn, piece_types
+from moves import MoveBuffer, flag_en_passant, flag_promotion
+
+# Эндшпильные таблицы для малого количества фигур (KQK, KRK, KPK, KQKR и т.п.),
+# построенные ретроградным анализом от матовых позиций.
+#
+# Таблица - файл <материал>.tbl, по байту на позицию:
+#   0        - ничья
+#   1..127   - выигрыш стороны, которая ходит: мат за 2 * b - 1 полуходов
+#   128..254 - проигрыш: мат через 2 * (b - 128) полуходов (128 - мат уже поставлен)
+#   255      - невозможная позиция
+#
+# Номер позиции: (очередь хода, клетка белого короля, клетки остальных фигур по 6 бит).
+# Белый король переносится отражениями доски в угловой квадрант a8-d5 (в таблицах
+# с пешками - только отражением по вертикали на вертикали a-d), поэтому таблица
+# в 4 (с пешками в 2) раза меньше. В таблице сильнейшая сторона - белые: позиции,
+# где она играет черными, переворачиваются со сменой цвета.
+# Взятие на проходе, рокировка и правило 50 ходов не учитываются.
+
+draw_value = 0
+loss_base = 128
+illegal_value = 255
+max_win_value = loss_base - 1
+
+piece_order = 'KQRBNP'
+piece_weights = {'K': 0, 'Q': 9, 'R': 5, 'B': 3, 'N': 3, 'P': 1}
+
+# Таблицы по умолчанию (недостающие меньшие таблицы строятся автоматически)
+default_materials = ('KQK', 'KRK', 'KPK')
+
+# Позиций в одной задаче рабочего процесса
+chunk_size = 4096
+
+
+def encode_result(wdl: int, dtm: int) -> int:
+    """
+    Байт таблицы по результату
+
+    Args:
+        wdl: 1 - выигрыш, 0 - ничья, -1 - проигрыш стороны, которая ходит
+        dtm: полуходов до мата
+
+    Returns:
+        int: байт таблицы
+    """
+    if wdl == 0:
+        return draw_value
+    if wdl > 0:
+        value = (dtm + 1) // 2
+        if value > max_win_value:
+            raise ValueError(f"Слишком длинный выигрыш: {dtm} полуходов")
+        return value
+    value = loss_base + dtm // 2
+    if value >= illegal_value:
+        raise ValueError(f"Слишком длинный проигрыш: {dtm} полуходов")
+    return value
+
+
+def decode_result(value: int) -> tuple:
+    """
+    Результат по байту таблицы
+
+    Returns:
+        tuple: (wdl, полуходов до мата) или None для невозможной позиции
+    """
+    if value == illegal_value:
+        return None
+    if value == draw_value:
+        return 0, 0
+    if value < loss_base:
+        return 1, 2 * value - 1
+    return -1, 2 * (value - loss_base)
+
+
+def material_name(white: dict, black: dict) -> str:
+    """
+    Название материала по количеству фигур (например KQK, KRKB)
+
+    Args:
+        white: символ -> количество белых фигур
+        black: символ -> количество черных фигур
+    """
+    return ''.join(symbol * counts.get(symbol, 0) for counts in (white, black) for symbol in piece_order)
+
+
+def mask_counts(pieces: list, color: int) -> dict:
+    """Количество фигур цвета по маскам BitboardPosition"""
+    return {symbol: bin(pieces[color * 6 + piece_type]).count('1')
+            for piece_type, symbol in enumerate(piece_types)}
+
+
+def insufficient(white: dict, black: dict) -> bool:
+    """Проверить, что ни одна сторона не может поставить мат (король против короля и легкой фигуры)"""
+    for counts in (white, black):
+        if counts.get('P', 0) or counts.get('Q', 0) or counts.get('R', 0):
+            return False
+    return white.get('N', 0) + white.get('B', 0) + black.get('N', 0) + black.get('B', 0) <= 1
+
+
+class TableLayout:
+    """Расположение фигур материала в номере позиции"""
+
+    def __init__(self, material: str) -> None:
+        """
+        Разобрать материал
+
+        Args:
+            material: например 'KQK' (фигуры белых, затем черных, каждая сторона с короля)
+
+        Raises:
+            ValueError: если материал записан неверно
+        """
+        material = material.upper()
+        split = material.find('K', 1)
+        if not material.startswith('K') or split < 0 or material.count('K') != 2 or \
+                any(symbol not in piece_order for symbol in material):
+            raise ValueError(f"Некорректный материал: {material}")
+        white = {symbol: material[:split].count(symbol) for symbol in piece_order}
+        black = {symbol: material[split:].count(symbol) for symbol in piece_order}
+        self.material = material_name(white, black)
+        self.counts = (white, black)
+
+        # Белый король первым, затем остальные фигуры по цветам и типам
+        self.pieces = [(0, king)]
+        for color, counts in enumerate(self.counts):
+            for symbol in piece_order:
+                piece_type = piece_types.index(symbol)
+                if (color, piece_type) != (0, king):
+                    self.pieces.extend([(color, piece_type)] * counts[symbol])
+        self.groups = sorted(set(self.pieces), key=self.pieces.index)
+        self.has_pawns = bool(white['P'] or black['P'])
+        self.regions = 32 if self.has_pawns else 16
+        self.size = 2 * self.regions * 64 ** (len(self.pieces) - 1)
+
+    def index(self, pieces: list, side: int, flip: bool = False) -> int:
+        """
+        Номер позиции в таблице
+
+        Args:
+            pieces: 12 масок фигур BitboardPosition
+            side: цвет стороны, которая ходит
+            flip: поменять цвета и отразить доску по горизонтали (сильнейшая сторона - черные)
+
+        Returns:
+            int: номер позиции
+        """
+        squares = {}
+        for color, piece_type in self.groups:
+            if flip:
+                squares[color, piece_type] = [square ^ 56 for square in
+                                              iter_bits(pieces[(1 - color) * 6 + piece_type])]
+            else:
+                squares[color, piece_type] = list(iter_bits(pieces[color * 6 + piece_type]))
+        if flip:
+            side = 1 - side
+
+        # Отражения переносят белого короля в квадрант a8-d5 (с пешками - на вертикали a-d)
+        white_king = squares[0, king][0]
+        transform = 7 if white_king & 7 > 3 else 0
+        if not self.has_pawns and white_king >> 3 > 3:
+            transform |= 56
+        white_king ^= transform
+
+        index = side * self.regions + (white_king >> 3) * 4 + (white_king & 7)
+        for color, piece_type in self.groups:
+            group = squares[color, piece_type]
+            if (color, piece_type) == (0, king):
+                continue
+            # Одинаковые фигуры записываются по возрастанию клетки
+            for square in sorted(square ^ transform for square in group):
+                index = index * 64 + square
+        return index
+
+    def decode(self, index: int) -> tuple:
+        """
+        Позиция по номеру
+
+        Returns:
+            tuple: (цвет стороны, которая ходит, клетки фигур в порядке self.pieces)
+        """
+        squares = []
+        for _ in range(len(self.pieces) - 1):
+            index, square = divmod(index, 64)
+            squares.append(square)
+        side, region = divmod(index, self.regions)
+        squares.append((region // 4) * 8 + region % 4)
+        squares.reverse()
+        return side, squares
+
+
+class Tablebases:
+    """Набор таблиц из каталога: файлы отображаются в память только для чтения при первом обращении"""
+
+    def __init__(self, directory: str) -> None:
+        """
+        Инициализация набора
+
+        Args:
+            directory: каталог с файлами <материал>.tbl
+        """
+        self.directory = directory
+        self.tables = {}  # материал -> (TableLayout, данные) или None, если таблицы нет
+        self.max_pieces = 0
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                if name.endswith('.tbl'):
+                    self.max_pieces = max(self.max_pieces, len(name) - len('.tbl'))
+
+    def table(self, material: str):
+        """Таблица материала (с отображением файла в память) или None"""
+        if material not in self.tables:
+            path = os.path.join(self.directory, material + '.tbl')
+            if os.path.exists(path):
+                with open(path, 'rb') as file:
+                    data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                self.tables[material] = (TableLayout(material), data)
+            else:
+                self.tables[material] = None
+        return self.tables[material]
+
+    def close(self) -> None:
+        """Закрыть отображения файлов"""
+        for entry in self.tables.values():
+            if entry is not None:
+                entry[1].close()
+        self.tables.clear()
+
+    def probe_pieces(self, pieces: list, side: int) -> int:
+        """
+        Байт таблицы для позиции на битбордах
+
+        Args:
+            pieces: 12 масок фигур
+            side: цвет стороны, которая ходит
+
+        Returns:
+            int: байт таблицы (ничья, если матовать нечем) или None, если таблицы нет
+        """
+        white = mask_counts(pieces, 0)
+        black = mask_counts(pieces, 1)
+        if insufficient(white, black):
+            return draw_value
+        entry = self.table(material_name(white, black))
+        flip = False
+        if entry is None:
+            entry = self.table(material_name(black, white))
+            flip = True
+            if entry is None:
+                return None
+        layout, data = entry
+        return data[layout.index(pieces, side, flip)]
+
+    def probe(self, game) -> tuple:
+        """
+        Найти позицию партии в таблицах за O(1)
+
+        Args:
+            game: партия
+
+        Returns:
+            tuple: (wdl, полуходов до мата) для стороны, которая ходит, или None,
+                   если таблицы нет или в позиции возможны рокировка или взятие на проходе
+        """
+        counts = game.piece_counts
+        if sum(counts[0].values()) + sum(counts[1].values()) > self.max_pieces:
+            return None
+        # Взятие на проходе возможно, только если у стороны, которая ходит, есть пешки
+        if (game.en_passant is not None and counts[game.current_player]['P']) or \
+                any(game.castling_rights.values()):
+            return None
+        value = self.probe_pieces(game.get_position().pieces, game.current_player)
+        if value is None:
+            return None
+        return decode_result(value)
+
+    def best_move(self, game) -> int:
+        """
+        Лучший ход по таблицам: самый быстрый мат, сохранение ничьей или самая долгая защита
+
+        Returns:
+            int: упакованный ход или None, если позиции нет в таблицах
+        """
+        if self.probe(game) is None:
+            return None
+        best_move = None
+        best_key = None
+        for move in game.generate_moves():
+            game.push(move)
+            result = self.probe(game)
+            game.pop()
+            if result is None:
+                return None
+            wdl, dtm = result
+            # Результат соперника после хода: чем он хуже для соперника, тем лучше ход
+            key = (wdl, dtm if wdl < 0 else -dtm)
+            if best_key is None or key < best_key:
+                best_key = key
+                best_move = move
+        return best_move
+
+
+def table_name(white: dict, black: dict) -> str:
+    """Название таблицы для материала: сильнейшая сторона записывается первой (белыми)"""
+    return max(material_name(white, black), material_name(black, white), key=material_strength)
+
+
+def material_strength(material: str) -> tuple:
+    """Ключ для выбора сильнейшей стороны: разница стоимости фигур белых и черных"""
+    white, black = TableLayout(material).counts
+    return (sum(piece_weights[symbol] * count for symbol, count in white.items()) -
+            sum(piece_weights[symbol] * count for symbol, count in black.items()), material)
+
+
+def child_materials(material: str) -> set:
+    """Материалы, в которые ведут взятия и превращения (кроме ничейных)"""
+    counts = TableLayout(material).counts
+    names = set()
+    for color in (0, 1):
+        for symbol in piece_order[1:]:
+            if not counts[color][symbol]:
+                continue
+            changes = [{symbol: -1}]
+            if symbol == 'P':
+                changes.extend({'P': -1, promotion: 1} for promotion in 'QRBN')
+            for change in changes:
+                child = [dict(counts[0]), dict(counts[1])]
+                for changed, delta in change.items():
+                    child[color][changed] += delta
+                if not insufficient(*child):
+                    names.add(table_name(*child))
+    return names
+
+
+def dependencies(material: str) -> list:
+    """
+    Таблицы, которые нужно построить для материала
+
+    Returns:
+        list: материалы в порядке построения (сначала меньшие), последним - сам материал
+    """
+    result = []
+
+    def visit(name: str) -> None:
+        for child in sorted(child_materials(name)):
+            if child not in result:
+                visit(child)
+        if name not in result:
+            result.append(name)
+
+    visit(TableLayout(material).material)
+    return result
+
+
+# Данные рабочего процесса (см. init_worker)
+worker_layout = None
+worker_tables = None
+
+
+def init_worker(material: str, directory: str) -> None:
+    """Подготовить рабочий процесс: расположение таблицы и готовые меньшие таблицы"""
+    global worker_layout, worker_tables
+    worker_layout = TableLayout(material)
+    worker_tables = Tablebases(directory)
+
+
+def expand_chunk(bounds: tuple) -> tuple:
+    """
+    Перебрать ходы из позиций с номерами [start, end) (выполняется в рабочем процессе)
+
+    Returns:
+        tuple: (start, состояния, количества ходов внутри таблицы, номера позиций после этих ходов,
+                лучший выигрыш через меньшие таблицы, худший проигрыш через них, есть ли ничья через них)
+    """
+    start, end = bounds
+    layout = worker_layout
+    tables = worker_tables
+    states = array('b')  # 0 - обычная, 1 - невозможная, 2 - мат, 3 - пат
+    counts = array('H')
+    children = array('I')
+    external_win = array('h')  # полуходов до выигрыша через взятие или превращение, -1 - нет
+    external_loss = array('h')  # наибольшее число полуходов проигрыша через них, -1 - нет
+    external_draw = array('b')
+    buffer = MoveBuffer()
+    last_rows = (0, 7)
+
+    for index in range(start, end):
+        side, squares = layout.decode(index)
+        state = 0
+        position = None
+        if len(set(squares)) != len(squares):
+            state = 1
+        else:
+            position = BitboardPosition()
+            position.side = side
+            previous = (None, -1)
+            for piece, square in zip(layout.pieces, squares):
+                color, piece_type = piece
+                if piece_type == pawn and square >> 3 in last_rows:
+                    state = 1
+                # Одинаковые фигуры хранятся только по возрастанию клетки
+                if previous[0] == piece and square < previous[1]:
+                    state = 1
+                previous = (piece, square)
+                position.pieces[color * 6 + piece_type] |= 1 << square
+            if state == 0 and position.is_in_check(1 - side):
+                state = 1
+
+        count = 0
+        win = loss = -1
+        draw = 0
+        if state == 0:
+            moves = position.legal_moves(buffer)
+            if not moves.count:
+                state = 2 if position.is_in_check(side) else 3
+            enemy = position.occupancy(1 - side)
+            for i in range(moves.count):
+                move = moves.moves[i]
+                child = position.make_move(move)
+                flag = move >> 14
+                if flag == flag_promotion or flag == flag_en_passant or enemy >> ((move >> 6) & 63) & 1:
+                    value = tables.probe_pieces(child.pieces, child.side)
+                    if value is None:
+                        white, black = mask_counts(child.pieces, 0), mask_counts(child.pieces, 1)
+                        raise ValueError(f"Сначала нужно построить таблицу {table_name(white, black)}")
+                    child_wdl, child_dtm = decode_result(value)
+                    if child_wdl < 0:
+                        if win < 0 or child_dtm + 1 < win:
+                            win = child_dtm + 1
+                    elif child_wdl > 0:
+                        loss = max(loss, child_dtm + 1)
+                    else:
+                        draw = 1
+                else:
+                    children.append(layout.index(child.pieces, child.side))
+                    count += 1
+
+        states.append(state)
+        counts.append(count)
+        external_win.append(win)
+        external_loss.append(loss)
+        external_draw.append(draw)
+    return start, states, counts, children, external_win, external_loss, external_draw
+
+
+def generate(material: str, directory: str, workers: int = None, log=None) -> str:
+    """
+    Построить таблицу и записать ее в каталог (меньшие таблицы должны быть уже построены)
+
+    Ходы из всех позиций перебираются параллельно в процессах, затем результаты
+    распространяются от матов к предшествующим позициям в порядке числа полуходов до мата
+
+    Args:
+        material: материал, например 'KQK'
+        directory: каталог таблиц
+        workers: количество процессов (по умолчанию - по числу ядер)
+        log: функция для сообщений о ходе построения
+
+    Returns:
+        str: путь к файлу таблицы
+
+    Raises:
+        ValueError: если не построена одна из меньших таблиц
+    """
+    layout = TableLayout(material)
+    for name in sorted(child_materials(layout.material)):
+        if not os.path.exists(os.path.join(directory, name + '.tbl')):
+            raise ValueError(f"Сначала нужно построить таблицу {name} (для {layout.material})")
+    size = layout.size
+    started = time.perf_counter()
+
+    states = array('b', bytes(size))
+    counts = array('H', bytes(2 * size))
+    external_win = array('h', [-1]) * size
+    external_loss = array('h', [-1]) * size
+    external_draw = array('b', bytes(size))
+    parts = []
+    with multiprocessing.Pool(workers or os.cpu_count() or 1, initializer=init_worker,
+                              initargs=(layout.material, directory)) as pool:
+        bounds = [(start, min(start + chunk_size, size)) for start in range(0, size, chunk_size)]
+        for start, *chunk in pool.imap_unordered(expand_chunk, bounds):
+            chunk_states, chunk_counts, chunk_children, chunk_win, chunk_loss, chunk_draw = chunk
+            end = start + len(chunk_states)
+            states[start:end] = chunk_states
+            counts[start:end] = chunk_counts
+            external_win[start:end] = chunk_win
+            external_loss[start:end] = chunk_loss
+            external_draw[start:end] = chunk_draw
+            parts.append((start, end, chunk_children))
+    if log:
+        log(f"{layout.material}: ходы перебраны за {time.perf_counter() - started:.1f} с")
+
+    # Обратные ребра: для каждой позиции - позиции, из которых в нее можно попасть
+    parent_counts = array('I', bytes(4 * (size + 1)))
+    for start, end, chunk_children in parts:
+        for child in chunk_children:
+            parent_counts[child + 1] += 1
+    for index in range(size):
+        parent_counts[index + 1] += parent_counts[index]
+    parents = array('I', bytes(4 * parent_counts[size]))
+    fill = array('I', parent_counts)
+    for start, end, chunk_children in parts:
+        offset = 0
+        for index in range(start, end):
+            for child in chunk_children[offset:offset + counts[index]]:
+                parents[fill[child]] = index
+                fill[child] += 1
+            offset += counts[index]
+
+    # Очередь по числу полуходов до мата: позиции берутся в порядке возрастания
+    result = bytearray(size)
+    resolved = bytearray(size)
+    buckets = {}
+
+    def schedule(index: int, wdl: int, dtm: int) -> None:
+        buckets.setdefault(dtm, []).append((index, wdl))
+
+    remaining = counts
+    for index in range(size):
+        state = states[index]
+        if state == 1:
+            result[index] = illegal_value
+            resolved[index] = 1
+        elif state == 2:
+            schedule(index, -1, 0)
+        elif state == 3:
+            resolved[index] = 1
+        else:
+            if external_win[index] >= 0:
+                schedule(index, 1, external_win[index])
+            if remaining[index] == 0 and external_win[index] < 0 and not external_draw[index]:
+                # Все ходы ведут в меньшие таблицы и все они проигрывают
+                schedule(index, -1, external_loss[index])
+
+    dtm = 0
+    while buckets:
+        entries = buckets.pop(dtm, None)
+        if entries is not None:
+            for index, wdl in entries:
+                if resolved[index]:
+                    continue
+                resolved[index] = 1
+                result[index] = encode_result(wdl, dtm)
+                for parent in parents[parent_counts[index]:parent_counts[index + 1]]:
+                    if resolved[parent]:
+                        continue
+                    if wdl < 0:
+                        schedule(parent, 1, dtm + 1)
+                    else:
+                        remaining[parent] -= 1
+                        if remaining[parent] == 0 and external_win[parent] < 0 and not external_draw[parent]:
+                            # external_loss уже включает ход в меньшую таблицу
+                            schedule(parent, -1, max(dtm + 1, external_loss[parent]))
+        dtm += 1
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, layout.material + '.tbl')
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(result)
+    os.replace(temporary, path)
+    if log:
+        log(f"{layout.material}: {size} позиций, {time.perf_counter() - started:.1f} с")
+    return path
+
+
+def main() -> None:
+    """Построение и проверка таблиц из командной строки"""
+    parser = argparse.ArgumentParser(description='Эндшпильные таблицы')
+    parser.add_argument('materials', nargs='*', default=list(default_materials),
+                        help='материалы, например KQK KRK KPK')
+    parser.add_argument('--directory', default='tablebases', help='каталог таблиц')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='количество процессов')
+    parser.add_argument('--probe', metavar='FEN', help='показать результат позиции вместо построения')
+    args = parser.parse_args()
+
+    if args.probe:
+        from rules import Game
+        tables = Tablebases(args.directory)
+        game = Game.from_fen(args.probe)
+        print(tables.probe(game))
+        return
+
+    built = set()
+    for material in args.materials:
+        for name in dependencies(material):
+            if name not in built and not os.path.exists(os.path.join(args.directory, name + '.tbl')):
+                generate(name, args.directory, args.workers, log=print)
+            built.add(name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+import argparse
+import random
+import struct
+import sys
+from array import array
+
+from rules import Game, board_size, piece_classes, start_fen
+
+# Двоичный формат позиций, ходов и видимых игроку частей доски.
+#
+# Позиция - 34 байта:
+#   32 байта - клетки доски по две в байте (младшая тетрада - четная клетка),
+#              код фигуры: 0 - пусто, 1..6 - белые P N B R Q K, 9..14 - черные (бит 3 - цвет)
+#   1 байт   - бит 0: ходят черные, биты 1-4: права на рокировку в порядке KQkq
+#   1 байт   - вертикаль взятия на проходе + 1 (0 - взятия на проходе нет)
+# Счетчики ходов не хранятся: они нужны только для правила 50 ходов и номера хода в PGN.
+#
+# Ход - 2 байта: упакованный ход из moves.py (little-endian).
+#
+# Видимая часть доски - 8 байт маски видимых клеток и по тетраде на каждую видимую клетку
+# в порядке возрастания номера клетки: 8 + ceil(видимых клеток / 2) байт.
+
+piece_codes = {symbol: code for code, symbol in enumerate('PNBRQK', start=1)}
+code_symbols = {code: symbol for symbol, code in piece_codes.items()}
+black_flag = 8
+
+castling_order = ('white_king_side', 'white_queen_side', 'black_king_side', 'black_queen_side')
+
+position_struct = struct.Struct('<32sBB')
+position_size = position_struct.size
+move_struct = struct.Struct('<H')
+move_size = move_struct.size
+mask_struct = struct.Struct('<Q')
+
+# Начальные позиции для проверки форматов: со счетчиками, рокировкой и взятием на проходе
+check_fens = (
+    start_fen,
+    'r3k2r/pppq1ppp/2npbn2/4p3/2B1P3/2NP1N2/PPPQ1PPP/R3K2R w KQkq - 6 9',
+    'rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3',
+    '8/5k2/8/3P4/8/8/1K6/7R b - - 37 52',
+)
+
+
+def piece_code(piece) -> int:
+    """Код фигуры для тетрады (0 для пустой клетки)"""
+    if piece is None:
+        return 0
+    return piece_codes[piece.symbol] | (black_flag if piece.color == 1 else 0)
+
+
+def make_piece(code: int):
+    """Фигура по коду тетрады (None для пустой клетки)"""
+    if code == 0:
+        return None
+    return piece_classes[code_symbols[code & 7]](1 if code & black_flag else 0)
+
+
+def encode_position(game: Game) -> bytes:
+    """
+    Упаковать позицию в 34 байта
+
+    Args:
+        game: партия
+
+    Returns:
+        bytes: двоичная позиция
+    """
+    squares = bytearray(32)
+    index = 0
+    for row in game.board:
+        for x in range(0, board_size, 2):
+            squares[index] = piece_code(row[x]) | (piece_code(row[x + 1]) << 4)
+            index += 1
+
+    flags = game.current_player
+    for bit, name in enumerate(castling_order, start=1):
+        if game.castling_rights[name]:
+            flags |= 1 << bit
+    en_passant = 0 if game.en_passant is None else game.en_passant[0] + 1
+    return position_struct.pack(bytes(squares), flags, en_passant)
+
+
+def unpack_position(buffer, offset: int = 0) -> tuple:
+    """
+    Распаковать позицию в поля без создания партии (быстро, без пересчета ходов и видимости)
+
+    Args:
+        buffer: bytes, bytearray, memoryview или mmap
+        offset: смещение позиции в буфере
+
+    Returns:
+        tuple: (доска, цвет стороны, которая ходит, права на рокировку, взятие на проходе)
+    """
+    squares, flags, en_passant = position_struct.unpack_from(buffer, offset)
+    board = [[None] * board_size for _ in range(board_size)]
+    for index, pair in enumerate(squares):
+        y, x = divmod(index * 2, board_size)
+        board[y][x] = make_piece(pair & 15)
+        board[y][x + 1] = make_piece(pair >> 4)
+
+    current_player = flags & 1
+    castling_rights = {name: bool(flags >> bit & 1) for bit, name in enumerate(castling_order, start=1)}
+    if en_passant:
+        # Поле взятия на проходе - за пешкой, которая только что сделала двойной ход
+        en_passant = (en_passant - 1, 2 if current_player == 0 else 5)
+    else:
+        en_passant = None
+    return board, current_player, castling_rights, en_passant
+
+
+def decode_position(buffer, offset: int = 0) -> Game:
+    """
+    Распаковать позицию в партию
+
+    Args:
+        buffer: bytes, bytearray, memoryview или mmap
+        offset: смещение позиции в буфере
+
+    Returns:
+        Game: партия в этой позиции
+    """
+    game = Game.__new__(Game)
+    game.set_position(*unpack_position(buffer, offset))
+    return game
+
+
+def encode_positions(games) -> bytes:
+    """Упаковать несколько позиций подряд (по position_size байт)"""
+    return b''.join(encode_position(game) for game in games)
+
+
+def iter_positions(buffer):
+    """
+    Распаковывать позиции из буфера по одной
+
+    Yields:
+        Game: очередная позиция
+    """
+    view = memoryview(buffer)
+    for offset in range(0, len(view) - position_size + 1, position_size):
+        yield decode_position(view, offset)
+
+
+def decode_positions(buffer) -> list:
+    """Распаковать все позиции из буфера"""
+    return list(iter_positions(buffer))
+
+
+def encode_move(move: int) -> bytes:
+    """Упаковать ход в 2 байта"""
+    return move_struct.pack(move)
+
+
+def decode_move(buffer, offset: int = 0) -> int:
+    """Распаковать ход из буфера"""
+    return move_struct.unpack_from(buffer, offset)[0]
+
+
+def encode_moves(moves) -> bytes:
+    """Упаковать последовательность ходов (по 2 байта)"""
+    packed = array('H', moves)
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def decode_moves(buffer) -> list:
+    """
+    Распаковать последовательность ходов
+
+    Args:
+        buffer: bytes, bytearray, memoryview или mmap с четным количеством байт
+
+    Returns:
+        list: упакованные ходы
+    """
+    if sys.byteorder == 'big':
+        packed = array('H', bytes(buffer))
+        packed.byteswap()
+        return packed.tolist()
+    return memoryview(buffer).cast('B').cast('H').tolist()
+
+
+def encode_view(game: Game, color: int) -> bytes:
+    """
+    Упаковать видимую игроку часть доски
+
+    Args:
+        game: партия
+        color: цвет игрока
+
+    Returns:
+        bytes: маска видимых клеток и тетрады видимых клеток
+    """
+    mask = game.compute_visibility(color)
+    codes = bytearray((bin(mask).count('1') + 1) // 2)
+    index = 0
+    for square in range(board_size * board_size):
+        if mask >> square & 1:
+            piece = game.board[square // board_size][square % board_size]
+            codes[index >> 1] |= piece_code(piece) << (4 * (index & 1))
+            index += 1
+    return mask_struct.pack(mask) + bytes(codes)
+
+
+def view_size(buffer, offset: int = 0) -> int:
+    """Размер упакованной видимой части доски по ее маске"""
+    mask = mask_struct.unpack_from(buffer, offset)[0]
+    return mask_struct.size + (bin(mask).count('1') + 1) // 2
+
+
+def decode_view(buffer, offset: int = 0) -> tuple:
+    """
+    Распаковать видимую игроку часть доски
+
+    Returns:
+        tuple: (маска видимых клеток, словарь номер клетки -> (цвет, символ) для видимых фигур)
+    """
+    view = memoryview(buffer)
+    mask = mask_struct.unpack_from(view, offset)[0]
+    codes = view[offset + mask_struct.size:]
+    pieces = {}
+    index = 0
+    for square in range(board_size * board_size):
+        if mask >> square & 1:
+            code = (codes[index >> 1] >> (4 * (index & 1))) & 15
+            if code:
+                pieces[square] = (1 if code & black_flag else 0, code_symbols[code & 7])
+            index += 1
+    return mask, pieces
+
+
+def random_games(games: int, plies: int, seed: int = 0):
+    """
+    Случайные партии для проверки форматов (по очереди из каждой позиции check_fens)
+
+    Yields:
+        Game: партия после случайных ходов (история ходов сохранена)
+    """
+    rng = random.Random(seed)
+    for index in range(games):
+        game = Game.from_fen(check_fens[index % len(check_fens)])
+        for _ in range(rng.randrange(plies + 1)):
+            moves = game.generate_moves()
+            if game.game_over or not len(moves):
+                break
+            game.make_packed_move(moves[rng.randrange(len(moves))])
+        yield game
+
+
+def self_test(games: int = 40, plies: int = 60, seed: int = 0) -> list:
+    """
+    Проверить упаковку позиций, ходов и видимых частей доски на случайных партиях
+
+    Returns:
+        list: описания ошибок (пустой, если ошибок нет)
+    """
+    errors = []
+    positions = 0
+    for number, game in enumerate(random_games(games, plies, seed)):
+        replay = Game.from_fen(game.initial_fen)
+        for move in [None] + game.move_history():
+            if move is not None:
+                replay.make_packed_move(move)
+            positions += 1
+            decoded = decode_position(encode_position(replay))
+            # Счетчики ходов в формат не входят, остальные поля FEN и ключ должны совпасть
+            if decoded.to_fen().split()[:4] != replay.to_fen().split()[:4] or decoded.hash != replay.hash:
+                errors.append(f"партия {number}: позиция {replay.to_fen()} -> {decoded.to_fen()}")
+            for color in (0, 1):
+                mask, pieces = decode_view(encode_view(replay, color))
+                expected = {square: (piece.color, piece.symbol)
+                            for square in range(board_size * board_size) if mask >> square & 1
+                            for piece in [replay.board[square // board_size][square % board_size]] if piece}
+                if mask != replay.compute_visibility(color) or pieces != expected:
+                    errors.append(f"партия {number}: видимость цвета {color} в позиции {replay.to_fen()}")
+        moves = game.move_history()
+        if decode_moves(encode_moves(moves)) != moves:
+            errors.append(f"партия {number}: ходы не совпадают")
+    print(f"Партий: {games}, позиций: {positions}, ошибок: {len(errors)}")
+    return errors
+
+
+def main() -> None:
+    """Проверка двоичного формата из командной строки"""
+    parser = argparse.ArgumentParser(description='Проверка двоичного формата позиций, ходов и видимости')
+    parser.add_argument('--games', type=int, default=40, help='количество случайных партий')
+    parser.add_argument('--plies', type=int, default=60, help='наибольшая длина партии в полуходах')
+    parser.add_argument('--seed', type=int, default=0, help='зерно генератора')
+    args = parser.parse_args()
+
+    errors = self_test(args.games, args.plies, args.seed)
+    for error in errors[:20]:
+        print(error)
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import random
+
+# Ключи Зобриста: случайные 64-битные числа для каждой фигуры на каждой клетке,
+# очереди хода, прав на рокировку и вертикали взятия на проходе.
+# Генератор инициализируется константой, поэтому ключи одинаковы во всех процессах
+# и между запусками (хэши можно хранить в файлах)
+
+zobrist_seed = 20240611
+
+piece_symbols = ('P', 'N', 'B', 'R', 'Q', 'K')
+
+# Права на рокировку в том же порядке битов, что и в bitboard.py
+castling_names = ('white_king_side', 'white_queen_side', 'black_king_side', 'black_queen_side')
+
+
+def _generate_keys() -> tuple:
+    """Сгенерировать все таблицы ключей"""
+    rng = random.Random(zobrist_seed)
+    pieces = {}
+    for color in (0, 1):
+        for symbol in piece_symbols:
+            pieces[(color, symbol)] = [rng.getrandbits(64) for _ in range(64)]
+    side = rng.getrandbits(64)
+    castling = [rng.getrandbits(64) for _ in range(4)]
+    en_passant = [rng.getrandbits(64) for _ in range(8)]
+    return pieces, side, castling, en_passant
+
+
+piece_keys, side_key, castling_keys, en_passant_keys = _generate_keys()
+
+
+def piece_key(piece, x: int, y: int) -> int:
+    """Ключ фигуры на клетке (x, y)"""
+    return piece_keys[(piece.color, piece.symbol)][y * 8 + x]
+
+
+def castling_key(castling_rights: dict) -> int:
+    """Ключ для набора прав на рокировку"""
+    key = 0
+    for index, name in enumerate(castling_names):
+        if castling_rights[name]:
+            key ^= castling_keys[index]
+    return key
+
+
+def en_passant_key(en_passant: tuple) -> int:
+    """Ключ вертикали взятия на проходе (0, если взятия на проходе нет)"""
+    if en_passant is None:
+        return 0
+    return en_passant_keys[en_passant[0]]
+
+
+def hash_board(board: list, current_player: int, castling_rights: dict, en_passant: tuple) -> int:
+    """
+    Вычислить ключ позиции с нуля
+
+    Args:
+        board: шахматная доска
+        current_player: цвет стороны, которая ходит
+        castling_rights: права на рокировку
+        en_passant: координаты для взятия на проходе
+
+    Returns:
+        int: 64-битный ключ позиции
+    """
+    key = 0
+    for y, row in enumerate(board):
+        for x, piece in enumerate(row):
+            if piece is not None:
+                key ^= piece_key(piece, x, y)
+    if current_player == 1:
+        key ^= side_key
+    return key ^ castling_key(castling_rights) ^ en_passant_key(en_passant)